@@ -0,0 +1,154 @@
+"""
+Measures recall@k and single-query search latency of Milvus vector indexes
+against exact ground truth on synthetic corpora of normalised embeddings.
+
+    python -m app.benchmarks.annRecall --chunks 10000 100000 --k 10
+    python -m app.benchmarks.annRecall --chunks 1000000 --index HNSW IVF_FLAT --metric COSINE --ef 32 64 128 --nprobe 8 16 64
+
+Needs a running Milvus (MILVUS_DB_HOST/MILVUS_DB_PORT). Each corpus is written to
+a scratch collection that is dropped afterwards. Embeddings are unit length, so
+L2, IP and COSINE rank neighbours identically and the ground truth is an exact
+dot-product scan done with NumPy.
+"""
+import argparse
+import time
+
+import numpy as np
+from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
+
+from app.services.milvusIndex import IndexConfig, INDEX_TYPES
+from app.utils.environmentVariables import MILVUS_DB_HOST, MILVUS_DB_PORT
+
+COLLECTION_NAME = "ann_benchmark"
+INSERT_BATCH = 20000
+BLOCK = 100000
+
+
+def synthetic_corpus(count: int, dim: int, clusters: int = 256, seed: int = 7) -> np.ndarray:
+    """Clustered unit vectors; resume chunks are far from uniformly distributed."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    corpus = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, BLOCK):
+        end = min(start + BLOCK, count)
+        block = centers[rng.integers(0, clusters, end - start)] + 0.6 * rng.standard_normal((end - start, dim), dtype=np.float32)
+        corpus[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return corpus
+
+
+def synthetic_queries(corpus: np.ndarray, count: int, seed: int = 11) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    queries = corpus[rng.integers(0, len(corpus), count)] + 0.05 * rng.standard_normal((count, corpus.shape[1]), dtype=np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(corpus), BLOCK):
+        scores = queries @ corpus[start:start + BLOCK].T
+        ids = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-best_scores, min(k, best_scores.shape[1] - 1), axis=1)[:, :k]
+        best_scores = np.take_along_axis(best_scores, top, axis=1)
+        best_ids = np.take_along_axis(best_ids, top, axis=1)
+    return best_ids
+
+
+def recall_at_k(found: list[list[int]], truth: np.ndarray) -> float:
+    hits = sum(len(set(ids) & set(expected.tolist())) for ids, expected in zip(found, truth))
+    return hits / truth.size
+
+
+def create_collection(corpus: np.ndarray) -> Collection:
+    if utility.has_collection(COLLECTION_NAME):
+        utility.drop_collection(COLLECTION_NAME)
+    schema = CollectionSchema([
+        FieldSchema("id", DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema("vector", DataType.FLOAT_VECTOR, dim=corpus.shape[1]),
+    ])
+    collection = Collection(COLLECTION_NAME, schema)
+    for start in range(0, len(corpus), INSERT_BATCH):
+        block = corpus[start:start + INSERT_BATCH]
+        collection.insert([list(range(start, start + len(block))), block])
+    collection.flush()
+    return collection
+
+
+def build_index(collection: Collection, config: IndexConfig) -> float:
+    collection.release()
+    if collection.has_index():
+        collection.drop_index()
+    start = time.perf_counter()
+    collection.create_index(field_name="vector", index_params=config.index_params())
+    utility.wait_for_index_building_complete(COLLECTION_NAME)
+    collection.load()
+    return time.perf_counter() - start
+
+
+def measure(collection: Collection, config: IndexConfig, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies, found = [], []
+    param = config.search_params(k)
+    for query in queries:
+        start = time.perf_counter()
+        hits = collection.search(data=[query.tolist()], anns_field="vector", param=param, limit=k)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append([hit.id for hit in hits])
+    return {
+        "recall": round(recall_at_k(found, truth), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "qps": round(len(queries) / (sum(latencies) / 1000), 1),
+    }
+
+
+def sweep(index_type: str, metric_type: str, args) -> list[IndexConfig]:
+    """One config per query-time setting; configs of the same index share a build."""
+    if index_type == "HNSW":
+        params = {"M": args.m, "efConstruction": args.ef_construction}
+        return [IndexConfig(index_type, metric_type, params, {"ef": ef}) for ef in args.ef]
+    if index_type.startswith("IVF"):
+        params = {"nlist": args.nlist}
+        return [IndexConfig(index_type, metric_type, params, {"nprobe": nprobe}) for nprobe in args.nprobe]
+    return [IndexConfig(index_type, metric_type)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index", nargs="+", default=["FLAT", "HNSW", "IVF_FLAT"], choices=list(INDEX_TYPES))
+    parser.add_argument("--metric", default="L2", choices=["L2", "IP", "COSINE"])
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 64, 128])
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 64])
+    args = parser.parse_args()
+
+    connections.connect(host=MILVUS_DB_HOST, port=MILVUS_DB_PORT)
+    print(f"{'chunks':>8} {'index':>9} {'search':>14} {'build_s':>8} {'recall':>7} {'p50_ms':>7} {'p99_ms':>7} {'qps':>8}")
+    for count in args.chunks:
+        corpus = synthetic_corpus(count, args.dim)
+        queries = synthetic_queries(corpus, args.queries)
+        truth = exact_top_k(corpus, queries, args.k)
+        collection = create_collection(corpus)
+        try:
+            for index_type in args.index:
+                build_seconds = None
+                for config in sweep(index_type, args.metric, args):
+                    if build_seconds is None:
+                        build_seconds = build_index(collection, config)
+                    result = measure(collection, config, queries, truth, args.k)
+                    search = ",".join(f"{key}={value}" for key, value in config.search.items()) or "-"
+                    print(f"{count:>8} {index_type:>9} {search:>14} {build_seconds:>8.1f} {result['recall']:>7} "
+                          f"{result['p50_ms']:>7} {result['p99_ms']:>7} {result['qps']:>8}")
+        finally:
+            utility.drop_collection(COLLECTION_NAME)
+
+
+if __name__ == "__main__":
+    main()
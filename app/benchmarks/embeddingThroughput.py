@@ -0,0 +1,61 @@
+"""
+Compares per-chunk embedding with the batched EmbeddingEngine.
+
+    python -m app.benchmarks.embeddingThroughput --chunks 500 --latency-ms 20
+    python -m app.benchmarks.embeddingThroughput --backend ollama --model nomic-embed-text:v1.5
+"""
+import argparse
+import random
+import time
+
+from app.utils.embeddingEngine import EmbeddingEngine, LocalEmbedder, OllamaEmbedder
+
+WORDS = ["python", "java", "aws", "kubernetes", "docker", "sql", "spark", "react", "django",
+         "fastapi", "terraform", "linux", "pandas", "airflow", "kafka", "leadership", "agile"]
+
+def synthetic_chunks(count: int, words_per_chunk: int = 150, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=words_per_chunk)) for _ in range(count)]
+
+def run(embedder, chunks: list[str], batch_size: int, max_workers: int) -> dict:
+    start = time.perf_counter()
+    for chunk in chunks:
+        embedder.embed([chunk])
+    serial = time.perf_counter() - start
+
+    engine = EmbeddingEngine(embedder, batch_size=batch_size, max_workers=max_workers)
+    start = time.perf_counter()
+    engine.embed_documents(chunks)
+    batched = time.perf_counter() - start
+    engine.shutdown()
+
+    return {
+        "chunks": len(chunks),
+        "serial_s": round(serial, 3),
+        "batched_s": round(batched, 3),
+        "serial_chunks_per_s": round(len(chunks) / serial, 1),
+        "batched_chunks_per_s": round(len(chunks) / batched, 1),
+        "speedup": round(serial / batched, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["local", "ollama"], default="local")
+    parser.add_argument("--model", default="nomic-embed-text:v1.5")
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="simulated round-trip for the local backend")
+    args = parser.parse_args()
+
+    if args.backend == "local":
+        embedder = LocalEmbedder(latency_ms=args.latency_ms)
+    else:
+        embedder = OllamaEmbedder(model=args.model)
+
+    result = run(embedder, synthetic_chunks(args.chunks), args.batch_size, args.workers)
+    for key, value in result.items():
+        print(f"{key:>22}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+In-process stand-ins for Milvus and Gemini used by the offline benchmarks.
+Embeddings come from the deterministic LocalEmbedder in app.utils.embeddingEngine.
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+EXPR_PATTERN = re.compile(r"^\s*(\w+)\s*(==|>=|!=|in)\s*(.+?)\s*$")
+
+
+def parse_expr(expr: str):
+    """Predicate for the boolean expressions the app sends: ==, >=, != and `in [...]` on one field."""
+    if not expr:
+        return lambda row: True
+    match = EXPR_PATTERN.match(expr)
+    if match is None:
+        raise ValueError(f"Unsupported filter expression: {expr}")
+    field, operator, value = match.groups()
+    if operator == "in":
+        values = set(json.loads(value))
+        return lambda row: row.get(field) in values
+    value = json.loads(value.replace("'", '"'))
+    if operator == "==":
+        return lambda row: row.get(field) == value
+    if operator == ">=":
+        return lambda row: row.get(field) >= value
+    return lambda row: row.get(field) != value
+
+
+class InMemoryCollection:
+    """
+    Implements the subset of pymilvus.Collection used by milvusDBConnection:
+    insert (rows or columns), upsert, delete, query, query_iterator and search.
+    Searches are exact (brute force) with the metric of the collection's index config.
+    """
+    def __init__(self, fields: list[str], primary_key: str = "pk", auto_id: bool = True, metric_type: str = "L2"):
+        schema_fields = [SimpleNamespace(name=primary_key, is_primary=True, auto_id=auto_id, dtype=None)]
+        schema_fields += [SimpleNamespace(name=name, is_primary=False, auto_id=False, dtype=None) for name in fields if name != primary_key]
+        self.schema = SimpleNamespace(fields=schema_fields, primary_field=schema_fields[0])
+        self.primary_key = primary_key
+        self.auto_id = auto_id
+        self.metric_type = metric_type
+        self.rows = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._matrix = None
+
+    def insert(self, data):
+        if data and not isinstance(data[0], dict):
+            names = [field.name for field in self.schema.fields if not (field.is_primary and field.auto_id)]
+            data = [dict(zip(names, values)) for values in zip(*data)]
+        keys = []
+        with self._lock:
+            for row in data:
+                row = dict(row)
+                if self.auto_id:
+                    row[self.primary_key] = self._next_id
+                    self._next_id += 1
+                self.rows[row[self.primary_key]] = row
+                keys.append(row[self.primary_key])
+            self._matrix = None
+        return SimpleNamespace(insert_count=len(keys), primary_keys=keys)
+
+    def upsert(self, data):
+        with self._lock:
+            for row in data:
+                self.rows[row[self.primary_key]] = dict(row)
+            self._matrix = None
+        return SimpleNamespace(upsert_count=len(data))
+
+    def delete(self, expr: str):
+        predicate = parse_expr(expr)
+        with self._lock:
+            keys = [key for key, row in self.rows.items() if predicate(row)]
+            for key in keys:
+                del self.rows[key]
+            self._matrix = None
+        return SimpleNamespace(delete_count=len(keys))
+
+    def query(self, expr: str, output_fields: list[str]):
+        predicate = parse_expr(expr)
+        with self._lock:
+            return [{field: row[field] for field in output_fields} for row in self.rows.values() if predicate(row)]
+
+    def query_iterator(self, batch_size: int, expr: str, output_fields: list[str]):
+        rows = iter(self.query(expr, output_fields))
+        return SimpleNamespace(next=lambda: [row for _, row in zip(range(batch_size), rows)], close=lambda: None)
+
+    def _snapshot(self):
+        with self._lock:
+            if self._matrix is None:
+                rows = list(self.rows.values())
+                vectors = np.asarray([row["vector"] for row in rows], dtype=np.float32).reshape(len(rows), -1)
+                self._matrix = (rows, vectors)
+            return self._matrix
+
+    def search(self, data, anns_field: str, param: dict, limit: int, expr: str = None, output_fields=()):
+        rows, vectors = self._snapshot()
+        if expr:
+            predicate = parse_expr(expr)
+            mask = np.fromiter((predicate(row) for row in rows), dtype=bool, count=len(rows))
+        else:
+            mask = np.ones(len(rows), dtype=bool)
+        results = []
+        for query in np.asarray(data, dtype=np.float32):
+            if not len(rows):
+                results.append([])
+                continue
+            if self.metric_type == "L2":
+                scores = ((vectors - query) ** 2).sum(axis=1)
+            else:
+                scores = -(vectors @ query)
+            scores = np.where(mask, scores, np.inf)
+            top = np.argsort(scores)[:limit]
+            top = top[np.isfinite(scores[top])]
+            distance_sign = 1 if self.metric_type == "L2" else -1
+            results.append([
+                SimpleNamespace(id=rows[i][self.primary_key], distance=float(scores[i]) * distance_sign,
+                                entity=SimpleNamespace(get=rows[i].get))
+                for i in top
+            ])
+        return results
+
+
+class InMemoryVectorStore:
+    """Stands in for langchain_milvus.Milvus in the RAG graph, reading the same InMemoryCollection."""
+    def __init__(self, collection: InMemoryCollection, embed_query):
+        self.collection = collection
+        self.embed_query = embed_query
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, expr: str = None, **kwargs):
+        hits = self.collection.search([embedding], "vector", {}, k, expr=expr)[0]
+        return [
+            (Document(page_content=hit.entity.get("text"), metadata={"candidate_id": hit.entity.get("candidate_id"), "pk": hit.id}), hit.distance)
+            for hit in hits
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, expr: str = None, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embed_query(query), k, expr)
+
+    async def asimilarity_search_with_score_by_vector(self, embedding, k: int = 4, expr: str = None, **kwargs):
+        return self.similarity_search_with_score_by_vector(embedding, k, expr)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, expr: str = None, **kwargs):
+        return self.similarity_search_with_score(query, k, expr)
+
+
+class CannedChatModel(BaseChatModel):
+    """
+    Answers with a JSON array scoring every candidate_id found in the prompt,
+    after `latency_ms`, so the RAG endpoints parse and validate a realistic reply.
+    With `malformed` the reply is wrapped in a markdown fence and cut off mid-object,
+    the way Gemini occasionally answers, to exercise the local repair.
+    """
+    latency_ms: float = 0.0
+    malformed: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "canned"
+
+    def _answer(self, messages) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        candidate_ids = list(dict.fromkeys(int(value) for value in re.findall(r"candidate_id: (\d+)", prompt)))
+        content = json.dumps([
+            {"candidate_id": candidate_id, "score": max(90 - 10 * rank, 10), "reason": "Matches the query."}
+            for rank, candidate_id in enumerate(candidate_ids)
+        ])
+        if self.malformed:
+            content = f"```json\n{content[:-20]}"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self._answer(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self._answer(messages)
@@ -0,0 +1,297 @@
+"""
+Drives the real FastAPI endpoints in-process, with local stand-ins for Ollama
+(LocalEmbedder), Milvus (InMemoryCollection) and Gemini (CannedChatModel), and
+reports req/s, p50/p99 latency and peak traced memory per endpoint.
+
+    python -m app.benchmarks.serviceThroughput --requests 200 --concurrency 8
+    python -m app.benchmarks.serviceThroughput --synthetic-candidates 5000 --embed-latency-ms 20 --llm-latency-ms 400
+    python -m app.benchmarks.serviceThroughput --synthetic-candidates 20000 --rag-scope 300 --vector-tier
+    python -m app.benchmarks.serviceThroughput --json baseline.json
+    python -m app.benchmarks.serviceThroughput --baseline baseline.json --tolerance 0.2
+
+Uploads cycle through the PDFs in "Sample Resume/"; --synthetic-candidates
+seeds Postgres, the vector store and the keyword index with generated resumes
+so RAG queries search a realistic corpus. Everything is written to a scratch
+directory (SQLite unless --database-url is given). With --baseline the exit
+status is 1 if any endpoint regressed by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.benchmarks.embeddingThroughput import synthetic_chunks
+from app.benchmarks.fakes import InMemoryCollection, InMemoryVectorStore, CannedChatModel
+
+SAMPLE_RESUME_DIR = os.path.abspath("Sample Resume")
+ENDPOINTS = ["create_candidate", "update_job_order", "rag_query"]
+SEED_BATCH = 500
+
+
+def configure_environment(workdir: str, database_url: str = None, vector_tier: bool = False):
+    """Must run before anything under app.* reads its settings at import time."""
+    os.environ.update({
+        "POSTGRES_DB_URL": database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.sqlite3')}",
+        "EMBEDDING_BACKEND": "local",
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite3"),
+        "INGESTION_QUEUE_PATH": os.path.join(workdir, "ingestion_queue.sqlite3"),
+        "KEYWORD_INDEX_PATH": os.path.join(workdir, "keyword_index.sqlite3"),
+        "VECTOR_TIER_ENABLED": "true" if vector_tier else "false",
+        "VECTOR_TIER_PATH": os.path.join(workdir, "vector_tier"),
+        # every query is unique, a semantic hit would skip retrieval and generation
+        "RAG_CACHE_MAX_DISTANCE": "0",
+    })
+    for key, value in {"MILVUS_DB_HOST": "in-memory", "MILVUS_DB_PORT": "0", "EMBEDDING_MODEL": "local-hash",
+                       "DB_NAME": "benchmark", "GOOGLE_API_KEY": "unused"}.items():
+        os.environ.setdefault(key, value)
+    os.makedirs(os.path.join(workdir, "app", "uploads"), exist_ok=True)
+    os.chdir(workdir)
+
+
+def install_fakes(embed_latency_ms: float, llm_latency_ms: float, llm_malformed: bool = False):
+    import app.services.milvusDBConnection as milvus
+    import app.utils.vectorEmbedding as vectorEmbedding
+    from app.services.milvusIndex import get_index_config
+    from app.services.ragRegistry import rag_registry
+    from app.utils.embeddingEngine import EmbeddingEngine, LocalEmbedder
+
+    vectorEmbedding._engine = EmbeddingEngine(LocalEmbedder(latency_ms=embed_latency_ms))
+    candidates = InMemoryCollection(["candidate_id", "text", "vector"], metric_type=get_index_config("candidates").metric_type)
+    job_orders = InMemoryCollection(["text", "vector"], primary_key="id", auto_id=False, metric_type=get_index_config("job_orders").metric_type)
+    milvus._collections.update({"candidates": candidates, "job_orders": job_orders})
+    milvus._connected = True
+
+    rag_registry._embedding_model = vectorEmbedding.get_embedding_engine()
+    rag_registry._llm = CannedChatModel(latency_ms=llm_latency_ms, malformed=llm_malformed)
+    rag_registry._vector_stores["candidates"] = InMemoryVectorStore(candidates, vectorEmbedding.get_embedding)
+
+
+def seed_candidates(count: int, chunks_per_candidate: int):
+    from app.models.postgresModel import Candidate
+    from app.schemas.candidateSchema import CandidateCreateSchema, CandidateMilvus
+    from app.services.keywordIndex import keyword_index
+    from app.services.milvusDBConnection import bulk_insert_to_milvus
+    from app.services.postgresDBConnection import sessionLocal
+    from app.services.postgresServices import GenericDBService
+    from app.utils.vectorEmbedding import get_embeddings
+
+    for start in range(0, count, SEED_BATCH):
+        size = min(SEED_BATCH, count - start)
+        texts = synthetic_chunks(size * chunks_per_candidate, words_per_chunk=120, seed=start)
+        db = sessionLocal()
+        try:
+            services = GenericDBService(db, Candidate)
+            candidate_ids = services.bulk_create([CandidateCreateSchema(name=f"Synthetic {start + i}") for i in range(size)])
+            services.commit()
+        finally:
+            db.close()
+        records = [
+            CandidateMilvus(candidate_id=candidate_ids[i // chunks_per_candidate], text=text, vector=vector)
+            for i, (text, vector) in enumerate(zip(texts, get_embeddings(texts)))
+        ]
+        bulk_insert_to_milvus(records, "candidates")
+        for i, candidate_id in enumerate(candidate_ids):
+            keyword_index.replace_candidate(candidate_id, texts[i * chunks_per_candidate:(i + 1) * chunks_per_candidate])
+
+
+def request_factories(client, args, job_order_ids: list[int], resumes: list[tuple[str, bytes]], ingestion_job_ids: list[str]) -> dict:
+    queries = synthetic_chunks(1000, words_per_chunk=8, seed=99)
+
+    async def create_candidate(i: int):
+        file_name, content = resumes[i % len(resumes)]
+        response = await client.post("/candidates/", data={"name": f"Benchmark {i}"}, files={"file": (file_name, content, "application/pdf")})
+        if response.status_code < 400:
+            ingestion_job_ids.append(response.json()["job_id"])
+        return response
+
+    def update_job_order(i: int):
+        body = {"client_name": f"Client {i % 10}", "job_title": "Engineer",
+                "job_description": f"Revision {i}. " + queries[i % len(queries)]}
+        return client.put(f"/job-orders/{job_order_ids[i % len(job_order_ids)]}", json=body)
+
+    rng = np.random.default_rng(5)
+
+    def rag_query(i: int):
+        # each endpoint pass (timed, then traced) gets fresh queries so nothing is answered from the cache
+        params = {"query": f"{queries[i % len(queries)]} #{i}", "mode": args.rag_mode}
+        if args.rag_scope:
+            params["candidate_ids"] = (rng.choice(args.synthetic_candidates, args.rag_scope, replace=False) + 1).tolist()
+        return client.post("/rag/query", params=params)
+
+    return {"create_candidate": create_candidate, "update_job_order": update_job_order, "rag_query": rag_query}
+
+
+async def run_requests(send, indexes: range, concurrency: int) -> tuple[list[float], float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await send(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.request.method} {response.request.url.path} returned {response.status_code}: {response.text[:200]}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in indexes))
+    return latencies, time.perf_counter() - start
+
+
+async def wait_for_ingestion(job_ids: list[str], timeout: float = 600.0) -> tuple[float, int]:
+    """Seconds until every queued resume is indexed or failed, and how many did not complete."""
+    from app.services.ingestionQueue import COMPLETED, FAILED
+    from app.services.ingestionWorker import ingestion_queue
+
+    start = time.perf_counter()
+    pending = set(job_ids)
+    failed = 0
+    while pending and time.perf_counter() - start < timeout:
+        for job_id in list(pending):
+            job = ingestion_queue.get(job_id)
+            if job["status"] in (COMPLETED, FAILED):
+                pending.discard(job_id)
+                failed += job["status"] == FAILED
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - start, failed + len(pending)
+
+
+async def benchmark(args) -> dict:
+    import httpx
+    from app.main import app
+    from app.services.postgresDBConnection import create_table
+
+    create_table()
+    install_fakes(args.embed_latency_ms, args.llm_latency_ms, args.llm_malformed)
+    if args.synthetic_candidates:
+        started = time.perf_counter()
+        seed_candidates(args.synthetic_candidates, args.chunks_per_candidate)
+        print(f"seeded {args.synthetic_candidates} candidates in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    if args.vector_tier:
+        from app.services.vectorTier import get_vector_tier, load_from_milvus
+        load_from_milvus(get_vector_tier())
+
+    resumes = []
+    for file_name in sorted(os.listdir(args.resumes)):
+        if file_name.lower().endswith(".pdf"):
+            with open(os.path.join(args.resumes, file_name), "rb") as f:
+                resumes.append((file_name, f.read()))
+    if not resumes:
+        raise SystemExit(f"No PDFs found in {args.resumes}")
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            job_order_ids = []
+            for i in range(args.job_orders):
+                body = {"client_name": f"Client {i % 10}", "job_title": "Engineer", "job_description": " ".join(synthetic_chunks(1, 60, seed=i))}
+                response = await client.post("/job-orders/", json=body)
+                job_order_ids.append(response.json()["id"])
+
+            ingestion_job_ids = []
+            factories = request_factories(client, args, job_order_ids, resumes, ingestion_job_ids)
+            for name in args.endpoints:
+                send = factories[name]
+                await run_requests(send, range(args.requests, args.requests + args.warmup), args.concurrency)
+                ingestion_job_ids.clear()
+                latencies, elapsed = await run_requests(send, range(args.requests), args.concurrency)
+                result = {
+                    "requests": len(latencies),
+                    "rps": round(len(latencies) / elapsed, 1),
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                    "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                }
+                if name == "create_candidate":
+                    # uploads return 202, the resumes are parsed and indexed by the ingestion workers
+                    drain_seconds, failed = await wait_for_ingestion(ingestion_job_ids)
+                    result["ingested_per_s"] = round(len(ingestion_job_ids) / (elapsed + drain_seconds), 1)
+                    result["ingest_failed"] = failed
+                if args.memory_requests:
+                    tracemalloc.start()
+                    tracemalloc.reset_peak()
+                    offset = args.requests * 3
+                    await run_requests(send, range(offset, offset + args.memory_requests), args.concurrency)
+                    result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+                    tracemalloc.stop()
+                results[name] = result
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("rps", "ingested_per_s"):
+            if key in result and key in base and result[key] < base[key] * (1 - tolerance):
+                regressions.append(f"{name}: {key} {result[key]} vs baseline {base[key]}")
+        for key in ("p50_ms", "p99_ms", "peak_mb"):
+            if key in result and key in base and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {result[key]} vs baseline {base[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--memory-requests", type=int, default=50, help="requests traced for peak memory, 0 to skip")
+    parser.add_argument("--resumes", default=SAMPLE_RESUME_DIR)
+    parser.add_argument("--synthetic-candidates", type=int, default=0)
+    parser.add_argument("--chunks-per-candidate", type=int, default=4)
+    parser.add_argument("--job-orders", type=int, default=20)
+    parser.add_argument("--rag-mode", choices=["vector", "keyword", "hybrid"], default="vector")
+    parser.add_argument("--rag-scope", type=int, default=0, help="restrict each RAG query to this many random synthetic candidates")
+    parser.add_argument("--vector-tier", action="store_true", help="load the local vector tier, which then answers scoped searches")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated Ollama round-trip")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated Gemini round-trip")
+    parser.add_argument("--llm-malformed", action="store_true", help="fence and truncate every LLM reply, as Gemini sometimes does")
+    parser.add_argument("--database-url", help="defaults to a scratch SQLite file")
+    parser.add_argument("--json", help="write the results here, e.g. to use as a baseline")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    if args.rag_scope > args.synthetic_candidates:
+        parser.error("--rag-scope needs at least as many --synthetic-candidates")
+    args.resumes = os.path.abspath(args.resumes)
+    output = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    with tempfile.TemporaryDirectory(prefix="service-benchmark-") as workdir:
+        cwd = os.getcwd()
+        configure_environment(workdir, args.database_url, args.vector_tier)
+        try:
+            results = asyncio.run(benchmark(args))
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'endpoint':>18} {'requests':>8} {'rps':>8} {'p50_ms':>8} {'p99_ms':>8} {'peak_mb':>8}")
+    for name, result in results.items():
+        print(f"{name:>18} {result['requests']:>8} {result['rps']:>8} {result['p50_ms']:>8} {result['p99_ms']:>8} {result.get('peak_mb', '-'):>8}")
+        if "ingested_per_s" in result:
+            print(f"{'':>18} ingestion {result['ingested_per_s']} resumes/s, {result['ingest_failed']} failed")
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,154 @@
 from app.services.postgresServices import GenericDBService, JobApplicationService
 import app.schemas.jobOrderSchema as jobOrderSchema
-from app.schemas.candidateSchema import CandidateSchema, CandidateCreateSchema, CandidateMilvus
+from app.schemas.candidateSchema import CandidateSchema, CandidateCreateSchema
 from app.schemas.jobApplicationSchema import JobApplicationSchema, JobApplicationCreateSchema, JobApplicationDetailedSchema
-from app.schemas.ragResponse import RAGResponseList
-from app.services.milvusDBConnection import insert_to_milvus, delete_from_milvus, update_in_milvus
-from app.utils.vectorEmbedding import get_embedding, get_pdf_embedding
-from app.services.postgresDBConnection import get_db, as_dict
-from app.utils.exceptions import EnvVarNotFoundError, MilvusDocNotFoundError, PostgressNoRowFound, MilvusCollectionNotFoundError, MilvusTransactionFailure, FileUploadError
+from app.schemas.ragResponse import RAGResponse, RAGResponseList
+from app.utils.jsonStream import JSONArrayStreamParser
+from app.schemas.ingestionJobSchema import IngestionJobSchema, CandidateIngestionSchema
+from app.schemas.bulkImportSchema import BulkImportSchema
+from app.schemas.matchSchema import CandidateMatchSchema, MatchScoreRequest, MatchScoreResult
+from app.services.matchingService import MatchingService
+from app.services.bulkImport import run_bulk_import, queue_bulk_import, resume_bulk_imports, shutdown_event, extract_zip, checkpoint_path_for, resolve_inside, ImportCheckpoint, BULK_IMPORT_DIR
+from app.services.milvusDBConnection import connect_milvus, milvus_server_version
+from app.services.ingestionWorker import ingestion_queue, ingestion_workers, resume_path
+from app.services.vectorOutbox import VectorOutboxService, outbox_relay
+from app.utils.vectorEmbedding import aget_embedding, get_pdf_executor, shutdown_embedding
+from app.services.postgresDBConnection import get_db, get_async_db, dispose_engines, ping_postgres, as_dict, sessionLocal
+from app.services.pagination import iter_ndjson
+from app.utils.exceptions import EnvVarNotFoundError, MilvusDocNotFoundError, PostgressNoRowFound, MilvusCollectionNotFoundError, MilvusTransactionFailure, FileUploadError, FileTooLargeError, InvalidCursorError
+from app.utils.fileUpload import save_upload
+from app.utils.metrics import render_metrics, start_request_timing, server_timing_header, REQUEST_LATENCY
+from app.utils.environmentVariables import MAX_UPLOAD_BYTES, BULK_IMPORT_ROOT, BULK_IMPORT_MAX_BYTES, BULK_IMPORT_MAX_EXTRACTED_BYTES, FEATURE_ENV_VARIABLES, RERANK_CANDIDATES, RERANK_TOP_N, missing_env_variables
 from app.models.postgresModel import JobOrder, Candidate, JobApplication
-from app.services.ragGraph import build_rag_graph
+from app.services.ragRegistry import rag_registry
+from app.services.ragCache import rag_cache, cache_scope
 
-from fastapi import FastAPI, Depends, HTTPException, Request, status, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status, File, UploadFile, Form, BackgroundTasks, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 import json
+import shutil
+import logging
+import time
+import asyncio
+import uuid
 import re
-from typing import Optional
-from langchain.chat_models import init_chat_model
-from langchain_ollama import OllamaEmbeddings
+from typing import Optional, Literal
+from contextlib import asynccontextmanager
+
+RAG_PROMPT_TEMPLATE = """
+You are a backend API with RAG capabilities. Always respond with only a valid raw JSON array—no markdown, no explanations, and no escape characters.
+
+Instructions:
+- Do NOT wrap the response in triple backticks.
+- Do NOT explain anything.
+- Only output a JSON array of objects.
+- Each object must have the keys: "candidate_id" and "reason".
+- If you don't have enough information to answer, return an empty JSON array: []
+
+Context: {context}
+Question: {question}
+"""
+
+RERANK_PROMPT_TEMPLATE = """
+You are a backend API ranking job candidates for a search.
+For every candidate in the context, score how well they match the question from 0 (not relevant) to 100 (perfect match)
+and give a one sentence reason. Return an object {{"data": [...]}} with one entry per candidate,
+each with the keys "candidate_id", "score" and "reason".
+
+Context: {context}
+Question: {question}
+"""
+# up to two chunks are kept per candidate
+RERANK_CHUNKS = 2 * RERANK_CANDIDATES
+# rag_registry.get_graph() arguments of each endpoint; they are part of its cache scope
+GENERATE_PIPELINE = ("candidates", 5, RAG_PROMPT_TEMPLATE)
+RERANK_PIPELINE = ("candidates", RERANK_CHUNKS, RERANK_PROMPT_TEMPLATE, RERANK_TOP_N)
+
+logger = logging.getLogger(__name__)
+
+async def warm_up():
+    """
+    Connects to Milvus and builds the default RAG graph in the background, so a
+    slow or unavailable Milvus/Ollama never delays startup or the CRUD endpoints.
+    """
+    for feature in ("milvus", "embedding", "rag"):
+        missing = missing_env_variables(feature)
+        if missing:
+            logger.warning("Skipping warm-up, %s is not configured (%s missing)", feature, ", ".join(missing))
+            return
+    try:
+        await asyncio.to_thread(connect_milvus)
+        await asyncio.to_thread(rag_registry.get_graph, *GENERATE_PIPELINE)
+        await asyncio.to_thread(rag_registry.get_graph, *RERANK_PIPELINE)
+    except Exception:
+        logger.exception("Warm-up failed, Milvus and RAG will be retried on first use")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = asyncio.create_task(warm_up())
+    ingestion_workers.start()
+    outbox_relay.start()
+    bulk_import_task = asyncio.create_task(asyncio.to_thread(resume_bulk_imports, get_pdf_executor()))
+    yield
+    warm_up_task.cancel()
+    # unfinished imports stop after their current batch and are resumed on the next start
+    shutdown_event.set()
+    await asyncio.gather(bulk_import_task, return_exceptions=True)
+    await outbox_relay.stop()
+    await ingestion_workers.stop()
+    rag_registry.close()
+    shutdown_embedding()
+    await dispose_engines()
 
 # uvicorn app.main:app --reload
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Records request latency per route. Sending `X-Request-Timing: 1` returns the
+    per-stage breakdown of the request in a Server-Timing header.
+    """
+    timings = start_request_timing() if request.headers.get("X-Request-Timing") == "1" else None
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_LATENCY.labels(request.method, getattr(route, "path", "unmatched"), str(response.status_code)).observe(time.perf_counter() - start)
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+MAX_PAGE_SIZE = 1000
+ListFormat = Literal["json", "ndjson"]
+
+def list_response(services: GenericDBService, response: Response, limit: int, cursor: Optional[str], sort: str, order: str, format: str):
+    """
+    One keyset page, with the next page's cursor in the X-Next-Cursor header, or
+    with format=ndjson a streamed export of every row (limit and cursor are ignored).
+    """
+    if format == "ndjson":
+        return StreamingResponse(iter_ndjson(sessionLocal, services.list_statement()), media_type="application/x-ndjson")
+    rows, next_cursor = services.get_page(limit, cursor, sort, descending=order == "desc")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 @app.get("/job-orders/", response_model=list[jobOrderSchema.JobOrder], tags=["Job Orders"])
-def get_all_job_orders(db: Session = Depends(get_db)):
+def get_all_job_orders(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["id", "client_name", "job_title"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    format: ListFormat = "json",
+    db: Session = Depends(get_db)
+):
     jobOrderServices = GenericDBService(db, JobOrder)
-    data = jobOrderServices.get_all()
-    return data
+    return list_response(jobOrderServices, response, limit, cursor, sort, order, format)
 
 @app.get("/job-orders/{job_order_id}", response_model=jobOrderSchema.JobOrder, tags=["Job Orders"])
 def get_job_order_by_id(job_order_id: int, db: Session = Depends(get_db)):
@@ -35,18 +156,17 @@ def get_job_order_by_id(job_order_id: int, db: Session = Depends(get_db)):
     job_order = jobOrderServices.get_by_id(job_order_id)
     return job_order
 
+# the Milvus side of job order and candidate writes is applied by the outbox relay after the commit
 @app.put("/job-orders/{job_order_id}", response_model=jobOrderSchema.JobOrder, tags=["Job Orders"])
 def update_job_order(job_order_id: int, job_order: jobOrderSchema.JobOrderCreate, db: Session = Depends(get_db)):
     jobOrderServices = GenericDBService(db, JobOrder)
     db_updated_job_order = jobOrderServices.update(job_order_id, job_order)
     if db_updated_job_order is None:
         raise HTTPException(status_code=404, detail="Job order not found")  
-    
-    vector = get_embedding(job_order.job_description)
-    job_order_milvus = jobOrderSchema.JobOrderMilvus(id=job_order_id, vector=vector, text=job_order.job_description)
-    update_in_milvus(job_order_milvus, "job_orders")
 
+    VectorOutboxService(db).add("job_orders", [job_order_id], "upsert")
     jobOrderServices.commit()
+    outbox_relay.notify()
     jobOrderServices.refresh(db_updated_job_order)
 
     return db_updated_job_order
@@ -61,13 +181,9 @@ def create_job_order(job_order: jobOrderSchema.JobOrderCreate, db: Session = Dep
         raise HTTPException(status_code=400, detail="Error creating job order")
     
     db_job_order = as_dict(db_job_order)
-    created_id = db_job_order['id']
-    vector = get_embedding(job_order.job_description)
-    job_order_milvus = jobOrderSchema.JobOrderMilvus(id=created_id, vector=vector, text=job_order.job_description)
-    
-    insert_to_milvus(job_order_milvus, "job_orders")
-    
+    VectorOutboxService(db).add("job_orders", [db_job_order['id']], "upsert")
     jobOrderServices.commit()
+    outbox_relay.notify()
 
     return db_job_order
 
@@ -75,105 +191,119 @@ def create_job_order(job_order: jobOrderSchema.JobOrderCreate, db: Session = Dep
 def delete_job_order(job_order_id: int, db: Session = Depends(get_db)):
     jobOrderServices = GenericDBService(db, JobOrder)
     db_deleted_job_order = jobOrderServices.delete(job_order_id)
-    delete_from_milvus(job_order_id, "job_orders")
+    VectorOutboxService(db).add("job_orders", [job_order_id], "delete")
     jobOrderServices.commit()
+    outbox_relay.notify()
     return db_deleted_job_order
 
 
-@app.post("/candidates/", response_model=CandidateSchema, tags=["Candidates"])
+@app.get("/job-orders/{job_order_id}/matches", response_model=list[CandidateMatchSchema], tags=["Job Orders"])
+def get_job_order_matches(
+    job_order_id: int,
+    k: int = Query(10, ge=1, le=1000),
+    pooling: Literal["max", "mean"] = "max",
+    top_n: int = Query(3, ge=1),
+    db: Session = Depends(get_db)
+):
+    matching_services = MatchingService(db)
+    return matching_services.match_job_order(job_order_id, k=k, pooling=pooling, top_n=top_n)
+
+@app.post("/job-orders/matches/score", response_model=MatchScoreResult, tags=["Job Orders"])
+def score_job_applications(request: MatchScoreRequest, db: Session = Depends(get_db)):
+    matching_services = MatchingService(db)
+    result = matching_services.score_applications(request.job_order_ids, pooling=request.pooling, top_n=request.top_n)
+    matching_services.commit()
+    return result
+
+@app.post("/candidates/", response_model=CandidateIngestionSchema, status_code=status.HTTP_202_ACCEPTED, tags=["Candidates"])
 async def create_candidate(
     candidate: CandidateCreateSchema = Depends(CandidateCreateSchema._as_form), 
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
     ):
-    try:
-        candidate_services = GenericDBService(db, Candidate)
-        db_candidate = candidate_services.create(candidate)
-        db_candidate = as_dict(db_candidate)
-
-        file_content = await file.read()
-        if not file_content:
-            raise FileUploadError(name="FileUploadError", message="File is empty or not provided")
-
-        #save file to disk use __dirname__ to get the current directory
-        
-        file_path = f"app/uploads/{db_candidate['id']}.pdf"
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+    #stream the upload to disk before touching the database, so a pooled
+    #connection is only held for the INSERT and COMMIT, not the whole upload
+    upload_path = f"app/uploads/{uuid.uuid4().hex}.upload"
+    await save_upload(file, upload_path, max_bytes=MAX_UPLOAD_BYTES)
 
-        #get embedding from pdf
-        embeddings, chunks = get_pdf_embedding(file_path)
-
-        # remove for loop and try
-        for embedding, chunk in zip(embeddings, chunks):
-            candidate_milvus = CandidateMilvus(candidate_id=db_candidate['id'], text=chunk.page_content, vector=embedding)
-            insert_to_milvus(candidate_milvus, "candidates")
+    file_path = None
+    try:
+        db_candidate = await db.run_sync(lambda session: as_dict(GenericDBService(session, Candidate).create(candidate)))
+        await db.commit()
 
-        candidate_services.commit()
+        file_path = resume_path(db_candidate['id'])
+        os.replace(upload_path, file_path)
 
     except Exception as e:
         #remove the file if any error occurs
-        db.rollback()
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        await db.rollback()
+        for path in (upload_path, file_path):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
         raise e
-        
+
+    # parsing, embedding and indexing happen in the ingestion workers
+    job = await asyncio.to_thread(ingestion_queue.enqueue, db_candidate['id'], file_path)
+    ingestion_workers.notify()
+
     return JSONResponse(
-        status_code=status.HTTP_201_CREATED,
-        content=db_candidate)
+        status_code=status.HTTP_202_ACCEPTED,
+        content={**db_candidate, "job_id": job["id"], "job_status": job["status"]})
     
 @app.put("/candidates/{candidate_id}", response_model=CandidateSchema, tags=["Candidates"])
 async def update_candidate(
     candidate_id: int,
     candidate: Optional[CandidateCreateSchema] = Depends(CandidateCreateSchema._as_form_optional), 
     file: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)   
+    db: AsyncSession = Depends(get_async_db)
 ):
     if candidate is None and file is None:
         raise HTTPException(status_code=422, detail="Unprocessable Entity: At least one field must be provided for update")
     
+    job = None
     if file is not None:
-        file_content = await file.read()
-        if not file_content:
-            raise FileUploadError(name="FileUploadError", message="File is empty or not provided")
-        
-        # replace the existing file if it exists
-        file_path = f"app/uploads/{candidate_id}.pdf"
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        else:
+        if not os.path.exists(resume_path(candidate_id)):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Candidate {candidate_id} does not exist"
             )
-        
-        with open(file_path, "wb") as f:
-            f.write(file_content)
-        
-        delete_from_milvus(candidate_id, "candidates", id_col="candidate_id")
-        #get embedding from pdf
-        embeddings, chunks = get_pdf_embedding(file_path)
-
-        # remove for loop and try
-        for embedding in embeddings:
-            candidate_milvus = CandidateMilvus(candidate_id=candidate_id, text=chunks, vector=embedding)
-            insert_to_milvus(candidate_milvus, "candidates")
+
+        # the job indexes its own copy and makes it the current resume once done,
+        # so a running job never reads a file that is being overwritten
+        job_id = uuid.uuid4().hex
+        file_path = resume_path(candidate_id, job_id)
+        await save_upload(file, file_path, max_bytes=MAX_UPLOAD_BYTES)
+
+        job = await asyncio.to_thread(ingestion_queue.enqueue, candidate_id, file_path, job_id)
+        ingestion_workers.notify()
 
     if candidate is not None:
-        candidate_services = GenericDBService(db, Candidate)
-        candidate_services.update(candidate_id, candidate)
-        candidate_services.commit()
+        await db.run_sync(lambda session: GenericDBService(session, Candidate).update(candidate_id, candidate))
+        await db.commit()
+        await asyncio.to_thread(rag_cache.invalidate)
     
+    if job is not None:
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"message": "Candidate updated successfully, resume is being re-indexed", "job_id": job["id"]}
+        )
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={"message": "Candidate updated successfully"}
     )
     
 @app.get("/candidates/", response_model=list[CandidateSchema], tags=["Candidates"])
-def get_all_candidates(db: Session = Depends(get_db)):
+def get_all_candidates(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["id", "name"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    format: ListFormat = "json",
+    db: Session = Depends(get_db)
+):
     candidate_services = GenericDBService(db, Candidate)
-    candidates = candidate_services.get_all()
-    return candidates
+    return list_response(candidate_services, response, limit, cursor, sort, order, format)
 
 @app.get("/candidates/{candidate_id}", response_model=CandidateSchema, tags=["Candidates"])
 def get_candidate_by_id(candidate_id: int, db: Session = Depends(get_db)):
@@ -185,16 +315,77 @@ def get_candidate_by_id(candidate_id: int, db: Session = Depends(get_db)):
 def delete_candidate(candidate_id: int, db: Session = Depends(get_db)):
     candidate_services = GenericDBService(db, Candidate)
     db_deleted_candidate = candidate_services.delete(candidate_id)
-    delete_from_milvus(candidate_id, "candidates", id_col="candidate_id")
-    os.remove(f"app/uploads/{candidate_id}.pdf")
+    # vectors, keyword index entries and the resume file are removed by the relay once the delete is committed
+    VectorOutboxService(db).add("candidates", [candidate_id], "delete")
     candidate_services.commit()
+    outbox_relay.notify()
     return db_deleted_candidate
 
+@app.post("/candidates/bulk-import", response_model=BulkImportSchema, status_code=status.HTTP_202_ACCEPTED, tags=["Candidates"])
+async def bulk_import_candidates(
+    background_tasks: BackgroundTasks,
+    file: Optional[UploadFile] = File(None),
+    directory: Optional[str] = Form(None),
+):
+    if (file is None) == (directory is None):
+        raise HTTPException(status_code=422, detail="Provide either a zip file or a directory")
+
+    import_id = uuid.uuid4().hex
+    if file is not None:
+        zip_path = os.path.join(BULK_IMPORT_DIR, f"{import_id}.zip")
+        os.makedirs(BULK_IMPORT_DIR, exist_ok=True)
+        await save_upload(file, zip_path, max_bytes=BULK_IMPORT_MAX_BYTES)
+        source_dir = os.path.join(BULK_IMPORT_DIR, import_id)
+        try:
+            await asyncio.to_thread(extract_zip, zip_path, source_dir, BULK_IMPORT_MAX_EXTRACTED_BYTES)
+        except Exception as e:
+            shutil.rmtree(source_dir, ignore_errors=True)
+            if isinstance(e, FileUploadError):
+                raise
+            raise FileUploadError(name="FileUploadError", message=f"Invalid zip archive: {e}")
+        finally:
+            os.remove(zip_path)
+    else:
+        # directories are resolved under BULK_IMPORT_ROOT and may not leave it
+        if not BULK_IMPORT_ROOT:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Directory imports are disabled, set BULK_IMPORT_ROOT")
+        source_dir = resolve_inside(BULK_IMPORT_ROOT, directory)
+        if not os.path.isdir(source_dir):
+            raise HTTPException(status_code=404, detail=f"Directory {directory} does not exist")
+
+    queue_bulk_import(import_id, source_dir, extracted=file is not None)
+    background_tasks.add_task(run_bulk_import, import_id, source_dir, get_pdf_executor())
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"import_id": import_id, "status": "queued"}
+    )
+
+@app.get("/candidates/bulk-import/{import_id}", response_model=BulkImportSchema, tags=["Candidates"])
+def get_bulk_import(import_id: str):
+    checkpoint_path = checkpoint_path_for(import_id)
+    if not os.path.exists(checkpoint_path):
+        raise HTTPException(status_code=404, detail="Bulk import not found")
+    return {"import_id": import_id, **ImportCheckpoint(checkpoint_path).summary()}
+
+@app.get("/ingestion-jobs/{job_id}", response_model=IngestionJobSchema, tags=["Candidates"])
+def get_ingestion_job(job_id: str):
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
 @app.get("/job-applications/", response_model=list[JobApplicationDetailedSchema], tags=["Job Applications"])
-def get_all_job_applications(db: Session = Depends(get_db)):
+def get_all_job_applications(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["job_order_id", "candidate_score"] = "job_order_id",
+    order: Literal["asc", "desc"] = "asc",
+    format: ListFormat = "json",
+    db: Session = Depends(get_db)
+):
     job_application_services = JobApplicationService(db)
-    job_applications = job_application_services.get_all()
-    return job_applications
+    return list_response(job_application_services, response, limit, cursor, sort, order, format)
 
 @app.post("/job-applications/", response_model=JobApplicationSchema, tags=["Job Applications"])
 def create_job_application(
@@ -214,46 +405,155 @@ def delete_job_application(job_application: JobApplicationCreateSchema, db: Sess
     return db_deleted_job_application
 
 import ast
-@app.post("/rag/query", response_model=RAGResponseList, tags=["RAG"])
-def rag_query(query: str):
-    embedding = OllamaEmbeddings(model="nomic-embed-text:v1.5")
-    llm = init_chat_model("gemini-2.0-flash", model_provider="google_genai")
-    prompt_template = """
-You are a backend API with RAG capabilities. Always respond with only a valid raw JSON array—no markdown, no explanations, and no escape characters.
-
-Instructions:
-- Do NOT wrap the response in triple backticks.
-- Do NOT explain anything.
-- Only output a JSON array of objects.
-- Each object must have the keys: "candidate_id" and "reason".
-- If you don't have enough information to answer, return an empty JSON array: []
-
-Context: {context}
-Question: {question}
-"""
+RetrievalMode = Literal["vector", "keyword", "hybrid"]
+
+async def lookup_rag_cache(query: str, mode: str, scope: str) -> tuple:
+    """Returns (answer or None, cache level, query vector). Keyword mode never embeds the query."""
+    answer = rag_cache.get_exact(query, scope=scope)
+    if answer is not None:
+        return answer, "exact", None
+    if mode == "keyword":
+        return None, "miss", None
+    query_vector = await aget_embedding(query)
+    answer = rag_cache.get_semantic(query_vector, scope=scope)
+    return answer, "miss" if answer is None else "semantic", query_vector
+
+async def resolve_rag_candidates(db: AsyncSession, job_order_id: Optional[int], client_name: Optional[str], candidate_ids: Optional[list[int]]):
+    """Candidate ids the search is restricted to, or None to search every candidate."""
+    return await db.run_sync(
+        lambda session: JobApplicationService(session).get_candidate_ids(job_order_id, client_name, candidate_ids)
+    )
 
+@app.post("/rag/query", response_model=RAGResponseList, tags=["RAG"])
+async def rag_query(
+    query: str,
+    mode: RetrievalMode = "vector",
+    job_order_id: Optional[int] = None,
+    client_name: Optional[str] = None,
+    candidate_ids: Optional[list[int]] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    candidate_ids = await resolve_rag_candidates(db, job_order_id, client_name, candidate_ids)
+    if candidate_ids == []:
+        return JSONResponse(status_code=status.HTTP_200_OK, content={"data": []})
+
+    scope = cache_scope(mode, candidate_ids, RERANK_PIPELINE)
+    await asyncio.to_thread(rag_cache.refresh)
+    generation = rag_cache.generation
+    answer, cache_level, query_vector = await lookup_rag_cache(query, mode, scope)
+    if answer is not None:
+        return JSONResponse(status_code=status.HTTP_200_OK, content={"data": answer}, headers={"X-Cache": cache_level})
+
+    graph = await rag_registry.aget_graph(*RERANK_PIPELINE)
+
+    response = await graph.ainvoke({"question": query, "query_vector": query_vector, "mode": mode, "candidate_ids": candidate_ids})
+    answer, stats = response["answer"], response["context_stats"]
+    # a partly re-ranked answer is not cached, the next identical query gets another chance
+    if not stats["fallback_batches"]:
+        rag_cache.put(query, query_vector, answer, generation, scope=scope)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"data": answer},
+        headers={"X-Cache": "miss", "X-Prompt-Tokens": str(stats["prompt_tokens"]), "X-Rerank-Fallback": str(stats["fallback_batches"])}
+        )
 
-    graph = build_rag_graph(db_name="ResumeMatcher",
-                            collection_name="candidates",
-                            embedding_model=embedding,
-                            llm=llm,
-                            prompt_template=prompt_template,
-                            k=5
-                            )
-    
-    response = graph.invoke({"question": query})
-    answer = response["answer"]
+def sse_event(data, event: str) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/rag/query/stream", tags=["RAG"], response_class=StreamingResponse)
+async def rag_query_stream(
+    query: str,
+    mode: RetrievalMode = "vector",
+    job_order_id: Optional[int] = None,
+    client_name: Optional[str] = None,
+    candidate_ids: Optional[list[int]] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Streams each {candidate_id, reason} object as a server-sent `result` event
+    as soon as the LLM has finished generating it, followed by a `done` event.
+    """
+    candidate_ids = await resolve_rag_candidates(db, job_order_id, client_name, candidate_ids)
+    scope = cache_scope(mode, candidate_ids, GENERATE_PIPELINE)
+
+    async def events():
+        try:
+            if candidate_ids == []:
+                yield sse_event({"count": 0}, "done")
+                return
+            await asyncio.to_thread(rag_cache.refresh)
+            generation = rag_cache.generation
+            answer, _, query_vector = await lookup_rag_cache(query, mode, scope)
+            if answer is not None:
+                for item in answer:
+                    yield sse_event(item, "result")
+                yield sse_event({"count": len(answer)}, "done")
+                return
+
+            graph = await rag_registry.aget_graph(*GENERATE_PIPELINE)
+            parser = JSONArrayStreamParser()
+            results, valid = [], True
+            async for message, metadata in graph.astream({"question": query, "query_vector": query_vector, "mode": mode, "candidate_ids": candidate_ids}, stream_mode="messages"):
+                if metadata.get("langgraph_node") != "generate" or not isinstance(message.content, str):
+                    continue
+                for obj in parser.feed(message.content):
+                    try:
+                        item = RAGResponse.model_validate(obj).model_dump()
+                    except ValidationError as e:
+                        valid = False
+                        yield sse_event({"detail": f"Invalid response format from llm: {e}"}, "error")
+                        continue
+                    results.append(item)
+                    yield sse_event(item, "result")
+
+            if not parser.finished:
+                yield sse_event({"detail": "Invalid response format from llm: incomplete JSON array"}, "error")
+                return
+            if valid:
+                rag_cache.put(query, query_vector, results, generation, scope=scope)
+            yield sse_event({"count": len(results)}, "done")
+        except Exception as e:
+            yield sse_event({"detail": f"UnExpected Error | {str(e)}"}, "error")
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/health", tags=["Health"])
+def health():
+    return {"status": "ok"}
+
+@app.get("/ready", tags=["Health"])
+async def ready():
+    """
+    Postgres must be reachable for the app to be ready; Milvus, embedding and
+    RAG are reported per feature so a degraded dependency is visible without
+    taking the CRUD endpoints out of rotation.
+    """
+    checks = {}
     try:
-        answer = json.loads(answer)
+        await asyncio.to_thread(ping_postgres)
+        checks["postgres"] = "ok"
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Invalid response format from llm: {str(e)}"
-        )
+        checks["postgres"] = f"error: {e}"
+
+    for feature in FEATURE_ENV_VARIABLES:
+        missing = missing_env_variables(feature)
+        checks[feature] = f"not configured: {', '.join(missing)}" if missing else "ok"
+    if checks["milvus"] == "ok":
+        try:
+            await asyncio.wait_for(asyncio.to_thread(milvus_server_version), timeout=3)
+        except Exception as e:
+            checks["milvus"] = f"error: {e!r}"
+
+    ready = checks["postgres"] == "ok"
     return JSONResponse(
-        status_code=status.HTTP_200_OK,
-        content={"data": answer}
-        )
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not ready", "checks": checks}
+    )
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 def create_exception_handler(status_code: int, initial_detail: str):
     async def exception_handler(request: Request, exc: Exception):
@@ -292,6 +592,21 @@ app.add_exception_handler(
     handler=create_exception_handler(status.HTTP_500_INTERNAL_SERVER_ERROR, "DB Transaction Failed")
 )
 
+app.add_exception_handler(
+    exc_class_or_status_code=InvalidCursorError,
+    handler=create_exception_handler(status.HTTP_400_BAD_REQUEST, "Invalid pagination cursor")
+)
+
+app.add_exception_handler(
+    exc_class_or_status_code=FileUploadError,
+    handler=create_exception_handler(status.HTTP_400_BAD_REQUEST, "Invalid File Upload")
+)
+
+app.add_exception_handler(
+    exc_class_or_status_code=FileTooLargeError,
+    handler=create_exception_handler(status.HTTP_413_CONTENT_TOO_LARGE, "File Too Large")
+)
+
 ## ollama connection error 
 app.add_exception_handler(
     exc_class_or_status_code=ConnectionError,
@@ -1,5 +1,14 @@
 from app.services.postgresDBConnection import Base
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, Index, func, literal_column
+
+
+def sort_key(column, null_value: str):
+    """
+    Keyset sort key of a nullable column: NULLs sort as `null_value` (an SQL
+    literal) instead of dropping out of the keyset comparison. The literal is
+    inlined so the expression matches the index built on it below.
+    """
+    return func.coalesce(column, literal_column(null_value))
 
 class JobOrder(Base):
     __tablename__ = 'job_orders'
@@ -7,14 +16,52 @@ class JobOrder(Base):
     client_name = Column(String, index=True)
     job_title = Column(String, index=True)
     job_description = Column(String)
+    # bumped by every UPDATE, so the outbox relay can tell that a row changed while it embedded it
+    version = Column(Integer, nullable=False, default=0, server_default='0', onupdate=literal_column('version + 1'))
 
 class Candidate(Base):
     __tablename__ = 'candidates'
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
+    # bumped by every write of the candidate's chunks, see CandidateIndexService
+    index_version = Column(Integer, nullable=False, default=0, server_default='0')
 
 class JobApplication(Base):
     __tablename__ = 'job_applications'
     job_order_id = Column(Integer, ForeignKey('job_orders.id'), index=True, primary_key=True)
     candidate_id = Column(Integer, ForeignKey('candidates.id'),index=True, primary_key=True)
-    candidate_score = Column(Integer, index=True)
\ No newline at end of file
+    candidate_score = Column(Integer, index=True)
+
+class VectorOutbox(Base):
+    __tablename__ = 'vector_outbox'
+    __table_args__ = (Index('ix_vector_outbox_status_id', 'status', 'id'),)
+    id = Column(Integer, primary_key=True)
+    collection = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    operation = Column(String, nullable=False)
+    status = Column(String, nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    # epoch seconds before which a failed entry is not retried
+    available_at = Column(Float, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class BulkImportItem(Base):
+    """Resumes a bulk import has committed, written in the same transaction as their candidates."""
+    __tablename__ = 'bulk_import_items'
+    import_id = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    candidate_id = Column(Integer, nullable=False)
+
+class CacheGeneration(Base):
+    """Invalidation counter of a process-local cache, shared by every worker and node."""
+    __tablename__ = 'cache_generations'
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+# one per sortable column of the list endpoints, matching the sort keys of postgresServices
+Index('ix_job_orders_client_name_sort', sort_key(JobOrder.client_name, "''"), JobOrder.id)
+Index('ix_job_orders_job_title_sort', sort_key(JobOrder.job_title, "''"), JobOrder.id)
+Index('ix_candidates_name_sort', sort_key(Candidate.name, "''"), Candidate.id)
+Index('ix_job_applications_candidate_score_sort', sort_key(JobApplication.candidate_score, "-1"),
+      JobApplication.job_order_id, JobApplication.candidate_id)
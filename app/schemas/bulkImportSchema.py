@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+class BulkImportSchema(BaseModel):
+    import_id: str
+    status: str
+    total: int = 0
+    imported: int = 0
+    failed: int = 0
+    chunks: int = 0
+    elapsed_seconds: float = 0.0
+    docs_per_sec: float = 0.0
@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Optional
+from app.schemas.candidateSchema import CandidateSchema
+
+class IngestionJobSchema(BaseModel):
+    id: str
+    candidate_id: int
+    status: str
+    attempts: int
+    error: Optional[str] = None
+    chunk_count: Optional[int] = None
+    created_at: float
+    updated_at: float
+
+class CandidateIngestionSchema(CandidateSchema):
+    job_id: str
+    job_status: str
@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
+
+class CandidateMatchSchema(BaseModel):
+    candidate_id: int
+    candidate_name: Optional[str] = None
+    score: float
+    matched_chunks: int
+
+class MatchScoreRequest(BaseModel):
+    job_order_ids: Optional[list[int]] = None
+    pooling: Literal["max", "mean"] = "max"
+    top_n: int = Field(default=3, ge=1)
+
+class MatchScoreResult(BaseModel):
+    job_orders: int
+    updated: int
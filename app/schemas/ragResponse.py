@@ -1,11 +1,23 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, Field
 
 class RAGResponse(BaseModel):
     candidate_id: int
     reason: str
+    score: Optional[float] = None
 
 class RAGResponseList(BaseModel):
     data: list[RAGResponse]
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class RAGRerankItem(BaseModel):
+    """One candidate as scored by the LLM re-ranker."""
+    candidate_id: int
+    score: float = Field(ge=0, le=100, description="Relevance to the question, 0 (none) to 100 (perfect match)")
+    reason: str = Field(description="One sentence explaining the score")
+
+class RAGRerankBatch(BaseModel):
+    data: list[RAGRerankItem]
@@ -0,0 +1,360 @@
+"""
+Bulk resume import.
+
+    python -m app.services.bulkImport "Sample Resume/" --batch-size 64 --workers 4
+
+A source is a directory of PDFs, optionally with a manifest.csv (columns
+`name,file`) naming each candidate. Progress is checkpointed after every
+batch, and the imported resumes are recorded in Postgres in the same
+transaction as their candidates, so re-running the same command after a crash
+skips exactly the resumes that were already imported. Imports started through
+the API that did not finish are resumed when the app starts.
+"""
+import argparse
+import csv
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, Executor
+
+from sqlalchemy import insert, select
+
+from app.models.postgresModel import Candidate, BulkImportItem
+from app.schemas.candidateSchema import CandidateCreateSchema, CandidateMilvus
+from app.services.milvusDBConnection import bulk_insert_to_milvus, delete_many_from_milvus, mirror_index_versions
+from app.services.postgresDBConnection import sessionLocal
+from app.services.postgresServices import GenericDBService, CandidateIndexService
+from app.services.ragCache import rag_cache
+from app.services.keywordIndex import keyword_index
+from app.utils.exceptions import FileUploadError
+from app.utils.vectorEmbedding import get_embeddings, load_pdf_chunks
+
+logger = logging.getLogger(__name__)
+
+BULK_IMPORT_DIR = "app/data/bulk_imports"
+UPLOAD_DIR = "app/uploads"
+UNFINISHED = ("queued", "running", "interrupted")
+
+# set on shutdown; running imports stop after their current batch and are resumed on the next start
+shutdown_event = threading.Event()
+
+
+def resolve_inside(root: str, path: str) -> str:
+    """Real path of `path` (relative to `root`); absolute paths, `..` and symlinks may not leave `root`."""
+    real_root = os.path.realpath(root)
+    real_path = os.path.realpath(os.path.join(real_root, path))
+    if os.path.commonpath([real_root, real_path]) != real_root:
+        raise FileUploadError(name="FileUploadError", message=f"{path} is outside {root}")
+    return real_path
+
+
+def discover_resumes(source_dir: str) -> list[dict]:
+    manifest_path = os.path.join(source_dir, "manifest.csv")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, newline="", encoding="utf-8") as f:
+            return [
+                {"key": row["file"], "path": resolve_inside(source_dir, row["file"]), "name": row["name"]}
+                for row in csv.DictReader(f)
+            ]
+
+    entries = []
+    for root, _, files in os.walk(source_dir):
+        for file_name in files:
+            if file_name.lower().endswith(".pdf"):
+                path = os.path.join(root, file_name)
+                name = os.path.splitext(file_name)[0].replace("_", " ")
+                key = os.path.relpath(path, source_dir)
+                entries.append({"key": key, "path": resolve_inside(source_dir, key), "name": name})
+    return sorted(entries, key=lambda entry: entry["key"])
+
+
+def extract_zip(zip_path: str, target_dir: str, max_bytes: int = None) -> str:
+    with zipfile.ZipFile(zip_path) as archive:
+        if max_bytes is not None and sum(info.file_size for info in archive.infolist()) > max_bytes:
+            raise FileUploadError(name="FileUploadError", message=f"Archive expands to more than {max_bytes} bytes")
+        archive.extractall(target_dir)
+    return target_dir
+
+
+class ImportCheckpoint:
+    """JSON progress file, rewritten atomically after every batch."""
+    def __init__(self, path: str):
+        self.path = path
+        self.state = {"status": "running", "total": 0, "done": {}, "failed": {}, "chunks": 0, "elapsed_seconds": 0.0}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state.update(json.load(f))
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+    def summary(self) -> dict:
+        elapsed = self.state["elapsed_seconds"]
+        imported = len(self.state["done"])
+        return {
+            "status": self.state["status"],
+            "total": self.state["total"],
+            "imported": imported,
+            "failed": len(self.state["failed"]),
+            "chunks": self.state["chunks"],
+            "elapsed_seconds": round(elapsed, 3),
+            "docs_per_sec": round(imported / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+class BulkImporter:
+    """
+    Imports resumes in batches: PDFs are parsed on a process pool (the next batch
+    is parsed while the current one is embedded), chunks from every document in
+    the batch are embedded together, candidates are inserted with one multi-row
+    INSERT and vectors with one bulk Milvus write.
+    """
+    def __init__(self, checkpoint: ImportCheckpoint, executor: Executor, batch_size: int = 64,
+                 session_factory=sessionLocal, upload_dir: str = UPLOAD_DIR, progress=None, stop_event: threading.Event = None):
+        self.checkpoint = checkpoint
+        self.executor = executor
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self.upload_dir = upload_dir
+        self.progress = progress
+        self.stop_event = stop_event
+        self.import_id = checkpoint.state.setdefault("import_id", uuid.uuid4().hex)
+
+    def _committed_keys(self) -> dict:
+        db = self.session_factory()
+        try:
+            rows = db.execute(select(BulkImportItem.key, BulkImportItem.candidate_id).where(BulkImportItem.import_id == self.import_id))
+            return dict(rows.all())
+        finally:
+            db.close()
+
+    def _submit(self, batch: list[dict]) -> list:
+        return [self.executor.submit(load_pdf_chunks, entry["path"]) for entry in batch]
+
+    def _import_batch(self, parsed: list[tuple]) -> int:
+        db = self.session_factory()
+        copied, candidate_ids = [], []
+        try:
+            candidate_services = GenericDBService(db, Candidate)
+            candidate_ids = candidate_services.bulk_create([CandidateCreateSchema(name=entry["name"]) for entry, _ in parsed])
+
+            vectors = iter(get_embeddings([chunk.page_content for _, chunks in parsed for chunk in chunks]))
+            records = []
+            for candidate_id, (entry, chunks) in zip(candidate_ids, parsed):
+                records.extend(
+                    CandidateMilvus(candidate_id=candidate_id, text=chunk.page_content, vector=next(vectors))
+                    for chunk in chunks
+                )
+                file_path = os.path.join(self.upload_dir, f"{candidate_id}.pdf")
+                shutil.copyfile(entry["path"], file_path)
+                copied.append(file_path)
+
+            # committed with the candidates, so a crash before the checkpoint is saved cannot import them twice
+            db.execute(insert(BulkImportItem), [
+                {"import_id": self.import_id, "key": entry["key"], "candidate_id": candidate_id}
+                for candidate_id, (entry, _) in zip(candidate_ids, parsed)
+            ])
+            bulk_insert_to_milvus(records, "candidates")
+            versions = CandidateIndexService(db).bump(candidate_ids)
+            try:
+                candidate_services.commit()
+            except Exception:
+                delete_many_from_milvus(candidate_ids, "candidates", id_col="candidate_id")
+                raise
+        except Exception:
+            db.rollback()
+            for file_path in copied:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            raise
+        finally:
+            db.close()
+
+        mirror_index_versions(versions)
+        for candidate_id, (entry, chunks) in zip(candidate_ids, parsed):
+            keyword_index.replace_candidate(candidate_id, [chunk.page_content for chunk in chunks])
+            self.checkpoint.state["done"][entry["key"]] = candidate_id
+        return len(records)
+
+    def _stopping(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def run(self, entries: list[dict]) -> dict:
+        state = self.checkpoint.state
+        state["status"] = "running"
+        state["total"] = len(entries)
+        state["done"].update(self._committed_keys())
+        # persists the import_id before anything is committed under it
+        self.checkpoint.save()
+        pending = [entry for entry in entries if entry["key"] not in state["done"]]
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+
+        next_futures = self._submit(batches[0]) if batches else []
+        try:
+            for index, batch in enumerate(batches):
+                if self._stopping():
+                    state["status"] = "interrupted"
+                    self.checkpoint.save()
+                    return self.checkpoint.summary()
+                started = time.perf_counter()
+                futures = next_futures
+                if index + 1 < len(batches):
+                    next_futures = self._submit(batches[index + 1])
+
+                parsed = []
+                for entry, future in zip(batch, futures):
+                    try:
+                        chunks = future.result()
+                        if not chunks:
+                            raise ValueError("No text could be extracted from the PDF")
+                    except Exception as e:
+                        state["failed"][entry["key"]] = str(e)
+                        continue
+                    state["failed"].pop(entry["key"], None)
+                    parsed.append((entry, chunks))
+
+                if parsed:
+                    state["chunks"] += self._import_batch(parsed)
+                    rag_cache.invalidate()
+                state["elapsed_seconds"] += time.perf_counter() - started
+                self.checkpoint.save()
+                if self.progress is not None:
+                    self.progress(self.checkpoint.summary())
+        except Exception as e:
+            if self._stopping():
+                # e.g. the PDF pool was shut down under the batch, which is rolled back and redone on resume
+                logger.warning("Bulk import %s interrupted: %s", self.import_id, e)
+                state["status"] = "interrupted"
+                self.checkpoint.save()
+                return self.checkpoint.summary()
+            state["status"] = "failed"
+            state["error"] = str(e)
+            self.checkpoint.save()
+            raise
+
+        state["status"] = "completed"
+        self.checkpoint.save()
+        return self.checkpoint.summary()
+
+
+def checkpoint_path_for(import_id: str) -> str:
+    return os.path.join(BULK_IMPORT_DIR, f"{import_id}.json")
+
+
+def lock_import(import_id: str):
+    """
+    File descriptor holding an exclusive lock on the import, or None when another
+    process holds it. The lock is released when the process exits, however it exits.
+    """
+    os.makedirs(BULK_IMPORT_DIR, exist_ok=True)
+    fd = os.open(os.path.join(BULK_IMPORT_DIR, f"{import_id}.lock"), os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def queue_bulk_import(import_id: str, source_dir: str, extracted: bool) -> ImportCheckpoint:
+    """Saves a queued checkpoint; `extracted` marks source_dir as an unpacked upload, removed once the import ends."""
+    checkpoint = ImportCheckpoint(checkpoint_path_for(import_id))
+    checkpoint.state.update({"status": "queued", "import_id": import_id, "source": source_dir, "extracted": extracted})
+    checkpoint.save()
+    return checkpoint
+
+
+def run_bulk_import(import_id: str, source_dir: str, executor: Executor, batch_size: int = 64) -> dict:
+    """Returns the summary, or None when another process is already running the import."""
+    lock = lock_import(import_id)
+    if lock is None:
+        return None
+    checkpoint = ImportCheckpoint(checkpoint_path_for(import_id))
+    checkpoint.state["source"] = source_dir
+    checkpoint.state["import_id"] = import_id
+    try:
+        try:
+            entries = discover_resumes(source_dir)
+        except FileUploadError as e:
+            checkpoint.state["status"] = "failed"
+            checkpoint.state["error"] = e.message
+            checkpoint.save()
+            raise
+        importer = BulkImporter(checkpoint, executor, batch_size=batch_size, stop_event=shutdown_event)
+        return importer.run(entries)
+    finally:
+        if checkpoint.state.get("extracted") and checkpoint.state["status"] not in UNFINISHED:
+            shutil.rmtree(source_dir, ignore_errors=True)
+        os.close(lock)
+
+
+def resume_bulk_imports(executor: Executor, batch_size: int = 64) -> list[str]:
+    """Runs, one after another, the imports a stopped or crashed process left unfinished; returns their ids."""
+    shutdown_event.clear()
+    if not os.path.isdir(BULK_IMPORT_DIR):
+        return []
+    resumed = []
+    for file_name in sorted(os.listdir(BULK_IMPORT_DIR)):
+        if not file_name.endswith(".json"):
+            continue
+        import_id = file_name[:-len(".json")]
+        state = ImportCheckpoint(checkpoint_path_for(import_id)).state
+        if state["status"] not in UNFINISHED or not state.get("source"):
+            continue
+        if shutdown_event.is_set():
+            break
+        logger.info("Resuming bulk import %s", import_id)
+        try:
+            if run_bulk_import(import_id, state["source"], executor, batch_size) is not None:
+                resumed.append(import_id)
+        except Exception:
+            logger.exception("Bulk import %s failed", import_id)
+    return resumed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of PDFs or a .zip archive")
+    parser.add_argument("--checkpoint", help="progress file (defaults to <source>.checkpoint.json)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    source = args.source.rstrip("/\\")
+    checkpoint_path = args.checkpoint or f"{source}.checkpoint.json"
+    extracted = zipfile.is_zipfile(source)
+    if extracted:
+        source = extract_zip(source, f"{os.path.splitext(source)[0]}_extracted")
+
+    checkpoint = ImportCheckpoint(checkpoint_path)
+    checkpoint.state["source"] = source
+
+    def report(summary: dict):
+        print(f"{summary['imported']}/{summary['total']} imported, {summary['failed']} failed, "
+              f"{summary['chunks']} chunks, {summary['docs_per_sec']} docs/sec")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        importer = BulkImporter(checkpoint, executor, batch_size=args.batch_size, progress=report)
+        summary = importer.run(discover_resumes(source))
+    if extracted:
+        # a re-run extracts the archive again
+        shutil.rmtree(source, ignore_errors=True)
+
+    print(json.dumps(summary, indent=2))
+    for key, error in checkpoint.state["failed"].items():
+        print(f"failed: {key}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class IngestionQueue:
+    """
+    Durable job queue stored in a local SQLite file.
+
+    Jobs for the same candidate are handed out one at a time and in the order
+    they were enqueued. Failed jobs are retried with exponential backoff until
+    `max_attempts` is reached. A claimed job is leased to its owner for
+    `lease_seconds` and the owner renews the lease while it works; jobs whose
+    lease ran out are handed out again, so a crashed worker never strands a job
+    and a live one never loses it to another process.
+    """
+    def __init__(self, path: str, max_attempts: int = 3, retry_backoff: float = 2.0, lease_seconds: float = 60.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                id TEXT PRIMARY KEY,
+                candidate_id INTEGER NOT NULL,
+                file_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                chunk_count INTEGER,
+                available_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_status ON ingestion_jobs (status, available_at)")
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(ingestion_jobs)")}
+        for column, definition in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE ingestion_jobs ADD COLUMN {column} {definition}")
+
+    def enqueue(self, candidate_id: int, file_path: str, job_id: str = None) -> dict:
+        now = time.time()
+        job_id = job_id or uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ingestion_jobs (id, candidate_id, file_path, status, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, candidate_id, file_path, QUEUED, now, now, now),
+            )
+        return self.get(job_id)
+
+    def claim(self, owner: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._requeue_expired(now)
+                row = self._conn.execute(
+                    "SELECT * FROM ingestion_jobs WHERE status = ? AND available_at <= ? "
+                    "AND candidate_id NOT IN (SELECT candidate_id FROM ingestion_jobs WHERE status = ?) "
+                    "AND NOT EXISTS (SELECT 1 FROM ingestion_jobs AS earlier WHERE earlier.candidate_id = ingestion_jobs.candidate_id "
+                    "AND earlier.status = ? AND earlier.created_at < ingestion_jobs.created_at) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, now, PROCESSING, QUEUED),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE ingestion_jobs SET status = ?, attempts = attempts + 1, owner = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                        (PROCESSING, owner, now + self.lease_seconds, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None if row is None else self.get(row["id"])
+
+    def renew(self, job_id: str, owner: str) -> bool:
+        """Extends the lease; False when the job is no longer leased to `owner`."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE ingestion_jobs SET lease_expires_at = ? WHERE id = ? AND owner = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, owner, PROCESSING),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, chunk_count: int, owner: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, chunk_count = ?, error = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = ?",
+                (COMPLETED, chunk_count, time.time(), job_id, owner, PROCESSING),
+            )
+
+    def fail(self, job_id: str, error: str, owner: str) -> dict:
+        job = self.get(job_id)
+        now = time.time()
+        if job["attempts"] >= self.max_attempts:
+            status, available_at = FAILED, now
+        else:
+            status, available_at = QUEUED, now + self.retry_backoff * 2 ** (job["attempts"] - 1)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingestion_jobs SET status = ?, error = ?, available_at = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = ?",
+                (status, error, available_at, now, job_id, owner, PROCESSING),
+            )
+        return self.get(job_id)
+
+    def _requeue_expired(self, now: float) -> int:
+        # the attempt was already counted by claim(), so a job that keeps killing its worker still ends up failed
+        cursor = self._conn.execute(
+            "UPDATE ingestion_jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, owner = NULL, "
+            "lease_expires_at = NULL, available_at = ?, updated_at = ? WHERE status = ? AND COALESCE(lease_expires_at, 0) < ?",
+            (self.max_attempts, FAILED, QUEUED, "Worker lease expired", now, now, PROCESSING, now),
+        )
+        return cursor.rowcount
+
+    def requeue_expired(self) -> int:
+        """Puts jobs whose worker stopped renewing the lease back on the queue."""
+        with self._lock:
+            return self._requeue_expired(time.time())
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else dict(row)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import uuid
+from collections import defaultdict
+
+from sqlalchemy import select
+
+from app.models.postgresModel import Candidate
+from app.schemas.candidateSchema import CandidateMilvus
+from app.services.ingestionQueue import IngestionQueue, FAILED
+from app.services.ragCache import rag_cache
+from app.services.keywordIndex import keyword_index
+from app.services.milvusDBConnection import abulk_insert_to_milvus, adelete_many_from_milvus, aquery_milvus, primary_key_field, mirror_index_versions
+from app.services.postgresDBConnection import sessionLocal
+from app.services.postgresServices import CandidateIndexService
+from app.utils.environmentVariables import INGESTION_QUEUE_PATH, INGESTION_WORKERS, INGESTION_MAX_ATTEMPTS, INGESTION_LEASE_SECONDS
+from app.utils.vectorEmbedding import aget_embeddings, aiter_pdf_page_chunks
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 60
+UPLOAD_DIR = "app/uploads"
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkDiff:
+    """
+    Compares the stored chunks of a candidate with a new chunking, one batch of
+    texts at a time. A chunk's identity is (candidate id, SHA-256 of its text),
+    so an unchanged chunk keeps its stored vector.
+    """
+    def __init__(self, stored: list[dict], primary_key: str):
+        self.stored_by_hash = defaultdict(list)
+        for row in stored:
+            self.stored_by_hash[chunk_hash(row["text"])].append(row[primary_key])
+
+    def new_texts(self, texts: list[str]) -> list[str]:
+        """The texts that have no stored chunk left to reuse."""
+        to_insert = []
+        for text in texts:
+            keys = self.stored_by_hash.get(chunk_hash(text))
+            if keys:
+                keys.pop()
+            else:
+                to_insert.append(text)
+        return to_insert
+
+    def stale_keys(self) -> list:
+        """Primary keys of the stored chunks no text matched."""
+        return [key for keys in self.stored_by_hash.values() for key in keys]
+
+
+def candidate_exists(candidate_id: int) -> bool:
+    db = sessionLocal()
+    try:
+        return db.execute(select(Candidate.id).where(Candidate.id == candidate_id)).first() is not None
+    finally:
+        db.close()
+
+
+def bump_index_version(candidate_id: int) -> dict[int, int]:
+    """Bumps the candidate's index version; empty when the candidate was deleted."""
+    db = sessionLocal()
+    try:
+        versions = CandidateIndexService(db).bump([candidate_id])
+        db.commit()
+        return versions
+    finally:
+        db.close()
+
+
+def resume_path(candidate_id: int, job_id: str = None) -> str:
+    """The candidate's current resume, or the upload an ingestion job re-indexes from."""
+    return os.path.join(UPLOAD_DIR, f"{candidate_id}.pdf" if job_id is None else f"{candidate_id}.{job_id}.pdf")
+
+
+def release_upload(job: dict, indexed: bool):
+    """
+    Once a job is done with its own upload, the upload replaces the candidate's
+    current resume if it was indexed and is deleted otherwise.
+    """
+    current = resume_path(job["candidate_id"])
+    if os.path.abspath(job["file_path"]) == os.path.abspath(current) or not os.path.exists(job["file_path"]):
+        return
+    if indexed:
+        os.replace(job["file_path"], current)
+    else:
+        os.remove(job["file_path"])
+
+
+async def remove_candidate_index(candidate_id: int):
+    await adelete_many_from_milvus([candidate_id], "candidates", id_col="candidate_id")
+    await asyncio.to_thread(keyword_index.delete_candidate, candidate_id)
+
+
+async def index_resume(job: dict) -> int:
+    """
+    Parses and chunks a resume a few pages at a time and brings the candidate's
+    vectors in Milvus in line with it, embedding and inserting only new chunks
+    and deleting only removed ones. New chunks are written before old ones are deleted, so
+    searches running meanwhile never find the candidate missing.
+
+    After the write the candidate's index version is bumped, which also checks
+    it again: if it was deleted while the job ran, the relay may already have
+    removed its vectors, so the job removes what it wrote itself.
+
+    A job reads its own upload (see resume_path), which a later upload for the
+    same candidate cannot overwrite while the job parses it page batch by page batch.
+    """
+    candidate_id = job["candidate_id"]
+    if not await asyncio.to_thread(candidate_exists, candidate_id):
+        logger.info("Candidate %s was deleted, skipping ingestion job %s", candidate_id, job["id"])
+        release_upload(job, indexed=False)
+        return 0
+
+    primary_key = primary_key_field("candidates")
+    stored = await aquery_milvus(f"candidate_id == {candidate_id}", "candidates", [primary_key, "text"])
+    diff = ChunkDiff(stored, primary_key)
+
+    # parse, embed and insert one batch of pages at a time; only the texts are kept for the keyword index
+    texts, inserted = [], 0
+    async for chunks in aiter_pdf_page_chunks(job["file_path"]):
+        page_texts = [chunk.page_content for chunk in chunks]
+        texts.extend(page_texts)
+        to_insert = diff.new_texts(page_texts)
+        if not to_insert:
+            continue
+        embeddings = await aget_embeddings(to_insert)
+        await abulk_insert_to_milvus([
+            CandidateMilvus(candidate_id=candidate_id, text=text, vector=embedding)
+            for embedding, text in zip(embeddings, to_insert)
+        ], "candidates")
+        inserted += len(to_insert)
+    if not texts:
+        # nothing was inserted, and deleting the stale chunks would remove every stored vector of the candidate
+        raise ValueError("No text could be extracted from the PDF")
+
+    to_delete = diff.stale_keys()
+    await adelete_many_from_milvus(to_delete, "candidates", id_col=primary_key)
+    await asyncio.to_thread(keyword_index.replace_candidate, candidate_id, texts)
+    versions = await asyncio.to_thread(bump_index_version, candidate_id)
+    if not versions:
+        await remove_candidate_index(candidate_id)
+        release_upload(job, indexed=False)
+        logger.info("Candidate %s was deleted during ingestion job %s, removed its chunks again", candidate_id, job["id"])
+        return 0
+    await asyncio.to_thread(mirror_index_versions, versions)
+    release_upload(job, indexed=True)
+    await asyncio.to_thread(rag_cache.invalidate)
+
+    logger.info("Candidate %s re-indexed: %d chunks, %d inserted, %d deleted",
+                candidate_id, len(texts), inserted, len(to_delete))
+    return len(texts)
+
+
+class IngestionWorkerPool:
+    """
+    Runs `concurrency` asyncio workers that take jobs off an IngestionQueue.
+    Jobs are claimed under this pool's owner id and their lease is renewed
+    while the handler runs.
+    """
+    def __init__(self, queue: IngestionQueue, handler=index_resume, concurrency: int = 2, poll_interval: float = 1.0):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = None
+        self._stopping = False
+        self._tasks = []
+
+    def start(self):
+        requeued = self.queue.requeue_expired()
+        if requeued:
+            logger.info("Requeued %d ingestion jobs whose worker lease expired", requeued)
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        failures = 0
+        while not self._stopping:
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.owner)
+                failures = 0
+            except Exception:
+                # e.g. the queue database is locked; the worker backs off instead of dying
+                logger.exception("Could not claim an ingestion job")
+                failures += 1
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                timeout = min(self.poll_interval * 2 ** failures, MAX_BACKOFF_SECONDS) if failures else self.poll_interval
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heartbeat = asyncio.create_task(self._renew_lease(job["id"]))
+            error = None
+            try:
+                chunk_count = await self.handler(job)
+            except Exception as e:
+                logger.exception("Ingestion job %s failed", job["id"])
+                error = e
+            finally:
+                heartbeat.cancel()
+            try:
+                if error is None:
+                    await asyncio.to_thread(self.queue.complete, job["id"], chunk_count, self.owner)
+                else:
+                    failed = await asyncio.to_thread(self.queue.fail, job["id"], str(error), self.owner)
+                    if failed is not None and failed["status"] == FAILED:
+                        release_upload(failed, indexed=False)
+            except Exception:
+                # the lease runs out and the job is handed out again
+                logger.exception("Could not record the result of ingestion job %s", job["id"])
+            # another job for the same candidate may have been waiting on this one
+            self.notify()
+
+    async def _renew_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                renewed = await asyncio.to_thread(self.queue.renew, job_id, self.owner)
+            except Exception:
+                logger.exception("Could not renew the lease on ingestion job %s", job_id)
+                continue
+            if not renewed:
+                logger.warning("Lost the lease on ingestion job %s", job_id)
+                return
+
+    async def stop(self, timeout: float = 30.0):
+        self._stopping = True
+        self.notify()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self._tasks = []
+
+
+ingestion_queue = IngestionQueue(INGESTION_QUEUE_PATH, max_attempts=INGESTION_MAX_ATTEMPTS, lease_seconds=INGESTION_LEASE_SECONDS)
+ingestion_workers = IngestionWorkerPool(ingestion_queue, concurrency=INGESTION_WORKERS)
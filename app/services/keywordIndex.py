@@ -0,0 +1,138 @@
+"""
+Local BM25 keyword index over resume chunks, backed by SQLite FTS5.
+
+Rebuild it from the chunks already stored in Milvus with:
+
+    python -m app.services.keywordIndex --rebuild
+"""
+import argparse
+import os
+import re
+import sqlite3
+import threading
+
+from app.utils.environmentVariables import KEYWORD_INDEX_PATH
+
+TOKEN_PATTERN = re.compile(r"[\w+#]+")
+
+
+class KeywordIndex:
+    """
+    Inverted index of the same chunks written to the Milvus `candidates`
+    collection. Searches are ranked with FTS5's bm25() and need no embedding.
+
+    Chunk texts live in the FTS5 table `chunk_text`; which candidate a chunk
+    belongs to is kept in `chunk_candidates` under the same rowid, with an index
+    on candidate_id, so replacing, deleting and filtering by candidate never
+    scans the full-text table.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS chunk_candidates (rowid INTEGER PRIMARY KEY, candidate_id INTEGER NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chunk_candidates_candidate_id ON chunk_candidates (candidate_id)")
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_text USING fts5("
+                "text, tokenize=\"unicode61 tokenchars '+#'\")"
+            )
+            # indexes written before chunk_candidates existed kept candidate_id in the FTS5 table
+            if self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks'").fetchone():
+                self._insert(self._conn.execute("SELECT candidate_id, text FROM chunks").fetchall())
+                self._conn.execute("DROP TABLE chunks")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _insert(self, rows):
+        """Adds (candidate_id, text) rows; runs inside the caller's transaction."""
+        for candidate_id, text in rows:
+            rowid = self._conn.execute("INSERT INTO chunk_candidates (candidate_id) VALUES (?)", (candidate_id,)).lastrowid
+            self._conn.execute("INSERT INTO chunk_text (rowid, text) VALUES (?, ?)", (rowid, text))
+
+    def _delete(self, candidate_id: int):
+        self._conn.execute(
+            "DELETE FROM chunk_text WHERE rowid IN (SELECT rowid FROM chunk_candidates WHERE candidate_id = ?)",
+            (candidate_id,),
+        )
+        self._conn.execute("DELETE FROM chunk_candidates WHERE candidate_id = ?", (candidate_id,))
+
+    def _write(self, operation, *args):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                operation(*args)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def replace_candidate(self, candidate_id: int, texts: list[str]):
+        def operation():
+            self._delete(candidate_id)
+            self._insert((candidate_id, text) for text in texts)
+        self._write(operation)
+
+    def delete_candidate(self, candidate_id: int):
+        self._write(self._delete, candidate_id)
+
+    def rebuild(self, rows):
+        """Replaces the whole index with `rows` of {"candidate_id", "text"}."""
+        def operation():
+            self._conn.execute("DELETE FROM chunk_text")
+            self._conn.execute("DELETE FROM chunk_candidates")
+            self._insert((row["candidate_id"], row["text"]) for row in rows)
+        self._write(operation)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunk_candidates").fetchone()[0]
+
+    def search(self, query: str, k: int = 20, candidate_ids: list[int] = None) -> list[dict]:
+        """
+        Returns up to k chunks as {"candidate_id", "text", "score"}, best first,
+        restricted to `candidate_ids` when given.
+        """
+        tokens = dict.fromkeys(token.lower() for token in TOKEN_PATTERN.findall(query))
+        if not tokens or candidate_ids == []:
+            return []
+        match = " OR ".join(f'"{token}"' for token in tokens)
+        sql = (
+            "SELECT chunk_candidates.candidate_id, chunk_text.text, bm25(chunk_text) AS rank FROM chunk_text "
+            "JOIN chunk_candidates ON chunk_candidates.rowid = chunk_text.rowid WHERE chunk_text MATCH ?"
+        )
+        params = [match]
+        if candidate_ids is not None:
+            sql += f" AND chunk_candidates.candidate_id IN ({', '.join('?' * len(candidate_ids))})"
+            params.extend(candidate_ids)
+        with self._lock:
+            rows = self._conn.execute(f"{sql} ORDER BY rank LIMIT ?", (*params, k)).fetchall()
+        return [{"candidate_id": candidate_id, "text": text, "score": -rank} for candidate_id, text, rank in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+keyword_index = KeywordIndex(KEYWORD_INDEX_PATH)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="reload every chunk from the Milvus candidates collection")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        from app.services.milvusDBConnection import iterate_milvus
+        keyword_index.rebuild(iterate_milvus("candidate_id >= 0", "candidates", ["candidate_id", "text"]))
+        print(f"Indexed {keyword_index.count()} chunks")
+
+
+if __name__ == "__main__":
+    main()
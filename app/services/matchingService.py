@@ -0,0 +1,107 @@
+from collections import defaultdict
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import Session
+from app.models.postgresModel import Candidate, JobApplication
+from app.services.milvusDBConnection import query_milvus, search_milvus, search_candidate_chunks
+from app.services.milvusIndex import get_index_config
+from app.utils.exceptions import MilvusDocNotFoundError
+
+# candidates have several chunks each, so searches over-fetch chunks per requested candidate
+CHUNKS_PER_CANDIDATE = 10
+
+
+def distance_to_similarity(distance: float, metric_type: str = "L2") -> float:
+    # embeddings are L2 normalised, so squared L2 distance d relates to cosine similarity as 1 - d / 2;
+    # IP and COSINE already return the similarity
+    if metric_type == "L2":
+        return 1 - distance / 2
+    return distance
+
+
+def pool_candidate_scores(hits: list[dict], pooling: str = "max", top_n: int = 3, metric_type: str = "L2") -> list[dict]:
+    """Groups chunk hits by candidate_id and pools their similarities into one score per candidate."""
+    similarities = defaultdict(list)
+    for hit in hits:
+        similarities[hit["candidate_id"]].append(distance_to_similarity(hit["distance"], metric_type))
+
+    matches = []
+    for candidate_id, scores in similarities.items():
+        scores.sort(reverse=True)
+        if pooling == "mean":
+            score = sum(scores[:top_n]) / len(scores[:top_n])
+        else:
+            score = scores[0]
+        matches.append({"candidate_id": candidate_id, "score": round(score, 4), "matched_chunks": len(scores)})
+    return sorted(matches, key=lambda match: match["score"], reverse=True)
+
+
+def to_candidate_score(similarity: float) -> int:
+    return max(0, min(100, round(similarity * 100)))
+
+
+class MatchingService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_job_order_vectors(self, job_order_ids: list[int]) -> dict[int, list[float]]:
+        if not job_order_ids:
+            return {}
+        rows = query_milvus(f"id in [{', '.join(str(int(i)) for i in job_order_ids)}]", "job_orders", ["id", "vector"])
+        return {row["id"]: row["vector"] for row in rows}
+
+    def match_job_order(self, job_order_id: int, k: int = 10, pooling: str = "max", top_n: int = 3) -> list[dict]:
+        vector = self.get_job_order_vectors([job_order_id]).get(job_order_id)
+        if vector is None:
+            raise MilvusDocNotFoundError(name="MilvusDocNotFoundError", message=f"Job order {job_order_id} has no stored vector")
+
+        hits = search_milvus([vector], "candidates", limit=k * CHUNKS_PER_CANDIDATE, output_fields=["candidate_id"])[0]
+        matches = pool_candidate_scores(hits, pooling, top_n, get_index_config("candidates").metric_type)[:k]
+
+        names = dict(
+            self.db.query(Candidate.id, Candidate.name)
+            .filter(Candidate.id.in_([match["candidate_id"] for match in matches]))
+            .all()
+        )
+        return [{**match, "candidate_name": names.get(match["candidate_id"])} for match in matches]
+
+    def score_applications(self, job_order_ids: list[int] = None, pooling: str = "max", top_n: int = 3) -> dict:
+        """
+        Computes candidate_score for existing job applications from the stored
+        job-order and resume vectors; no embedding or LLM call is made.
+        """
+        query = self.db.query(JobApplication.job_order_id, JobApplication.candidate_id)
+        if job_order_ids is not None:
+            query = query.filter(JobApplication.job_order_id.in_(job_order_ids))
+        applicants = defaultdict(list)
+        for job_order_id, candidate_id in query.all():
+            applicants[job_order_id].append(candidate_id)
+
+        vectors = self.get_job_order_vectors(list(applicants))
+        metric_type = get_index_config("candidates").metric_type
+        scores = []
+        for job_order_id, candidate_ids in applicants.items():
+            vector = vectors.get(job_order_id)
+            if vector is None:
+                continue
+            hits = search_candidate_chunks(
+                [vector], candidate_ids,
+                limit=len(candidate_ids) * CHUNKS_PER_CANDIDATE,
+                output_fields=["candidate_id"],
+            )[0]
+            scores.extend(
+                {"b_job_order_id": job_order_id, "b_candidate_id": match["candidate_id"], "b_score": to_candidate_score(match["score"])}
+                for match in pool_candidate_scores(hits, pooling, top_n, metric_type)
+            )
+
+        if scores:
+            statement = (
+                update(JobApplication)
+                .where(JobApplication.job_order_id == bindparam("b_job_order_id"))
+                .where(JobApplication.candidate_id == bindparam("b_candidate_id"))
+                .values(candidate_score=bindparam("b_score"))
+            )
+            self.db.connection().execute(statement, scores)
+        return {"job_orders": len(vectors), "updated": len(scores)}
+
+    def commit(self):
+        self.db.commit()
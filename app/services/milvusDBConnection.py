@@ -1,50 +1,335 @@
-from pymilvus import connections, utility, db, Collection
+import asyncio
+import json
+import logging
+import threading
+import time
 from app.schemas.jobOrderSchema import JobOrderMilvus
-from app.utils.environmentVariables import MILVUS_DB_HOST, MILVUS_DB_PORT
+from app.services.milvusIndex import get_index_config
+from app.utils.environmentVariables import require_env_variables, MILVUS_DB_HOST, MILVUS_DB_PORT, MILVUS_MAX_INSERT_BYTES
 from app.utils.exceptions import MilvusCollectionNotFoundError, MilvusTransactionFailure
+from app.services.vectorTier import get_vector_tier
+from app.utils.metrics import timed, CHUNKS
 
+logger = logging.getLogger(__name__)
 
-con = connections.connect(host=MILVUS_DB_HOST, port=MILVUS_DB_PORT)
+# pymilvus is imported and the connection opened on first use (or by the app's
+# lifespan), so importing this module never blocks on Milvus
+MILVUS_DATABASE = 'ResumeMatcher'
 
-db.using_database('ResumeMatcher')
+_connect_lock = threading.Lock()
+_connected = False
+_collections = {}
 
+def connect_milvus():
+    global _connected
+    if _connected:
+        return
+    with _connect_lock:
+        if not _connected:
+            require_env_variables("milvus")
+            from pymilvus import connections, db
+            connections.connect(host=MILVUS_DB_HOST, port=MILVUS_DB_PORT)
+            db.using_database(MILVUS_DATABASE)
+            _connected = True
+
+def milvus_server_version(timeout: float = 2.0) -> str:
+    """Round-trips to the server; raises if Milvus is unreachable within `timeout`."""
+    connect_milvus()
+    from pymilvus import utility
+    return utility.get_server_version(timeout=timeout)
+
+def get_collection(collection_name: str):
+    collection = _collections.get(collection_name)
+    if collection is None:
+        connect_milvus()
+        from pymilvus import utility, Collection
+        if not utility.has_collection(collection_name):
+            raise MilvusCollectionNotFoundError(name="MilvusCollectionNotFoundError", message=f"Collection {collection_name} does not exist in Milvus.")
+        collection = Collection(name=collection_name)
+        _collections[collection_name] = collection
+    return collection
+
+def _mirror_to_tier(collection_name: str, write):
+    # Milvus stays the source of truth: a tier that misses a write stops serving searches until it is rebuilt
+    vector_tier = get_vector_tier()
+    if vector_tier is None or collection_name != vector_tier.collection_name:
+        return
+    try:
+        write(vector_tier)
+    except Exception:
+        logger.exception("Could not mirror a %s write to the vector tier, disabling it until rebuilt", collection_name)
+        vector_tier.invalidate()
+
+def mirror_index_versions(versions: dict):
+    """Tells the vector tier which index version {candidate_id: version} of candidates it now holds."""
+    _mirror_to_tier("candidates", lambda tier: tier.record_versions(versions))
+
+@timed("milvus_insert")
 def insert_to_milvus(job_order, collection_name: str):
-     
-    if not utility.has_collection(collection_name):
-        raise MilvusCollectionNotFoundError(name="MilvusCollectionNotFoundError", message=f"Collection {collection_name} does not exist in Milvus.")
-    
-    collection = Collection(name=collection_name)
-    result = collection.insert([job_order.model_dump()])
+    collection = get_collection(collection_name)
+    row = job_order.model_dump()
+    result = collection.insert([row])
 
     if result.insert_count == 0:
         raise MilvusTransactionFailure(name="MilvusTransactionFailure", message="Failed to insert job order into Milvus.")
-    
+
+    _mirror_to_tier(collection_name, lambda tier: tier.add(result.primary_keys, [row]))
     return job_order
 
-def delete_from_milvus(job_order_id: int, collection_name: str, id_col: str = "id"):
-    if not utility.has_collection(collection_name):
-        raise MilvusCollectionNotFoundError(name="MilvusCollectionNotFoundError", message=f"Collection {collection_name} does not exist in Milvus.")
+def _estimate_row_bytes(row: dict) -> int:
+    size = 0
+    for value in row.values():
+        if isinstance(value, str):
+            size += len(value.encode("utf-8"))
+        elif isinstance(value, (list, tuple)):
+            size += 4 * len(value)
+        else:
+            size += 8
+    return size
+
+def _split_by_payload(rows: list[dict], max_bytes: int) -> list[list[dict]]:
+    batches, batch, batch_bytes = [], [], 0
+    for row in rows:
+        row_bytes = _estimate_row_bytes(row)
+        if batch and batch_bytes + row_bytes > max_bytes:
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(row)
+        batch_bytes += row_bytes
+    if batch:
+        batches.append(batch)
+    return batches
+
+@timed("milvus_insert")
+def bulk_insert_to_milvus(records: list, collection_name: str, max_batch_bytes: int = MILVUS_MAX_INSERT_BYTES) -> list:
+    """
+    Writes all records with columnar inserts, split only when a batch would exceed
+    `max_batch_bytes`. If a later batch fails, rows from the earlier batches are
+    deleted again so the records are written all-or-nothing.
+    """
+    if not records:
+        return []
+
+    CHUNKS.labels("inserted").inc(len(records))
+    collection = get_collection(collection_name)
+    rows = [record.model_dump() for record in records]
+    fields = [field for field in collection.schema.fields if not (field.is_primary and field.auto_id)]
+    primary_field = collection.schema.primary_field
 
+    inserted_keys = []
+    try:
+        for batch in _split_by_payload(rows, max_batch_bytes):
+            columns = [[row[field.name] for row in batch] for field in fields]
+            result = collection.insert(columns)
+            if result.insert_count != len(batch):
+                raise MilvusTransactionFailure(name="MilvusTransactionFailure", message=f"Inserted {result.insert_count} of {len(batch)} rows into Milvus.")
+            inserted_keys.extend(result.primary_keys)
+    except Exception:
+        if inserted_keys:
+            from pymilvus import DataType
+            keys = [f'"{key}"' for key in inserted_keys] if primary_field.dtype == DataType.VARCHAR else inserted_keys
+            collection.delete(f"{primary_field.name} in [{', '.join(map(str, keys))}]")
+        raise
 
-    collection = Collection(name=collection_name)
+    _mirror_to_tier(collection_name, lambda tier: tier.add(inserted_keys, rows))
+    return records
+
+@timed("milvus_delete")
+def delete_from_milvus(job_order_id: int, collection_name: str, id_col: str = "id", allow_missing: bool = False):
+    collection = get_collection(collection_name)
     result=collection.delete(f"{id_col} == {job_order_id}")
 
-    if result.delete_count == 0:
-        raise MilvusTransactionFailure(f"Failed to delete job order from Milvus.")
-    
+    if result.delete_count == 0 and not allow_missing:
+        raise MilvusTransactionFailure(name="MilvusTransactionFailure", message="Failed to delete job order from Milvus.")
+
+    _mirror_to_tier(collection_name, lambda tier: tier.delete([job_order_id], id_col))
     return job_order_id
 
-def update_in_milvus(job_order: JobOrderMilvus, collection_name: str):
-    if not utility.has_collection(collection_name):
-        raise MilvusCollectionNotFoundError(f"Collection {collection_name} does not exist in Milvus.")
+@timed("milvus_delete")
+def delete_many_from_milvus(ids: list[int], collection_name: str, id_col: str = "id") -> int:
+    if not ids:
+        return 0
+    collection = get_collection(collection_name)
+    result = collection.delete(f"{id_col} in [{', '.join(str(int(i)) for i in ids)}]")
+    _mirror_to_tier(collection_name, lambda tier: tier.delete(ids, id_col))
+    return result.delete_count
+
+def primary_key_field(collection_name: str) -> str:
+    return get_collection(collection_name).schema.primary_field.name
+
+@timed("milvus_query")
+def query_milvus(expr: str, collection_name: str, output_fields: list[str]) -> list[dict]:
+    collection = get_collection(collection_name)
+    return collection.query(expr=expr, output_fields=output_fields)
+
+def iterate_rows(collection, expr: str, output_fields: list[str], batch_size: int = 1000):
+    iterator = collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=output_fields)
+    try:
+        while batch := iterator.next():
+            yield from batch
+    finally:
+        iterator.close()
+
+def iterate_milvus(expr: str, collection_name: str, output_fields: list[str], batch_size: int = 1000):
+    """Yields every matching row, fetched `batch_size` rows at a time."""
+    yield from iterate_rows(get_collection(collection_name), expr, output_fields, batch_size)
+
+MILVUS_MAX_TOPK = 16384
 
+@timed("milvus_search")
+def search_milvus(vectors: list[list[float]], collection_name: str, limit: int, output_fields: list[str],
+                  expr: str = None, anns_field: str = "vector", search_params: dict = None) -> list[list[dict]]:
+    """
+    Runs one ANN search for all query vectors and returns one list of hits per vector.
+    `search_params` default to the collection's configured index (see milvusIndex).
+    """
+    collection = get_collection(collection_name)
+    limit = min(limit, MILVUS_MAX_TOPK)
+    results = collection.search(
+        data=vectors,
+        anns_field=anns_field,
+        param=search_params or get_index_config(collection_name).search_params(limit),
+        limit=limit,
+        expr=expr,
+        output_fields=output_fields,
+    )
+    return [
+        [{"id": hit.id, "distance": hit.distance, **{field: hit.entity.get(field) for field in output_fields}} for hit in hits]
+        for hits in results
+    ]
 
+def search_candidate_chunks(vectors: list[list[float]], candidate_ids: list[int], limit: int, output_fields: list[str]) -> list[list[dict]]:
+    """
+    search_milvus() over the candidates collection restricted to `candidate_ids`,
+    answered by the local vector tier when it is loaded and matches Milvus for those candidates.
+    """
+    vector_tier = get_vector_tier()
+    if vector_tier is not None and vector_tier.serves(candidate_ids):
+        return vector_tier.search(vectors, limit, candidate_ids, output_fields)
+    expr = f"candidate_id in [{', '.join(str(int(i)) for i in candidate_ids)}]"
+    return search_milvus(vectors, "candidates", limit, output_fields, expr=expr)
 
-    collection = Collection(name=collection_name)
-    result = collection.upsert([job_order.model_dump()])
+def rebuild_index(collection_name: str, field_name: str = "vector"):
+    """Drops the vector index of `field_name` and builds the configured one instead."""
+    config = get_index_config(collection_name)
+    collection = get_collection(collection_name)
+    collection.release()
+    for index in collection.indexes:
+        if index.field_name == field_name:
+            collection.drop_index(index_name=index.index_name)
+    collection.create_index(field_name=field_name, index_params=config.index_params())
+    collection.load()
+    return config
+
+def _key_expr(primary, keys) -> str:
+    from pymilvus import DataType
+    values = ", ".join(json.dumps(key) if primary.dtype == DataType.VARCHAR else str(int(key)) for key in keys)
+    return f"{primary.name} in [{values}]"
+
+def repartition_collection(collection_name: str, partition_key: str, num_partitions: int = 64, batch_size: int = 1000) -> int:
+    """
+    Copies the collection into a new one with `partition_key` as its partition
+    key and points `collection_name` at the copy, which it then serves as an
+    alias. The first run renames the original collection out of the way, later
+    runs only move the alias, and the old collection is dropped last.
+
+    Writes keep landing in the old collection while rows are copied. Once the
+    alias points at the copy, rows inserted into or deleted from the old
+    collection in the meantime are carried over. Auto-generated primary keys change.
+    """
+    from pymilvus import utility, Collection, CollectionSchema, FieldSchema, DataType
+    old = get_collection(collection_name)
+    old_name = old.describe()["collection_name"]
+    primary = old.schema.primary_field
+    vector_field = next(field.name for field in old.schema.fields if field.dtype == DataType.FLOAT_VECTOR)
+    fields = [
+        FieldSchema(field.name, field.dtype, is_primary=field.is_primary, auto_id=field.auto_id,
+                    is_partition_key=field.name == partition_key, **field.params)
+        for field in old.schema.fields
+    ]
+    copied_fields = [field.name for field in fields if not (field.is_primary and field.auto_id)]
+    all_rows = f"{primary.name} != ''" if primary.dtype == DataType.VARCHAR else f"{primary.name} >= 0"
+
+    new_name = f"{collection_name}_{int(time.time())}"
+    new = Collection(new_name, CollectionSchema(fields), num_partitions=num_partitions)
+    # old primary key -> primary key of the copy
+    copied = {}
+
+    def copy(source, expr: str):
+        iterator = source.query_iterator(batch_size=batch_size, expr=expr, output_fields=list(dict.fromkeys([primary.name, *copied_fields])))
+        try:
+            while batch := iterator.next():
+                result = new.insert([[row[name] for row in batch] for name in copied_fields])
+                copied.update(zip((row[primary.name] for row in batch), result.primary_keys))
+        finally:
+            iterator.close()
+
+    copy(old, all_rows)
+    new.flush()
+    new.create_index(field_name=vector_field, index_params=get_index_config(collection_name).index_params())
+    new.load()
+
+    if old_name != collection_name:
+        utility.alter_alias(new_name, collection_name)
+    else:
+        # the only moment the name resolves to nothing; writers retry, searches fail for these two calls
+        old_name = f"{collection_name}_retired_{int(time.time())}"
+        utility.rename_collection(collection_name, old_name)
+        utility.create_alias(new_name, collection_name)
+    _collections.pop(collection_name, None)
+    old = Collection(old_name)
+
+    # a second pass picks up writes that were in flight while the first one ran
+    for _ in range(2):
+        current = {row[primary.name] for row in iterate_rows(old, all_rows, [primary.name], batch_size)}
+        missing = [key for key in current if key not in copied]
+        for start in range(0, len(missing), batch_size):
+            copy(old, _key_expr(primary, missing[start:start + batch_size]))
+        removed = [key for key in copied if key not in current]
+        for start in range(0, len(removed), batch_size):
+            new.delete(_key_expr(primary, [copied.pop(key) for key in removed[start:start + batch_size]]))
+    new.flush()
+
+    old.release()
+    utility.drop_collection(old_name)
+    # the copied rows got new primary keys
+    _mirror_to_tier(collection_name, lambda tier: tier.invalidate())
+    return len(copied)
+
+@timed("milvus_upsert")
+def update_in_milvus(job_order: JobOrderMilvus, collection_name: str):
+    collection = get_collection(collection_name)
+    row = job_order.model_dump()
+    result = collection.upsert([row])
 
     if result.upsert_count == 0:
-        raise MilvusTransactionFailure("Failed to update job order in Milvus.")
+        raise MilvusTransactionFailure(name="MilvusTransactionFailure", message="Failed to update job order in Milvus.")
 
+    _mirror_to_tier(collection_name, lambda tier: tier.add([row[collection.schema.primary_field.name]], [row]))
     return job_order
 
+@timed("milvus_upsert")
+def upsert_many_in_milvus(records: list, collection_name: str) -> int:
+    """Upserts all records in one call; rows are matched on the collection's primary key."""
+    if not records:
+        return 0
+    collection = get_collection(collection_name)
+    rows = [record.model_dump() for record in records]
+    result = collection.upsert(rows)
+
+    if result.upsert_count != len(rows):
+        raise MilvusTransactionFailure(name="MilvusTransactionFailure", message=f"Upserted {result.upsert_count} of {len(rows)} rows into Milvus.")
+
+    primary_key = collection.schema.primary_field.name
+    _mirror_to_tier(collection_name, lambda tier: tier.add([row[primary_key] for row in rows], rows))
+    return result.upsert_count
+
+# pymilvus' ORM client is blocking, so the async variants run it on a worker thread
+async def abulk_insert_to_milvus(records: list, collection_name: str, max_batch_bytes: int = MILVUS_MAX_INSERT_BYTES) -> list:
+    return await asyncio.to_thread(bulk_insert_to_milvus, records, collection_name, max_batch_bytes)
+
+async def adelete_many_from_milvus(ids: list[int], collection_name: str, id_col: str = "id") -> int:
+    return await asyncio.to_thread(delete_many_from_milvus, ids, collection_name, id_col)
+
+async def aquery_milvus(expr: str, collection_name: str, output_fields: list[str]) -> list[dict]:
+    return await asyncio.to_thread(query_milvus, expr, collection_name, output_fields)
@@ -0,0 +1,107 @@
+"""
+Vector index settings for each Milvus collection.
+
+Every collection uses an HNSW index with L2 distance unless overridden in
+MILVUS_INDEX_CONFIG, a JSON object keyed by collection name:
+
+    MILVUS_INDEX_CONFIG='{"candidates": {"index_type": "IVF_FLAT", "metric_type": "COSINE",
+                                         "params": {"nlist": 2048}, "search": {"nprobe": 32}}}'
+
+`params` are build-time parameters (HNSW M/efConstruction, IVF nlist) and
+`search` are query-time parameters (HNSW ef, IVF nprobe). Changing the index of
+an existing collection requires rebuilding it:
+
+    python -m app.services.milvusIndex candidates
+
+With a partition key, Milvus hashes the field's values into `--num-partitions`
+partitions, and a filter on that field (e.g. `candidate_id in [...]`) only scans
+the partitions its values hash to:
+
+    python -m app.services.milvusIndex candidates --partition-key candidate_id
+
+This does not confine client or job order scoped searches by itself: they are
+filtered on the candidate ids they resolve to, and a few hundred ids usually
+hash to most of the partitions, so the pruning pays off for small scopes only.
+"""
+import argparse
+import json
+
+from app.utils.environmentVariables import MILVUS_INDEX_CONFIG
+from app.utils.exceptions import MilvusIndexConfigError
+
+# index type -> (default build params, default search params)
+INDEX_TYPES = {
+    "FLAT": ({}, {}),
+    "HNSW": ({"M": 16, "efConstruction": 200}, {"ef": 64}),
+    "IVF_FLAT": ({"nlist": 1024}, {"nprobe": 16}),
+    "IVF_SQ8": ({"nlist": 1024}, {"nprobe": 16}),
+}
+# COSINE and IP return similarities (higher is better), L2 a squared distance
+METRIC_TYPES = ("L2", "IP", "COSINE")
+DEFAULT_INDEX = {"index_type": "HNSW", "metric_type": "L2"}
+
+
+class IndexConfig:
+    def __init__(self, index_type: str = "HNSW", metric_type: str = "L2", params: dict = None, search: dict = None):
+        index_type, metric_type = index_type.upper(), metric_type.upper()
+        if index_type not in INDEX_TYPES:
+            raise MilvusIndexConfigError(name="MilvusIndexConfigError", message=f"Unsupported index type {index_type}, expected one of {', '.join(INDEX_TYPES)}")
+        if metric_type not in METRIC_TYPES:
+            raise MilvusIndexConfigError(name="MilvusIndexConfigError", message=f"Unsupported metric type {metric_type}, expected one of {', '.join(METRIC_TYPES)}")
+        build_defaults, search_defaults = INDEX_TYPES[index_type]
+        self.index_type = index_type
+        self.metric_type = metric_type
+        self.params = {**build_defaults, **(params or {})}
+        self.search = {**search_defaults, **(search or {})}
+
+    def index_params(self) -> dict:
+        return {"index_type": self.index_type, "metric_type": self.metric_type, "params": self.params}
+
+    def search_params(self, limit: int = None) -> dict:
+        params = dict(self.search)
+        # HNSW rejects searches whose topk is larger than ef
+        if "ef" in params and limit is not None:
+            params["ef"] = max(params["ef"], limit)
+        return {"metric_type": self.metric_type, "params": params}
+
+    def __repr__(self) -> str:
+        return f"IndexConfig({self.index_type}, {self.metric_type}, params={self.params}, search={self.search})"
+
+
+def load_index_configs(raw: str) -> dict[str, IndexConfig]:
+    try:
+        overrides = json.loads(raw or "{}")
+    except json.JSONDecodeError as e:
+        raise MilvusIndexConfigError(name="MilvusIndexConfigError", message=f"MILVUS_INDEX_CONFIG is not valid JSON: {e}")
+    return {name: IndexConfig(**{**DEFAULT_INDEX, **config}) for name, config in overrides.items()}
+
+
+_configs = load_index_configs(MILVUS_INDEX_CONFIG)
+
+def get_index_config(collection_name: str) -> IndexConfig:
+    config = _configs.get(collection_name)
+    if config is None:
+        config = _configs[collection_name] = IndexConfig(**DEFAULT_INDEX)
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("collections", nargs="+", help="collections whose vector index is rebuilt")
+    parser.add_argument("--field", default="vector")
+    parser.add_argument("--partition-key", help="copy the collection into one partitioned on this scalar field")
+    parser.add_argument("--num-partitions", type=int, default=64)
+    args = parser.parse_args()
+
+    from app.services.milvusDBConnection import rebuild_index, repartition_collection
+    for collection_name in args.collections:
+        if args.partition_key:
+            copied = repartition_collection(collection_name, args.partition_key, args.num_partitions)
+            print(f"{collection_name}: {copied} rows partitioned on {args.partition_key}, {get_index_config(collection_name)}")
+        else:
+            config = rebuild_index(collection_name, args.field)
+            print(f"{collection_name}: {config}")
+
+
+if __name__ == "__main__":
+    main()
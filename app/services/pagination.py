@@ -0,0 +1,61 @@
+import base64
+import json
+
+from sqlalchemy import Select, tuple_
+from sqlalchemy.orm import Session
+
+from app.utils.exceptions import InvalidCursorError
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError(name="InvalidCursorError", message="Invalid pagination cursor")
+    return values
+
+
+def keyset_page(db: Session, statement: Select, sort_keys: list, limit: int,
+                cursor: str = None, descending: bool = False) -> tuple[list[dict], str]:
+    """
+    Returns up to `limit` rows of `statement` ordered by `sort_keys` (the last
+    keys must make the order unique) and the cursor of the next page, or None on
+    the last page. Each page is one range scan instead of an OFFSET, provided
+    an index on exactly `sort_keys` exists (see the sort indexes in postgresModel).
+    """
+    if cursor is not None:
+        after = decode_cursor(cursor, len(sort_keys))
+        keys = tuple_(*sort_keys)
+        statement = statement.where(keys < tuple_(*after) if descending else keys > tuple_(*after))
+    statement = statement.order_by(*(key.desc() if descending else key.asc() for key in sort_keys))
+    statement = statement.add_columns(*(key.label(f"_sort_{i}") for i, key in enumerate(sort_keys)))
+
+    rows = db.execute(statement.limit(limit + 1)).mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][f"_sort_{i}"] for i in range(len(sort_keys))])
+    return [{key: value for key, value in row.items() if not key.startswith("_sort_")} for row in rows], next_cursor
+
+
+def iter_ndjson(session_factory, statement: Select, batch_size: int = EXPORT_BATCH_SIZE):
+    """
+    Yields every row of `statement` as a JSON line. Rows are streamed from a
+    server-side cursor `batch_size` at a time, so the table is never held in
+    memory. The session is owned by the generator because it outlives the request.
+    """
+    db = session_factory()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        for rows in result.mappings().partitions():
+            yield "".join(json.dumps(dict(row), default=str) + "\n" for row in rows)
+    finally:
+        db.close()
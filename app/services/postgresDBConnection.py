@@ -1,12 +1,77 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, declarative_base
-from app.utils.environmentVariables import POSTGRES_DB_URL  
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from app.utils.environmentVariables import (
+    POSTGRES_DB_URL, POSTGRES_POOL_SIZE, POSTGRES_MAX_OVERFLOW, POSTGRES_POOL_TIMEOUT, POSTGRES_POOL_RECYCLE, POSTGRES_POOL_PRE_PING
+)
+from app.utils.metrics import DB_POOL_CHECKOUT_WAIT, DB_POOL_CHECKOUT_TIMEOUTS, DB_POOL_CHECKED_OUT, DB_POOL_OVERFLOW
+
+
+class CheckoutTimerMixin:
+    """Records how long each checkout waited for a free (or newly opened) connection."""
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+class TimedQueuePool(CheckoutTimerMixin, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(CheckoutTimerMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, poolclass) -> dict:
+    # SQLite (local development) keeps SQLAlchemy's default pool
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": POSTGRES_POOL_SIZE,
+        "max_overflow": POSTGRES_MAX_OVERFLOW,
+        "pool_timeout": POSTGRES_POOL_TIMEOUT,
+        "pool_recycle": POSTGRES_POOL_RECYCLE,
+        "pool_pre_ping": POSTGRES_POOL_PRE_PING,
+    }
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
 
 postgres_db_url = POSTGRES_DB_URL
-engine = create_engine(postgres_db_url)
+engine = create_engine(postgres_db_url, **engine_options(postgres_db_url, TimedQueuePool))
 sessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+if isinstance(engine.pool, QueuePool):
+    DB_POOL_CHECKED_OUT.set_function(engine.pool.checkedout)
+    DB_POOL_OVERFLOW.set_function(lambda: max(engine.pool.overflow(), 0))
+
+# the async engine (asyncpg) is only created when an async endpoint first needs it
+async_engine = None
+_async_session_factory = None
+
+def get_async_session_factory():
+    global async_engine, _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        url = async_url(postgres_db_url)
+        async_engine = create_async_engine(url, **engine_options(url, TimedAsyncQueuePool))
+        _async_session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
+# sessions only check out a connection on their first query, so requests that
+# fail validation never touch the pool
 def get_db():
     db = sessionLocal()
     try:
@@ -14,8 +79,21 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with get_async_session_factory()() as db:
+        yield db
+
+async def dispose_engines():
+    engine.dispose()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+def ping_postgres():
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
 def create_table():
     Base.metadata.create_all(bind=engine)
 
 def as_dict(obj):
-        return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
\ No newline at end of file
+        return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
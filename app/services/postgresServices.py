@@ -1,28 +1,56 @@
+from sqlalchemy import insert, select, update
 from sqlalchemy.orm import Session
-from app.models.postgresModel import JobApplication, Candidate, JobOrder
+from app.models.postgresModel import JobApplication, Candidate, JobOrder, sort_key
+from app.services.pagination import keyset_page
 from app.utils.exceptions import PostgressNoRowFound
+from app.utils.metrics import timed
 
 class GenericDBService:
     def __init__(self, db: Session, model):
         self.db = db
         self.model = model
 
+    @timed("postgres_insert")
     def create(self, schema_obj):
-        db_obj = self.model(**schema_obj.model_dump())
-        self.db.add(db_obj)
-        self.db.flush()
-        self.db.refresh(db_obj)
-        return db_obj
+        """
+        Inserts with INSERT ... RETURNING, so generated columns come back with the
+        insert itself instead of a flush plus a refresh SELECT. The returned
+        instance is detached from the session.
+        """
+        statement = insert(self.model).values(**schema_obj.model_dump()).returning(*self.model.__table__.columns)
+        row = self.db.execute(statement).mappings().one()
+        return self.model(**row)
+
+    @timed("postgres_insert")
+    def bulk_create(self, schema_objs: list) -> list[int]:
+        """Inserts all rows in one multi-row INSERT ... RETURNING and returns the new ids in input order."""
+        if not schema_objs:
+            return []
+        statement = insert(self.model).returning(self.model.id, sort_by_parameter_order=True)
+        result = self.db.execute(statement, [schema_obj.model_dump() for schema_obj in schema_objs])
+        return list(result.scalars())
+
+    def list_statement(self):
+        # plain column select, rows are never hydrated into ORM objects
+        return select(*self.model.__table__.columns)
 
-    def get_all(self):
-        return self.db.query(self.model).all()
+    def sort_keys(self, sort: str = "id") -> list:
+        if sort == "id":
+            return [self.model.id]
+        return [sort_key(getattr(self.model, sort), "''"), self.model.id]
 
+    @timed("postgres_select")
+    def get_page(self, limit: int, cursor: str = None, sort: str = "id", descending: bool = False) -> tuple[list[dict], str]:
+        return keyset_page(self.db, self.list_statement(), self.sort_keys(sort), limit, cursor, descending)
+
+    @timed("postgres_select")
     def get_by_id(self, obj_id: int):
         result = self.db.query(self.model).filter(self.model.id == obj_id).first()
         if result is None:
             raise PostgressNoRowFound(name="PostgressNoRowFound", message="No such record")
         return result
 
+    @timed("postgres_update")
     def update(self, obj_id: int, schema_obj):
         db_obj = self.db.query(self.model).filter(self.model.id == obj_id).first()
         if db_obj is None:
@@ -31,6 +59,7 @@ class GenericDBService:
             setattr(db_obj, key, value)
         return db_obj
 
+    @timed("postgres_delete")
     def delete(self, obj_id: int):
         db_obj = self.db.query(self.model).filter(self.model.id == obj_id).first()
         if db_obj is None:
@@ -38,6 +67,7 @@ class GenericDBService:
         self.db.delete(db_obj)
         return db_obj
 
+    @timed("postgres_commit")
     def commit(self):
         self.db.commit()
 
@@ -51,6 +81,7 @@ class JobApplicationService(GenericDBService):
     def __init__(self, db: Session):
         super().__init__(db, JobApplication)
 
+    @timed("postgres_delete")
     def delete(self, job_order_id: int, candidate_id: int):
         db_obj = self.db.query(self.model).filter(self.model.candidate_id == candidate_id, self.model.job_order_id == job_order_id).first()
         if db_obj is None:
@@ -59,9 +90,27 @@ class JobApplicationService(GenericDBService):
         self.db.commit()
         return db_obj
     
-    def get_all(self):
-        results = (
-            self.db.query(
+    @timed("postgres_select")
+    def get_candidate_ids(self, job_order_id: int = None, client_name: str = None, candidate_ids: list[int] = None):
+        """
+        Candidates who applied to `job_order_id` and/or to any job order of
+        `client_name`, optionally narrowed to `candidate_ids`. Returns None when
+        no filter is given.
+        """
+        if job_order_id is None and client_name is None:
+            return None if candidate_ids is None else sorted(set(candidate_ids))
+        query = self.db.query(JobApplication.candidate_id).distinct()
+        if job_order_id is not None:
+            query = query.filter(JobApplication.job_order_id == job_order_id)
+        if client_name is not None:
+            query = query.join(JobOrder, JobApplication.job_order_id == JobOrder.id).filter(JobOrder.client_name == client_name)
+        if candidate_ids is not None:
+            query = query.filter(JobApplication.candidate_id.in_(candidate_ids))
+        return sorted(candidate_id for candidate_id, in query.all())
+
+    def list_statement(self):
+        return (
+            select(
                 JobApplication.job_order_id,
                 JobApplication.candidate_id,
                 Candidate.name.label("candidate_name"),
@@ -71,8 +120,46 @@ class JobApplicationService(GenericDBService):
             )
             .join(Candidate, JobApplication.candidate_id == Candidate.id)
             .join(JobOrder, JobApplication.job_order_id == JobOrder.id)
-            .all()
         )
-        return results
 
-    
\ No newline at end of file
+    def sort_keys(self, sort: str = "job_order_id") -> list:
+        primary_key = [JobApplication.job_order_id, JobApplication.candidate_id]
+        if sort == "candidate_score":
+            # unscored applications sort first
+            return [sort_key(JobApplication.candidate_score, "-1"), *primary_key]
+        return primary_key
+
+    @timed("postgres_select")
+    def get_page(self, limit: int, cursor: str = None, sort: str = "job_order_id", descending: bool = False) -> tuple[list[dict], str]:
+        return keyset_page(self.db, self.list_statement(), self.sort_keys(sort), limit, cursor, descending)
+
+class CandidateIndexService:
+    """
+    Index versions of candidates. Every write of a candidate's chunks to Milvus
+    bumps its version, and the vector tier serves a candidate only at the
+    version it mirrored.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+
+    @timed("postgres_update")
+    def bump(self, candidate_ids: list[int]) -> dict[int, int]:
+        """Returns the new version of each candidate; deleted candidates are left out."""
+        if not candidate_ids:
+            return {}
+        statement = (
+            update(Candidate)
+            .where(Candidate.id.in_(candidate_ids))
+            .values(index_version=Candidate.index_version + 1)
+            .returning(Candidate.id, Candidate.index_version)
+            .execution_options(synchronize_session=False)
+        )
+        return dict(self.db.execute(statement).all())
+
+    @timed("postgres_select")
+    def versions(self, candidate_ids: list[int] = None) -> dict[int, int]:
+        """Versions of `candidate_ids`, or of every candidate."""
+        statement = select(Candidate.id, Candidate.index_version)
+        if candidate_ids is not None:
+            statement = statement.where(Candidate.id.in_(candidate_ids))
+        return dict(self.db.execute(statement).all())
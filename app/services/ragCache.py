@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models.postgresModel import CacheGeneration
+from app.services.postgresDBConnection import sessionLocal
+from app.utils.environmentVariables import RAG_CACHE_MAX_ENTRIES, RAG_CACHE_TTL_SECONDS, RAG_CACHE_MAX_DISTANCE, RAG_CACHE_SYNC_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.sub(r"[^\w\s+#.]", " ", query.lower()).split())
+
+
+def cache_scope(mode: str, candidate_ids: list[int] = None, pipeline: tuple = ()) -> str:
+    """
+    Answers are only reusable for the same pipeline (the rag_registry.get_graph()
+    arguments that built the graph), retrieval mode and candidate filter.
+    """
+    scope = f"{mode}:{hashlib.sha1(repr(pipeline).encode()).hexdigest()}"
+    if candidate_ids is None:
+        return scope
+    return f"{scope}:{hashlib.sha1(','.join(map(str, candidate_ids)).encode()).hexdigest()}"
+
+
+class SharedGeneration:
+    """Invalidation counter in the cache_generations table, so an invalidation in one process reaches all of them."""
+    def __init__(self, name: str, session_factory=sessionLocal):
+        self.name = name
+        self.session_factory = session_factory
+
+    def get(self) -> int:
+        db = self.session_factory()
+        try:
+            return db.execute(select(CacheGeneration.generation).where(CacheGeneration.name == self.name)).scalar() or 0
+        finally:
+            db.close()
+
+    def bump(self):
+        db = self.session_factory()
+        try:
+            result = db.execute(update(CacheGeneration).where(CacheGeneration.name == self.name).values(generation=CacheGeneration.generation + 1))
+            if result.rowcount == 0:
+                db.add(CacheGeneration(name=self.name, generation=1))
+            try:
+                db.commit()
+            except IntegrityError:
+                # another process inserted the row first
+                db.rollback()
+                db.execute(update(CacheGeneration).where(CacheGeneration.name == self.name).values(generation=CacheGeneration.generation + 1))
+                db.commit()
+        finally:
+            db.close()
+
+
+class RAGResponseCache:
+    """
+    Two-level cache of /rag/query answers.
+
+    An exact lookup on the normalised query text is tried first. Failing that, a
+    semantic lookup returns the answer of the closest cached query whose cosine
+    distance to the new query embedding is at most `max_distance`. Entries
+    expire after `ttl_seconds` and the least recently used entry is dropped
+    once `max_entries` is reached. `invalidate` clears everything and stops
+    answers computed before the invalidation from being stored. Entries are
+    only shared between lookups with the same `scope`.
+
+    Entries live in this process. With a `shared_generation`, invalidate() also
+    bumps the shared counter, and refresh() clears the cache once another
+    process has bumped it; refresh() reads the counter at most every
+    `sync_interval` seconds, which bounds how long another worker's stale
+    answers can be served.
+    """
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600, max_distance: float = 0.05,
+                 shared_generation: SharedGeneration = None, sync_interval: float = 1.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.shared_generation = shared_generation
+        self.sync_interval = sync_interval
+        self._shared_seen = None
+        self._synced_at = float("-inf")
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_keys = []
+        self.generation = 0
+
+    def _expired(self, entry: dict) -> bool:
+        return time.monotonic() - entry["created_at"] > self.ttl_seconds
+
+    def get_exact(self, query: str, scope: str = ""):
+        key = (scope, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry["answer"]
+
+    def get_semantic(self, vector: list[float], scope: str = ""):
+        with self._lock:
+            if self._matrix is None:
+                self._matrix_keys = [key for key, entry in self._entries.items() if entry["vector"] is not None]
+                if self._matrix_keys:
+                    self._matrix = np.stack([self._entries[key]["vector"] for key in self._matrix_keys])
+            if not self._matrix_keys:
+                return None
+            query = np.asarray(vector, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+            distances = 1.0 - self._matrix @ query
+            distances[[key[0] != scope for key in self._matrix_keys]] = np.inf
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                return None
+            key = self._matrix_keys[best]
+            entry = self._entries[key]
+            if self._expired(entry):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry["answer"]
+
+    def put(self, query: str, vector: list[float], answer, generation: int, scope: str = ""):
+        key = (scope, normalize_query(query))
+        normalized = None
+        if vector is not None:
+            normalized = np.asarray(vector, dtype=np.float32)
+            normalized /= np.linalg.norm(normalized) or 1.0
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = {"answer": answer, "vector": normalized, "created_at": time.monotonic()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def _remove(self, key: tuple):
+        del self._entries[key]
+        self._matrix = None
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.generation += 1
+
+    def refresh(self):
+        """Clears the cache if another process invalidated it since the last check; blocking, call it off the event loop."""
+        if self.shared_generation is None or time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        try:
+            shared = self.shared_generation.get()
+        except Exception:
+            logger.exception("Could not read the shared RAG cache generation")
+            return
+        self._synced_at = time.monotonic()
+        if shared != self._shared_seen:
+            if self._shared_seen is not None:
+                self._clear()
+            self._shared_seen = shared
+
+    def invalidate(self):
+        """Blocking when the generation is shared; call it off the event loop."""
+        self._clear()
+        if self.shared_generation is not None:
+            try:
+                self.shared_generation.bump()
+            except Exception:
+                logger.exception("Could not publish the RAG cache invalidation, other processes serve cached answers until their TTL")
+
+
+rag_cache = RAGResponseCache(RAG_CACHE_MAX_ENTRIES, RAG_CACHE_TTL_SECONDS, RAG_CACHE_MAX_DISTANCE,
+                             shared_generation=SharedGeneration("rag_cache"), sync_interval=RAG_CACHE_SYNC_INTERVAL)
@@ -0,0 +1,95 @@
+import re
+from typing import Callable, List
+
+from langchain_core.documents import Document
+
+# rough English average for Gemini/SentencePiece style tokenizers
+CHARS_PER_TOKEN = 4
+# a chunk is only cut to fit when at least this many tokens of budget are left
+MIN_TRUNCATED_TOKENS = 32
+SENTENCE_END = re.compile(r"[.!?\n]\s")
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def strip_overlap(kept: list[str], text: str, min_overlap: int = 20) -> str:
+    """
+    Removes text already present in `kept`. Chunks are split with a 200 character
+    overlap, so the start of a chunk often repeats the end of its neighbour.
+    """
+    for previous in kept:
+        if text in previous:
+            return ""
+        for size in range(min(len(previous), len(text)), min_overlap - 1, -1):
+            if previous.endswith(text[:size]):
+                text = text[size:]
+                break
+            if text.endswith(previous[:size]):
+                text = text[:-size]
+                break
+    return text.strip()
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens: Callable[[str], int] = estimate_tokens) -> str:
+    """Cuts `text` to at most `max_tokens`, at a sentence end if possible, else at a word boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    sentence_ends = [match.end() for match in SENTENCE_END.finditer(cut)]
+    if sentence_ends and sentence_ends[-1] > len(cut) // 2:
+        return cut[:sentence_ends[-1]].strip()
+    return cut.rsplit(None, 1)[0] if " " in cut else cut
+
+
+def format_chunk(doc: Document, text: str) -> str:
+    # candidate_id is the only metadata the answer refers to
+    return f"candidate_id: {doc.metadata.get('candidate_id')}\n{text}"
+
+
+def build_context(docs: List[Document], max_tokens: int, count_tokens: Callable[[str], int] = estimate_tokens) -> tuple[str, dict]:
+    """
+    Packs the highest-scoring chunks into at most `max_tokens` tokens.
+
+    Overlap with chunks of the same candidate that are already packed is
+    dropped, and the first chunk that does not fit is truncated at a sentence
+    boundary when enough budget remains. Returns the context and stats
+    comparing it with the unbudgeted `chunk/Metadata` layout.
+    """
+    ranked = sorted(docs, key=lambda doc: doc.metadata.get("score", 0.0), reverse=True)
+    packed, kept_texts, used = [], {}, 0
+    for doc in ranked:
+        candidate_texts = kept_texts.setdefault(doc.metadata.get("candidate_id"), [])
+        text = strip_overlap(candidate_texts, doc.page_content)
+        if not text:
+            continue
+        separator = 2 if packed else 0
+        block = format_chunk(doc, text)
+        tokens = count_tokens(block) + separator
+        if used + tokens > max_tokens:
+            remaining = max_tokens - used - separator - count_tokens(format_chunk(doc, ""))
+            if remaining >= MIN_TRUNCATED_TOKENS:
+                block = format_chunk(doc, truncate_to_tokens(text, remaining, count_tokens))
+                packed.append(block)
+                used += count_tokens(block) + separator
+            break
+        packed.append(block)
+        candidate_texts.append(text)
+        used += tokens
+
+    context = "\n\n".join(packed)
+    unbudgeted = "\n\n".join(f"chunk: {doc.page_content}\nMetadata: {doc.metadata}" for doc in docs)
+    return context, {
+        "chunks": len(packed),
+        "retrieved_chunks": len(docs),
+        "context_tokens": count_tokens(context),
+        "unbudgeted_context_tokens": count_tokens(unbudgeted),
+    }
@@ -1,10 +1,74 @@
-from typing import List, Callable, Dict, Any
+import asyncio
+import logging
+from typing import List, Callable, Dict, Any, Optional
+from collections import defaultdict
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import START, StateGraph
 from langchain_milvus import Milvus
 from langchain_ollama import OllamaEmbeddings
-import os
+from app.utils.environmentVariables import MILVUS_DB_HOST, MILVUS_DB_PORT
+from app.services.matchingService import distance_to_similarity
+from app.services.milvusIndex import get_index_config
+from app.services.ragContext import build_context, estimate_tokens, strip_overlap
+from app.utils.metrics import timed, CHUNKS, TOKENS
+
+logger = logging.getLogger(__name__)
+
+def build_vector_store(db_name: str, collection_name: str, embedding_model: OllamaEmbeddings) -> Milvus:
+    index_config = get_index_config(collection_name)
+    return Milvus(
+        embedding_function=embedding_model,
+        collection_name=collection_name,
+        connection_args={
+            "host": MILVUS_DB_HOST,
+            "port": MILVUS_DB_PORT,
+            "db_name": db_name
+        },
+        index_params=index_config.index_params(),
+        search_params=index_config.search_params(),
+    )
+
+RETRIEVAL_MODES = ("vector", "keyword", "hybrid")
+RRF_K = 60
+
+def aggregate_by_candidate(docs_with_scores: list, k: int, max_chunks_per_candidate: int = 2) -> List[Document]:
+    """
+    Groups retrieved (chunk, relevance) pairs per candidate_id, ranks candidates
+    by their best chunk and keeps up to `max_chunks_per_candidate`
+    de-overlapped chunks for each, until `k` chunks are selected.
+    """
+    by_candidate = defaultdict(list)
+    for doc, score in docs_with_scores:
+        by_candidate[doc.metadata.get("candidate_id")].append((score, doc))
+
+    ranked = sorted(by_candidate.values(), key=lambda chunks: max(score for score, _ in chunks), reverse=True)
+    selected = []
+    for chunks in ranked:
+        kept = []
+        for score, doc in sorted(chunks, key=lambda chunk: chunk[0], reverse=True):
+            if len(kept) == max_chunks_per_candidate or len(selected) == k:
+                break
+            text = strip_overlap([kept_doc.page_content for kept_doc in kept], doc.page_content)
+            if text:
+                kept.append(Document(page_content=text, metadata={**doc.metadata, "score": round(score, 4)}))
+        selected.extend(kept)
+        if len(selected) == k:
+            break
+    return selected
+
+
+def reciprocal_rank_fusion(result_lists: list, rrf_k: int = RRF_K) -> list:
+    """Fuses ranked (chunk, score) lists; a chunk is identified by its candidate_id and text."""
+    scores, docs = {}, {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results):
+            key = (doc.metadata.get("candidate_id"), doc.page_content)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    return sorted(((docs[key], score) for key, score in scores.items()), key=lambda result: result[1], reverse=True)
+
 
 def build_rag_graph(
     db_name: str,
@@ -13,15 +77,36 @@ def build_rag_graph(
     llm,
     prompt_template: str = None,
     k: int = 5,
+    vector_store: Milvus = None,
+    fetch_k: int = None,
+    max_chunks_per_candidate: int = 2,
+    keyword_index=None,
+    max_context_tokens: int = 1500,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+    vector_tier=None,
+    reranker=None,
 ) -> Callable:
     """
     Returns a compiled RAG graph object.
     
     Parameters:
-        vector_store: The vector store object for similarity search.
-        llm: The language model object with an .invoke() method.
+        vector_store: (Optional) An existing vector store to reuse. Built from
+            db_name, collection_name and embedding_model when omitted.
+        llm: The language model object with .invoke() and .ainvoke() methods.
         prompt_template: (Optional) Custom prompt template string with {question} and {context}.
         k: (Optional) Number of documents to retrieve for context.
+        fetch_k: (Optional) Number of chunks to over-fetch before grouping them per candidate. Defaults to 4 * k.
+        max_chunks_per_candidate: (Optional) Most chunks of a single candidate kept in the context.
+        keyword_index: (Optional) KeywordIndex used by the "keyword" and "hybrid" retrieval modes.
+        max_context_tokens: (Optional) Token budget for the retrieved context in the prompt.
+        count_tokens: (Optional) Token counter used for the budget. Defaults to a character-based estimate.
+        vector_tier: (Optional) VectorTier holding the collection; it answers searches restricted to candidate_ids it serves.
+        reranker: (Optional) Reranker replacing the generate node; the answer is then a list of
+            {candidate_id, reason, score} dicts scored by the LLM instead of the LLM's raw text.
+
+    The retrieval mode is read from state["mode"]: "vector" (default), "keyword"
+    (BM25 only, no embedding call) or "hybrid" (reciprocal-rank fusion of both).
+    When state["candidate_ids"] is set, both searches only consider those candidates.
     """
     # Use default prompt if none provided
     if prompt_template is None:
@@ -38,34 +123,163 @@ def build_rag_graph(
         """
     prompt = ChatPromptTemplate.from_template(prompt_template)
 
-    vector_store = Milvus(
-        embedding_function=embedding_model,
-        collection_name=collection_name,
-        connection_args={
-            "host": os.environ.get("milvus_db_host"),
-            "port": os.environ.get("milvus_db_port"),
-            "db_name": db_name
-        },
-        index_params={"index_type": "FLAT", "metric_type": "L2"},
-    )
+    if vector_store is None:
+        vector_store = build_vector_store(db_name, collection_name, embedding_model)
+    if fetch_k is None:
+        fetch_k = 4 * k
+    metric_type = get_index_config(collection_name).metric_type
+    # the store's own search params are built without a limit, so an HNSW ef below fetch_k would reject the search
+    search_params = get_index_config(collection_name).search_params(fetch_k)
+
     class State(Dict):
         question: str
+        query_vector: List[float]
+        mode: str
+        candidate_ids: Optional[List[int]]
         context: List[Document]
-        answer: str
+        context_stats: dict
+        answer: Any
+
+    def get_mode(state: State) -> str:
+        mode = state.get("mode") or "vector"
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode}")
+        if mode != "vector" and keyword_index is None:
+            raise ValueError(f"Retrieval mode {mode} needs a keyword index")
+        return mode
+
+    def keyword_search(question: str, candidate_ids: Optional[List[int]]) -> list:
+        return [
+            (Document(page_content=hit["text"], metadata={"candidate_id": hit["candidate_id"]}), hit["score"])
+            for hit in keyword_index.search(question, fetch_k, candidate_ids)
+        ]
+
+    def use_vector_tier(state: State) -> bool:
+        return vector_tier is not None and state.get("candidate_ids") is not None and vector_tier.serves(state["candidate_ids"])
+
+    def vector_tier_search(query_vector: List[float], candidate_ids: List[int]) -> list:
+        return [
+            (Document(page_content=hit["text"], metadata={"candidate_id": hit["candidate_id"], "pk": hit["id"]}), hit["distance"])
+            for hit in vector_tier.search([query_vector], fetch_k, candidate_ids, ["candidate_id", "text"])[0]
+        ]
+
+    def candidate_expr(state: State) -> Optional[str]:
+        candidate_ids = state.get("candidate_ids")
+        if candidate_ids is None:
+            return None
+        return f"candidate_id in [{', '.join(str(int(i)) for i in candidate_ids)}]"
+
+    def fuse(mode: str, vector_docs: list, keyword_docs: list) -> List[Document]:
+        vector_docs = [(doc, distance_to_similarity(distance, metric_type)) for doc, distance in vector_docs]
+        if mode == "hybrid":
+            results = reciprocal_rank_fusion([vector_docs, keyword_docs])
+        elif mode == "keyword":
+            results = keyword_docs
+        else:
+            results = vector_docs
+        return aggregate_by_candidate(results, k, max_chunks_per_candidate)
 
+    # a precomputed query_vector in the state skips embedding the question again
+    @timed("rag_retrieve")
     def retrieve(state: State):
-        retrieved_docs = vector_store.similarity_search(state["question"], k=k)
-        return {"context": retrieved_docs}
+        mode = get_mode(state)
+        if state.get("candidate_ids") == []:
+            return {"context": []}
+        expr = candidate_expr(state)
+        vector_docs, keyword_docs = [], []
+        if mode != "keyword" and use_vector_tier(state):
+            query_vector = state.get("query_vector")
+            if query_vector is None:
+                query_vector = embedding_model.embed_query(state["question"])
+            vector_docs = vector_tier_search(query_vector, state["candidate_ids"])
+        elif mode != "keyword":
+            if state.get("query_vector") is not None:
+                vector_docs = vector_store.similarity_search_with_score_by_vector(state["query_vector"], k=fetch_k, param=search_params, expr=expr)
+            else:
+                vector_docs = vector_store.similarity_search_with_score(state["question"], k=fetch_k, param=search_params, expr=expr)
+        if mode != "vector":
+            keyword_docs = keyword_search(state["question"], state.get("candidate_ids"))
+        return {"context": fuse(mode, vector_docs, keyword_docs)}
 
+    @timed("rag_retrieve")
+    async def aretrieve(state: State):
+        mode = get_mode(state)
+        if state.get("candidate_ids") == []:
+            return {"context": []}
+        expr = candidate_expr(state)
+
+        async def vector_search():
+            if mode == "keyword":
+                return []
+            # the tier checks the index versions of its scope in Postgres, which blocks
+            if await asyncio.to_thread(use_vector_tier, state):
+                query_vector = state.get("query_vector")
+                if query_vector is None:
+                    query_vector = await embedding_model.aembed_query(state["question"])
+                return vector_tier_search(query_vector, state["candidate_ids"])
+            if state.get("query_vector") is not None:
+                return await vector_store.asimilarity_search_with_score_by_vector(state["query_vector"], k=fetch_k, param=search_params, expr=expr)
+            return await vector_store.asimilarity_search_with_score(state["question"], k=fetch_k, param=search_params, expr=expr)
+
+        async def text_search():
+            if mode == "vector":
+                return []
+            return await asyncio.to_thread(keyword_search, state["question"], state.get("candidate_ids"))
+
+        vector_docs, keyword_docs = await asyncio.gather(vector_search(), text_search())
+        return {"context": fuse(mode, vector_docs, keyword_docs)}
+
+    def prompt_input(state: State) -> tuple[dict, dict]:
+        context, stats = build_context(state["context"], max_context_tokens, count_tokens)
+        return {"question": state["question"], "context": context}, stats
+
+    def record_usage(stats: dict, messages, response) -> dict:
+        stats["prompt_tokens"] = count_tokens(messages.to_string())
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            stats["llm_input_tokens"] = usage.get("input_tokens")
+            TOKENS.labels("llm_input").inc(usage.get("input_tokens") or 0)
+            TOKENS.labels("llm_output").inc(usage.get("output_tokens") or 0)
+        TOKENS.labels("prompt").inc(stats["prompt_tokens"])
+        TOKENS.labels("context").inc(stats["context_tokens"])
+        TOKENS.labels("unbudgeted_context").inc(stats["unbudgeted_context_tokens"])
+        CHUNKS.labels("retrieved").inc(stats["retrieved_chunks"])
+        CHUNKS.labels("packed").inc(stats["chunks"])
+        logger.info("RAG prompt: %d/%d chunks, context %d tokens (%d unbudgeted), prompt %d tokens",
+                    stats["chunks"], stats["retrieved_chunks"], stats["context_tokens"],
+                    stats["unbudgeted_context_tokens"], stats["prompt_tokens"])
+        return stats
+
+    @timed("rag_generate")
     def generate(state: State):
-        docs_content = "\n\n".join(
-            f'chunk: {doc.page_content}\nMetadata: {doc.metadata}' for doc in state["context"]
-        )
-        messages = prompt.invoke({"question": state["question"], "context": docs_content})
+        prompt_values, stats = prompt_input(state)
+        messages = prompt.invoke(prompt_values)
         response = llm.invoke(messages)
-        return {"answer": response.content}
+        return {"answer": response.content, "context_stats": record_usage(stats, messages, response)}
+
+    @timed("rag_generate")
+    async def agenerate(state: State):
+        prompt_values, stats = prompt_input(state)
+        messages = await prompt.ainvoke(prompt_values)
+        response = await llm.ainvoke(messages)
+        return {"answer": response.content, "context_stats": record_usage(stats, messages, response)}
+
+    @timed("rag_rerank")
+    def rerank(state: State):
+        answer, stats = reranker.rerank(state["question"], state["context"])
+        return {"answer": answer, "context_stats": stats}
+
+    @timed("rag_rerank")
+    async def arerank(state: State):
+        answer, stats = await reranker.arerank(state["question"], state["context"])
+        return {"answer": answer, "context_stats": stats}
 
-    graph_builder = StateGraph(State).add_sequence([retrieve, generate])
+    # each node has a sync and an async implementation so both graph.invoke and graph.ainvoke work
+    graph_builder = StateGraph(State).add_sequence([
+        ("retrieve", RunnableLambda(retrieve, afunc=aretrieve)),
+        ("rerank", RunnableLambda(rerank, afunc=arerank)) if reranker is not None
+        else ("generate", RunnableLambda(generate, afunc=agenerate)),
+    ])
     graph_builder.add_edge(START, "retrieve")
     return graph_builder.compile()
 
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+from app.services.keywordIndex import keyword_index
+from app.services.vectorTier import get_vector_tier
+from app.utils.environmentVariables import (
+    require_env_variables, EMBEDDING_MODEL, DB_NAME, RAG_CONTEXT_MAX_TOKENS,
+    RERANK_BATCH_SIZE, RERANK_MAX_CONCURRENCY, RERANK_TOKEN_BUDGET, RERANK_TIMEOUT_SECONDS,
+)
+
+LLM_MODEL = "gemini-2.0-flash"
+LLM_PROVIDER = "google_genai"
+
+
+class RAGGraphRegistry:
+    """
+    Process-level cache of compiled RAG graphs keyed by (collection, k, prompt, rerank_top_n).
+
+    The embedding model and chat model are shared by every graph, and each
+    collection gets a single Milvus vector store (and connection). langchain,
+    langgraph and the model clients are only imported when the first graph is built.
+    """
+    def __init__(self, db_name: str = DB_NAME):
+        self.db_name = db_name
+        self._lock = threading.Lock()
+        self._embedding_model = None
+        self._llm = None
+        self._vector_stores = {}
+        self._graphs = {}
+
+    @property
+    def embedding_model(self):
+        if self._embedding_model is None:
+            require_env_variables("embedding")
+            from langchain_ollama import OllamaEmbeddings
+            self._embedding_model = OllamaEmbeddings(model=EMBEDDING_MODEL)
+        return self._embedding_model
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            require_env_variables("rag")
+            from langchain.chat_models import init_chat_model
+            self._llm = init_chat_model(LLM_MODEL, model_provider=LLM_PROVIDER)
+        return self._llm
+
+    def get_vector_store(self, collection_name: str):
+        with self._lock:
+            vector_store = self._vector_stores.get(collection_name)
+            if vector_store is None:
+                require_env_variables("milvus")
+                from app.services.ragGraph import build_vector_store
+                vector_store = build_vector_store(self.db_name, collection_name, self.embedding_model)
+                self._vector_stores[collection_name] = vector_store
+            return vector_store
+
+    def get_graph(self, collection_name: str, k: int, prompt_template: str, rerank_top_n: int = None):
+        """With rerank_top_n the graph re-ranks the k retrieved chunks and `prompt_template` is the re-ranking prompt."""
+        key = (collection_name, k, prompt_template, rerank_top_n)
+        graph = self._graphs.get(key)
+        if graph is not None:
+            return graph
+
+        vector_store = self.get_vector_store(collection_name)
+        from app.services.ragGraph import build_rag_graph
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                reranker = None
+                if rerank_top_n is not None:
+                    from app.services.ragRerank import Reranker
+                    reranker = Reranker(self.llm,
+                                        prompt_template=prompt_template,
+                                        top_n=rerank_top_n,
+                                        batch_size=RERANK_BATCH_SIZE,
+                                        max_concurrency=RERANK_MAX_CONCURRENCY,
+                                        token_budget=RERANK_TOKEN_BUDGET,
+                                        timeout=RERANK_TIMEOUT_SECONDS,
+                                        max_context_tokens=RAG_CONTEXT_MAX_TOKENS,
+                                        )
+                vector_tier = get_vector_tier()
+                graph = build_rag_graph(db_name=self.db_name,
+                                        collection_name=collection_name,
+                                        embedding_model=self.embedding_model,
+                                        llm=self.llm,
+                                        prompt_template=prompt_template,
+                                        k=k,
+                                        vector_store=vector_store,
+                                        keyword_index=keyword_index,
+                                        max_context_tokens=RAG_CONTEXT_MAX_TOKENS,
+                                        vector_tier=vector_tier if vector_tier is not None and vector_tier.collection_name == collection_name else None,
+                                        reranker=reranker,
+                                        )
+                self._graphs[key] = graph
+            return graph
+
+    async def aget_graph(self, collection_name: str, k: int, prompt_template: str, rerank_top_n: int = None):
+        """get_graph() for request handlers: building a graph connects to Milvus and creates clients, so it runs in a thread."""
+        graph = self._graphs.get((collection_name, k, prompt_template, rerank_top_n))
+        if graph is not None:
+            return graph
+        return await asyncio.to_thread(self.get_graph, collection_name, k, prompt_template, rerank_top_n)
+
+    def close(self):
+        with self._lock:
+            for vector_store in self._vector_stores.values():
+                client = getattr(vector_store, "client", None)
+                if client is not None and hasattr(client, "close"):
+                    client.close()
+            self._graphs.clear()
+            self._vector_stores.clear()
+            self._llm = None
+            self._embedding_model = None
+
+
+rag_registry = RAGGraphRegistry()
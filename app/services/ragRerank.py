@@ -0,0 +1,254 @@
+"""
+LLM re-ranking of retrieved candidates.
+
+Candidates are scored in batches of structured-output calls that run in
+parallel up to `max_concurrency`, within a per-request token budget and
+deadline. Batches past the budget, or that time out or fail, keep their
+retrieval order instead, and malformed output is repaired locally rather than
+failing the request.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Callable, List
+
+from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import ValidationError
+
+from app.schemas.ragResponse import RAGRerankBatch, RAGRerankItem
+from app.services.ragContext import build_context, estimate_tokens
+from app.utils.jsonRepair import repair_json_items
+from app.utils.metrics import CHUNKS, TOKENS, RERANK_BATCHES
+
+logger = logging.getLogger(__name__)
+
+# reserved per candidate for the {candidate_id, score, reason} object the LLM writes
+OUTPUT_TOKENS_PER_CANDIDATE = 60
+
+DEFAULT_PROMPT_TEMPLATE = """
+Score how well each candidate below matches the question, from 0 (not relevant) to 100 (perfect match),
+and give a one sentence reason. Return one object with the keys "candidate_id", "score" and "reason"
+for every candidate, in a JSON object {{"data": [...]}}.
+
+Context: {context}
+Question: {question}
+"""
+
+FALLBACK_REASONS = {
+    "budget": "token budget exhausted",
+    "timeout": "timed out",
+    "error": "LLM call failed",
+    "missing": "missing from the LLM output",
+}
+
+
+def message_text(message) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+class Reranker:
+    """
+    Scores retrieved chunks per candidate with the LLM and returns the `top_n`
+    best as {candidate_id, reason, score} dicts. Candidates ranked by the LLM
+    come first, by score; a score of 0 drops the candidate. Candidates that
+    were not ranked follow in retrieval order, with the retrieval score of
+    their best chunk (the "score" metadata of the retrieved documents) instead.
+    """
+    def __init__(
+        self,
+        llm,
+        prompt_template: str = None,
+        top_n: int = 5,
+        batch_size: int = 5,
+        max_concurrency: int = 4,
+        token_budget: int = 8000,
+        timeout: float = 20.0,
+        max_context_tokens: int = 1500,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        self.llm = llm
+        self.prompt = ChatPromptTemplate.from_template(prompt_template or DEFAULT_PROMPT_TEMPLATE)
+        self.top_n = top_n
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.token_budget = token_budget
+        self.timeout = timeout
+        self.max_context_tokens = max_context_tokens
+        self.count_tokens = count_tokens
+        self._runnable = None
+        self._semaphore = None
+
+    @property
+    def runnable(self):
+        if self._runnable is None:
+            try:
+                self._runnable = self.llm.with_structured_output(RAGRerankBatch, include_raw=True)
+            except NotImplementedError:
+                # models without tool calling answer in text, which _parse repairs
+                self._runnable = self.llm
+        return self._runnable
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # shared by every request, so concurrent queries cannot exceed the limit together
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _plan(self, question: str, docs: List[Document]) -> list[dict]:
+        """
+        Splits the candidates, in retrieval order, into batches with their prompts.
+        Once a batch does not fit the token budget it and every later batch are skipped.
+        """
+        by_candidate = {}
+        for doc in docs:
+            by_candidate.setdefault(doc.metadata.get("candidate_id"), []).append(doc)
+        candidate_ids = list(by_candidate)
+
+        batches, used, exhausted = [], 0, False
+        for start in range(0, len(candidate_ids), self.batch_size):
+            ids = candidate_ids[start:start + self.batch_size]
+            context, stats = build_context([doc for i in ids for doc in by_candidate[i]], self.max_context_tokens, self.count_tokens)
+            prompt = self.prompt.invoke({"question": question, "context": context})
+            prompt_tokens = self.count_tokens(prompt.to_string())
+            cost = prompt_tokens + OUTPUT_TOKENS_PER_CANDIDATE * len(ids)
+            exhausted = exhausted or used + cost > self.token_budget
+            if not exhausted:
+                used += cost
+            batches.append({
+                "start": start,
+                "candidate_ids": ids,
+                "prompt": prompt,
+                "prompt_tokens": prompt_tokens,
+                "context_stats": stats,
+                "skip": "budget" if exhausted else None,
+                "items": [],
+                "repaired": False,
+            })
+        return batches
+
+    def _parse(self, output, candidate_ids: list[int]) -> tuple[list[RAGRerankItem], bool]:
+        """Valid items for the batch's candidates and whether the output needed repairs."""
+        if isinstance(output, dict):
+            raw = output["raw"]
+            if output.get("parsed") is not None:
+                items, repaired = [item.model_dump() for item in output["parsed"].data], False
+            elif raw.tool_calls:
+                items, _ = repair_json_items(json.dumps(raw.tool_calls[0]["args"]))
+                repaired = True
+            else:
+                items, _ = repair_json_items(message_text(raw))
+                repaired = True
+        else:
+            raw = output
+            items, repaired = repair_json_items(message_text(raw))
+
+        usage = getattr(raw, "usage_metadata", None)
+        if usage:
+            TOKENS.labels("llm_input").inc(usage.get("input_tokens") or 0)
+            TOKENS.labels("llm_output").inc(usage.get("output_tokens") or 0)
+
+        valid = {}
+        for item in items:
+            if isinstance(item.get("score"), (int, float)):
+                item["score"] = min(max(item["score"], 0), 100)
+            try:
+                parsed = RAGRerankItem.model_validate(item)
+            except ValidationError:
+                repaired = True
+                continue
+            if parsed.candidate_id not in candidate_ids:
+                repaired = True
+                continue
+            valid.setdefault(parsed.candidate_id, parsed)
+        return list(valid.values()), repaired
+
+    def _apply(self, batch: dict, output):
+        if isinstance(output, TimeoutError):
+            batch["skip"] = "timeout"
+        elif isinstance(output, Exception):
+            logger.warning("Re-ranking batch failed: %s", output)
+            batch["skip"] = "error"
+        else:
+            batch["items"], batch["repaired"] = self._parse(output, batch["candidate_ids"])
+
+    def _merge(self, docs: List[Document], batches: list[dict]) -> tuple[list[dict], dict]:
+        ranked, fallback = [], []
+        retrieval_scores = {}
+        for doc in docs:
+            candidate_id, score = doc.metadata.get("candidate_id"), doc.metadata.get("score")
+            if score is not None:
+                retrieval_scores[candidate_id] = max(score, retrieval_scores.get(candidate_id, score))
+        stats = {"prompt_tokens": 0, "batches": len(batches), "fallback_batches": 0, "repaired_batches": 0,
+                 "chunks": 0, "retrieved_chunks": len(docs), "context_tokens": 0, "unbudgeted_context_tokens": 0}
+        for batch in batches:
+            RERANK_BATCHES.labels(batch["skip"] or ("repaired" if batch["repaired"] else "ok")).inc()
+            if batch["skip"] != "budget":
+                # timed out and failed calls were still sent
+                stats["prompt_tokens"] += batch["prompt_tokens"]
+            if batch["skip"] is not None:
+                stats["fallback_batches"] += 1
+                fallback += [(batch["start"] + i, candidate_id, batch["skip"]) for i, candidate_id in enumerate(batch["candidate_ids"])]
+                continue
+            stats["repaired_batches"] += batch["repaired"]
+            for key in ("chunks", "context_tokens", "unbudgeted_context_tokens"):
+                stats[key] += batch["context_stats"][key]
+            scored = {item.candidate_id: item for item in batch["items"]}
+            for i, candidate_id in enumerate(batch["candidate_ids"]):
+                item = scored.get(candidate_id)
+                if item is None:
+                    fallback.append((batch["start"] + i, candidate_id, "missing"))
+                elif item.score > 0:
+                    ranked.append((-item.score, batch["start"] + i, item))
+
+        results = [{"candidate_id": item.candidate_id, "reason": item.reason, "score": item.score} for *_, item in sorted(ranked, key=lambda r: r[:2])]
+        results += [
+            {"candidate_id": candidate_id, "reason": f"Retrieved by similarity search, not re-ranked ({FALLBACK_REASONS[cause]}).",
+             "score": retrieval_scores.get(candidate_id)}
+            for _, candidate_id, cause in sorted(fallback)
+        ]
+
+        TOKENS.labels("prompt").inc(stats["prompt_tokens"])
+        TOKENS.labels("context").inc(stats["context_tokens"])
+        TOKENS.labels("unbudgeted_context").inc(stats["unbudgeted_context_tokens"])
+        CHUNKS.labels("retrieved").inc(stats["retrieved_chunks"])
+        CHUNKS.labels("packed").inc(stats["chunks"])
+        logger.info("RAG re-rank: %d batches (%d fell back, %d repaired), prompt %d tokens",
+                    stats["batches"], stats["fallback_batches"], stats["repaired_batches"], stats["prompt_tokens"])
+        return results[:self.top_n], stats
+
+    def rerank(self, question: str, docs: List[Document]) -> tuple[list[dict], dict]:
+        """Sync variant: batches run one after another, and the deadline is only checked between them."""
+        batches = self._plan(question, docs)
+        deadline = time.monotonic() + self.timeout
+        for batch in batches:
+            if batch["skip"] is not None:
+                continue
+            if time.monotonic() >= deadline:
+                batch["skip"] = "timeout"
+                continue
+            try:
+                output = self.runnable.invoke(batch["prompt"])
+            except Exception as e:
+                output = e
+            self._apply(batch, output)
+        return self._merge(docs, batches)
+
+    async def arerank(self, question: str, docs: List[Document]) -> tuple[list[dict], dict]:
+        batches = self._plan(question, docs)
+
+        async def call(batch: dict):
+            async with self.semaphore:
+                return await self.runnable.ainvoke(batch["prompt"])
+
+        pending = [batch for batch in batches if batch["skip"] is None]
+        # one deadline for the whole request, including time spent waiting for the semaphore
+        outputs = await asyncio.gather(*(asyncio.wait_for(call(batch), self.timeout) for batch in pending), return_exceptions=True)
+        for batch, output in zip(pending, outputs):
+            self._apply(batch, output)
+        return self._merge(docs, batches)
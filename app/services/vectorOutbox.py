@@ -0,0 +1,291 @@
+"""
+Transactional outbox between Postgres and Milvus.
+
+Write endpoints record which job orders and candidates changed in the
+`vector_outbox` table, in the same transaction as the change itself. The
+relay then brings Milvus, the keyword index and the upload directory in line
+with what Postgres holds for those entities, in batches. Repair drift between
+the stores (e.g. rows written before the outbox existed) with:
+
+    python -m app.services.vectorOutbox --reconcile
+    python -m app.services.vectorOutbox --reconcile --dry-run
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session
+
+from app.models.postgresModel import VectorOutbox, JobOrder, Candidate
+from app.schemas.jobOrderSchema import JobOrderMilvus
+from app.services.ingestionWorker import ingestion_queue
+from app.services.keywordIndex import keyword_index
+from app.services.milvusDBConnection import upsert_many_in_milvus, delete_many_from_milvus, iterate_milvus
+from app.services.postgresDBConnection import sessionLocal
+from app.services.ragCache import rag_cache
+from app.utils.environmentVariables import OUTBOX_BATCH_SIZE, OUTBOX_RETRY_BACKOFF, OUTBOX_MAX_RETRY_DELAY, OUTBOX_POLL_INTERVAL
+from app.utils.metrics import timed, OUTBOX_OPERATIONS
+from app.utils.vectorEmbedding import get_embeddings
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+UPLOAD_DIR = "app/uploads"
+MAX_BACKOFF_SECONDS = 60
+JOB_ORDER_SYNC_PASSES = 3
+
+
+class VectorOutboxService:
+    """Records changed entities; commit them together with the change they describe."""
+    def __init__(self, db: Session):
+        self.db = db
+
+    def add(self, collection: str, entity_ids: list[int], operation: str):
+        self.db.add_all(VectorOutbox(collection=collection, entity_id=entity_id, operation=operation) for entity_id in entity_ids)
+
+
+def sync_job_orders(db: Session, job_order_ids: list[int]):
+    """
+    Upserts the vector of every job order that still exists and deletes the others.
+    Rows are read without locks, so updates never wait on the embedding and Milvus
+    calls. Versions are read again after the write: a job order that changed or was
+    deleted meanwhile may have been synced by a relay handling the newer change
+    before this older write landed, so it is synced again.
+    """
+    pending = sorted(set(job_order_ids))
+    for _ in range(JOB_ORDER_SYNC_PASSES):
+        rows = db.execute(select(JobOrder.id, JobOrder.job_description, JobOrder.version).where(JobOrder.id.in_(pending))).all()
+        if rows:
+            vectors = get_embeddings([row.job_description for row in rows])
+            upsert_many_in_milvus(
+                [JobOrderMilvus(id=row.id, vector=vector, text=row.job_description) for row, vector in zip(rows, vectors)],
+                "job_orders",
+            )
+        synced = {row.id: row.version for row in rows}
+        delete_many_from_milvus([job_order_id for job_order_id in pending if job_order_id not in synced], "job_orders", id_col="id")
+
+        current = dict(db.execute(select(JobOrder.id, JobOrder.version).where(JobOrder.id.in_(list(synced)))).all()) if synced else {}
+        pending = [job_order_id for job_order_id, version in synced.items() if current.get(job_order_id) != version]
+        if not pending:
+            return
+    raise RuntimeError(f"Job orders {pending} kept changing while they were synced")
+
+
+def sync_candidates(db: Session, candidate_ids: list[int]):
+    """
+    Removes the vectors, keyword index entries and resume of deleted candidates.
+    Existing candidates are indexed by the ingestion workers.
+    """
+    existing = set(db.execute(select(Candidate.id).where(Candidate.id.in_(candidate_ids))).scalars())
+    deleted = sorted(set(candidate_ids) - existing)
+    if not deleted:
+        return
+    delete_many_from_milvus(deleted, "candidates", id_col="candidate_id")
+    for candidate_id in deleted:
+        keyword_index.delete_candidate(candidate_id)
+        file_path = os.path.join(UPLOAD_DIR, f"{candidate_id}.pdf")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    rag_cache.invalidate()
+
+
+SYNC_HANDLERS = {"job_orders": sync_job_orders, "candidates": sync_candidates}
+
+
+def retry_delay(attempts: int) -> float:
+    return min(OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1), OUTBOX_MAX_RETRY_DELAY)
+
+
+def sync_entities(db: Session, collection: str, entity_ids: list[int]) -> Exception:
+    """Runs the collection's handler; returns its error instead of raising it."""
+    try:
+        SYNC_HANDLERS[collection](db, entity_ids)
+    except Exception as e:
+        return e
+    return None
+
+
+def defer_entries(db: Session, entries: list, error: Exception):
+    attempts = max(entry.attempts for entry in entries) + 1
+    logger.warning("Outbox entries for %s %s failed (attempt %d): %s", entries[0].collection, entries[0].entity_id, attempts, error)
+    db.execute(
+        update(VectorOutbox)
+        .where(VectorOutbox.id.in_([entry.id for entry in entries]))
+        .values(attempts=attempts, error=str(error)[:2000], available_at=time.time() + retry_delay(attempts))
+    )
+
+
+@timed("outbox_relay")
+def relay_batch(session_factory=sessionLocal, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Applies the oldest `batch_size` due entries and returns how many were handled.
+    Entries only name an entity, and the handler syncs its current Postgres state,
+    so repeated entries for one entity collapse into a single write and replays
+    are harmless. Each collection is synced in one call; when that fails its
+    entities are synced one by one, and only the entries of entities that still
+    fail are kept, to be retried with exponential backoff. Rows locked by a relay
+    in another process are skipped, so relays share the work.
+    """
+    db = session_factory()
+    try:
+        entries = db.execute(
+            select(VectorOutbox)
+            .where(VectorOutbox.status == PENDING, VectorOutbox.available_at <= time.time())
+            .order_by(VectorOutbox.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not entries:
+            db.rollback()
+            return 0
+
+        groups = defaultdict(lambda: defaultdict(list))
+        for entry in entries:
+            groups[entry.collection][entry.entity_id].append(entry)
+        applied, failed = [], []
+        for collection, entries_by_entity in groups.items():
+            error = sync_entities(db, collection, list(entries_by_entity))
+            for entity_id, entity_entries in entries_by_entity.items():
+                if error is not None and len(entries_by_entity) > 1:
+                    entity_error = sync_entities(db, collection, [entity_id])
+                else:
+                    entity_error = error
+                if entity_error is None:
+                    applied += entity_entries
+                else:
+                    failed.append((entity_entries, entity_error))
+
+        db.execute(delete(VectorOutbox).where(VectorOutbox.id.in_([entry.id for entry in applied])))
+        for entity_entries, error in failed:
+            defer_entries(db, entity_entries, error)
+        db.commit()
+        for entry in applied:
+            OUTBOX_OPERATIONS.labels(entry.collection, entry.operation, "applied").inc()
+        for entity_entries, _ in failed:
+            for entry in entity_entries:
+                OUTBOX_OPERATIONS.labels(entry.collection, entry.operation, "error").inc()
+        return len(entries)
+    finally:
+        db.close()
+
+
+class OutboxRelay:
+    """Background asyncio task draining the outbox; notify() wakes it early and is safe from any thread."""
+    def __init__(self, session_factory=sessionLocal, batch_size: int = OUTBOX_BATCH_SIZE, poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._loop = None
+        self._wakeup = None
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        self._stopping = False
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def notify(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        failures = 0
+        while not self._stopping:
+            # cleared before the batch, so entries committed while it runs are picked up right after
+            self._wakeup.clear()
+            try:
+                handled = await asyncio.to_thread(relay_batch, self.session_factory, self.batch_size)
+                failures = 0
+            except Exception:
+                logger.exception("Outbox relay batch failed")
+                failures += 1
+                handled = 0
+            if handled == self.batch_size:
+                continue
+            timeout = min(self.poll_interval * 2 ** failures, MAX_BACKOFF_SECONDS) if failures else self.poll_interval
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self, timeout: float = 30.0):
+        self._stopping = True
+        self.notify()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+        self._task = None
+        self._loop = None
+
+
+outbox_relay = OutboxRelay()
+
+
+def find_drift(db: Session) -> dict:
+    """Compares Postgres with Milvus and returns the entity ids that disagree."""
+    job_order_texts = dict(db.execute(select(JobOrder.id, JobOrder.job_description)).all())
+    milvus_job_orders = {row["id"]: row["text"] for row in iterate_milvus("id >= 0", "job_orders", ["id", "text"])}
+    candidate_ids = set(db.execute(select(Candidate.id)).scalars())
+    milvus_candidate_ids = {row["candidate_id"] for row in iterate_milvus("candidate_id >= 0", "candidates", ["candidate_id"])}
+    return {
+        "job_orders_missing": sorted(set(job_order_texts) - set(milvus_job_orders)),
+        "job_orders_stale": sorted(i for i, text in job_order_texts.items() if i in milvus_job_orders and milvus_job_orders[i] != text),
+        "job_orders_orphaned": sorted(set(milvus_job_orders) - set(job_order_texts)),
+        "candidates_unindexed": sorted(candidate_ids - milvus_candidate_ids),
+        "candidates_orphaned": sorted(milvus_candidate_ids - candidate_ids),
+    }
+
+
+def reconcile(db: Session, drift: dict) -> dict:
+    """Queues outbox entries for drifted job orders and orphaned candidates, and ingestion jobs for unindexed candidates."""
+    outbox = VectorOutboxService(db)
+    outbox.add("job_orders", drift["job_orders_missing"] + drift["job_orders_stale"] + drift["job_orders_orphaned"], "reconcile")
+    outbox.add("candidates", drift["candidates_orphaned"], "reconcile")
+    db.commit()
+
+    queued, without_resume = 0, []
+    for candidate_id in drift["candidates_unindexed"]:
+        file_path = os.path.join(UPLOAD_DIR, f"{candidate_id}.pdf")
+        if os.path.exists(file_path):
+            ingestion_queue.enqueue(candidate_id, file_path)
+            queued += 1
+        else:
+            without_resume.append(candidate_id)
+    return {"ingestion_jobs": queued, "candidates_without_resume": without_resume}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reconcile", action="store_true", help="compare Postgres with Milvus and queue repairs")
+    parser.add_argument("--dry-run", action="store_true", help="only report the drift")
+    args = parser.parse_args()
+
+    if args.reconcile:
+        db = sessionLocal()
+        try:
+            drift = find_drift(db)
+            for key, ids in drift.items():
+                print(f"{key}: {len(ids)}")
+            if not args.dry_run:
+                result = reconcile(db, drift)
+                relayed = 0
+                while handled := relay_batch():
+                    relayed += handled
+                retrying = db.execute(select(func.count()).select_from(VectorOutbox).where(VectorOutbox.attempts > 0)).scalar()
+                print(f"Relayed {relayed} outbox entries ({retrying} failed and will be retried), queued {result['ingestion_jobs']} ingestion jobs")
+                for candidate_id in result["candidates_without_resume"]:
+                    print(f"candidate {candidate_id} has no vectors and no resume file")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
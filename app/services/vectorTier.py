@@ -0,0 +1,525 @@
+"""
+Local hot tier in front of the Milvus `candidates` collection.
+
+Chunk vectors are kept in one memory-mapped matrix on local disk (float32, or
+quantized to float16/int8) and are written by the same calls that write
+Milvus. Searches restricted to a set of candidates, such as a job order's
+applicants, are exact NumPy top-k over a cached contiguous matrix of only
+those rows, so they never touch the network.
+
+Milvus stays the source of truth: every write of a candidate's chunks bumps
+the candidate's index version in Postgres, and the tier records the version it
+mirrored. Before a scope is served from the tier the versions are compared (at
+most every VECTOR_TIER_VERIFY_INTERVAL seconds per scope), and a scope written
+by a process that does not mirror to this tier is searched in Milvus instead.
+
+The tier is off unless VECTOR_TIER_ENABLED is set, and serves searches once it
+has been loaded from Milvus:
+
+    python -m app.services.vectorTier --rebuild
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from app.services.milvusIndex import get_index_config
+from app.utils.environmentVariables import VECTOR_TIER_ENABLED, VECTOR_TIER_PATH, VECTOR_TIER_DTYPE, VECTOR_TIER_SCOPE_CACHE, VECTOR_TIER_VERIFY_INTERVAL
+from app.utils.exceptions import VectorTierConfigError
+from app.utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+INITIAL_CAPACITY = 1024
+SEARCH_BLOCK = 65536
+# slots of deleted rows are reclaimed once they outnumber the live rows
+COMPACT_MIN_DEAD = 4096
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the stored rows and their per-row scales (symmetric int8, 1.0 otherwise)."""
+    if dtype != "int8":
+        return vectors.astype(DTYPES[dtype]), np.ones(len(vectors), dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def dequantize(stored: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    vectors = stored.astype(np.float32)
+    if stored.dtype == np.int8:
+        vectors *= scales[:, None]
+    return vectors
+
+
+def grow(array: np.ndarray, size: int, fill) -> np.ndarray:
+    grown = np.full(size, fill, dtype=array.dtype)
+    grown[:len(array)] = array[:size]
+    return grown
+
+
+class VectorTier:
+    """
+    Vectors live in `vectors-<id>.bin`, one row per slot; primary key,
+    candidate_id, slot, text and quantization scale of every row are in a SQLite
+    table next to it. Several processes can share a tier: writes take SQLite's
+    write lock and other processes reload when the database changed.
+
+    `fetch_versions(candidate_ids)` returns the current index version of those
+    candidates (of every candidate for None); without it every scope of a ready
+    tier is served.
+    """
+    def __init__(self, path: str, collection_name: str = "candidates", dtype: str = "float32", scope_cache_size: int = 32,
+                 fetch_versions=None, verify_interval: float = 1.0):
+        if dtype not in DTYPES:
+            raise VectorTierConfigError(name="VectorTierConfigError", message=f"Unknown vector tier dtype {dtype}, expected one of {', '.join(DTYPES)}")
+        self.path = path
+        self.collection_name = collection_name
+        self.dtype = dtype
+        self.scope_cache_size = scope_cache_size
+        self.fetch_versions = fetch_versions
+        self.verify_interval = verify_interval
+        self._lock = threading.RLock()
+        self._scopes = OrderedDict()
+        self._verified = OrderedDict()
+        # bumped by every load and write, so a scope verified against an older state is checked again
+        self._generation = 0
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "rows.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows (pk INTEGER PRIMARY KEY, candidate_id INTEGER NOT NULL, "
+            "slot INTEGER NOT NULL, text TEXT NOT NULL, scale REAL NOT NULL, norm REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_rows_candidate_id ON rows (candidate_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS versions (candidate_id INTEGER PRIMARY KEY, version INTEGER NOT NULL)")
+        self._version = None
+        with self._lock:
+            stored_dtype = self._get_meta("dtype")
+            if stored_dtype is not None and stored_dtype != dtype:
+                logger.warning("Vector tier at %s holds %s vectors, clearing it for %s", path, stored_dtype, dtype)
+                self._remove_file(self._write(self._reset))
+            self._load()
+
+    def _get_meta(self, key: str):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        """Reads the row table and maps the vector file; also used after another process wrote."""
+        self._version = self._data_version()
+        self._dim = int(self._get_meta("dim") or 0)
+        self._slots = int(self._get_meta("slots") or 0)
+        self._ready = self._get_meta("ready") == "1"
+        self._vector_file = self._get_meta("file")
+        self._map()
+        capacity = max(self._capacity, self._slots)
+        self._pks = np.full(capacity, -1, dtype=np.int64)
+        self._candidates = np.full(capacity, -1, dtype=np.int64)
+        self._scales = np.ones(capacity, dtype=np.float32)
+        self._norms = np.zeros(capacity, dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._slot_by_pk = {}
+        self._slots_by_candidate = defaultdict(list)
+        for pk, candidate_id, slot, scale, norm in self._conn.execute("SELECT pk, candidate_id, slot, scale, norm FROM rows"):
+            self._set_slot(slot, pk, candidate_id, scale, norm)
+        self._versions = dict(self._conn.execute("SELECT candidate_id, version FROM versions"))
+        self._scopes.clear()
+        self._verified.clear()
+        self._generation += 1
+
+    def _map(self):
+        self._vectors, self._capacity = None, 0
+        if self._dim and self._vector_file and os.path.exists(self._file(self._vector_file)):
+            row_bytes = self._dim * np.dtype(DTYPES[self.dtype]).itemsize
+            self._capacity = os.path.getsize(self._file(self._vector_file)) // row_bytes
+            if self._capacity:
+                self._vectors = np.memmap(self._file(self._vector_file), dtype=DTYPES[self.dtype], mode="r+", shape=(self._capacity, self._dim))
+
+    def _refresh(self):
+        if self._version is not None and self._data_version() != self._version:
+            self._load()
+
+    def _set_slot(self, slot: int, pk: int, candidate_id: int, scale: float, norm: float):
+        self._pks[slot], self._candidates[slot], self._scales[slot], self._norms[slot] = pk, candidate_id, scale, norm
+        self._alive[slot] = True
+        self._slot_by_pk[pk] = slot
+        self._slots_by_candidate[candidate_id].append(slot)
+
+    def _ensure_capacity(self, size: int):
+        if size <= self._capacity:
+            return
+        capacity = max(INITIAL_CAPACITY, 2 * self._capacity, size)
+        if self._vector_file is None:
+            self._vector_file = f"vectors-{uuid.uuid4().hex}.bin"
+            self._set_meta("file", self._vector_file)
+        if self._vectors is not None:
+            self._vectors.flush()
+        with open(self._file(self._vector_file), "ab") as f:
+            f.truncate(capacity * self._dim * np.dtype(DTYPES[self.dtype]).itemsize)
+        self._map()
+        self._pks = grow(self._pks, capacity, -1)
+        self._candidates = grow(self._candidates, capacity, -1)
+        self._scales = grow(self._scales, capacity, 1.0)
+        self._norms = grow(self._norms, capacity, 0.0)
+        self._alive = grow(self._alive, capacity, False)
+
+    def _write(self, operation, *args):
+        """Runs `operation` in one SQLite write transaction; in-memory state is reloaded if it fails."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                result = operation(*args)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._load()
+                raise
+            self._version = self._data_version()
+            self._scopes.clear()
+            self._verified.clear()
+            self._generation += 1
+            return result
+
+    def _append(self, pks: list[int], candidate_ids: list[int], texts: list[str], vectors: np.ndarray):
+        if not self._dim:
+            self._dim = vectors.shape[1]
+            self._set_meta("dim", self._dim)
+            self._set_meta("dtype", self.dtype)
+        # a row delivered twice (by a rebuild and the write it raced with) replaces the earlier copy
+        self._drop([pk for pk in pks if pk in self._slot_by_pk])
+        start = self._slots
+        self._ensure_capacity(start + len(pks))
+        stored, scales = quantize(vectors, self.dtype)
+        norms = np.linalg.norm(dequantize(stored, scales), axis=1)
+        self._vectors[start:start + len(pks)] = stored
+        for offset, (pk, candidate_id) in enumerate(zip(pks, candidate_ids)):
+            self._set_slot(start + offset, pk, candidate_id, float(scales[offset]), float(norms[offset]))
+        self._conn.executemany(
+            "INSERT INTO rows (pk, candidate_id, slot, text, scale, norm) VALUES (?, ?, ?, ?, ?, ?)",
+            [(int(pk), int(candidate_id), start + offset, text, float(scales[offset]), float(norms[offset]))
+             for offset, (pk, candidate_id, text) in enumerate(zip(pks, candidate_ids, texts))],
+        )
+        self._slots = start + len(pks)
+        self._set_meta("slots", self._slots)
+
+    def _drop(self, pks: list[int]) -> int:
+        slots = [self._slot_by_pk.pop(pk) for pk in pks if pk in self._slot_by_pk]
+        for slot in slots:
+            candidate_id = int(self._candidates[slot])
+            self._slots_by_candidate[candidate_id].remove(slot)
+            if not self._slots_by_candidate[candidate_id]:
+                del self._slots_by_candidate[candidate_id]
+            self._alive[slot] = False
+            self._candidates[slot] = -1
+        self._conn.executemany("DELETE FROM rows WHERE pk = ?", [(int(pk),) for pk in pks])
+        return len(slots)
+
+    def _compact(self):
+        """Rewrites the live rows into a new file without the slots of deleted rows."""
+        live = np.flatnonzero(self._alive[:self._slots])
+        old_file, old_vectors = self._vector_file, self._vectors
+        self._vector_file, self._vectors, self._capacity = f"vectors-{uuid.uuid4().hex}.bin", None, 0
+        self._set_meta("file", self._vector_file)
+        pks, candidates = self._pks[live], self._candidates[live]
+        scales, norms = self._scales[live], self._norms[live]
+        self._pks[:], self._alive[:] = -1, False
+        self._slots = 0
+        self._ensure_capacity(len(live))
+        for start in range(0, len(live), SEARCH_BLOCK):
+            block = live[start:start + SEARCH_BLOCK]
+            self._vectors[start:start + len(block)] = old_vectors[block]
+        self._slot_by_pk, self._slots_by_candidate = {}, defaultdict(list)
+        for slot, (pk, candidate_id, scale, norm) in enumerate(zip(pks.tolist(), candidates.tolist(), scales, norms)):
+            self._set_slot(slot, pk, candidate_id, scale, norm)
+        self._conn.executemany("UPDATE rows SET slot = ? WHERE pk = ?", [(slot, pk) for slot, pk in enumerate(pks.tolist())])
+        self._slots = len(live)
+        self._set_meta("slots", self._slots)
+        return old_file
+
+    def _reset(self):
+        old_file = self._get_meta("file")
+        self._conn.execute("DELETE FROM rows")
+        self._conn.execute("DELETE FROM meta")
+        self._conn.execute("DELETE FROM versions")
+        self._dim, self._slots, self._ready, self._vector_file = 0, 0, False, None
+        self._map()
+        self._load_empty()
+        return old_file
+
+    def _load_empty(self):
+        self._pks = np.full(0, -1, dtype=np.int64)
+        self._candidates = np.full(0, -1, dtype=np.int64)
+        self._scales = np.ones(0, dtype=np.float32)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._slot_by_pk = {}
+        self._slots_by_candidate = defaultdict(list)
+        self._versions = {}
+
+    def _set_versions(self, versions: dict):
+        self._versions.update(versions)
+        self._conn.executemany("INSERT OR REPLACE INTO versions (candidate_id, version) VALUES (?, ?)",
+                               [(int(candidate_id), int(version)) for candidate_id, version in versions.items()])
+
+    def _remove_file(self, name: str):
+        if name and name != self._vector_file:
+            try:
+                os.remove(self._file(name))
+            except OSError:
+                # still mapped by another process on platforms that refuse to unlink it
+                logger.warning("Could not remove old vector tier file %s", name)
+
+    @property
+    def ready(self) -> bool:
+        """True once the tier has been loaded from Milvus and has not failed to mirror a write since."""
+        with self._lock:
+            self._refresh()
+            return self._ready
+
+    def serves(self, candidate_ids: list[int]) -> bool:
+        """
+        True when the tier is ready and mirrored the current index version of
+        every candidate in `candidate_ids`; a deleted candidate must have no rows
+        left. A scope that matched is trusted for `verify_interval` seconds,
+        until the tier is written.
+        """
+        key = tuple(sorted(set(int(i) for i in candidate_ids)))
+        with self._lock:
+            self._refresh()
+            if not self._ready:
+                return False
+            if self.fetch_versions is None:
+                return True
+            generation = self._generation
+            verified_at = self._verified.get(key)
+            if verified_at is not None and time.monotonic() - verified_at < self.verify_interval:
+                return True
+            held = {candidate_id: self._versions.get(candidate_id, 0) for candidate_id in key}
+            with_rows = {candidate_id for candidate_id in key if candidate_id in self._slots_by_candidate}
+        current = self.fetch_versions(list(key))
+        stale = [candidate_id for candidate_id in key
+                 if (current[candidate_id] != held[candidate_id] if candidate_id in current else candidate_id in with_rows)]
+        if stale:
+            logger.info("Vector tier is behind Milvus for %d of %d candidates in a scope, searching Milvus", len(stale), len(key))
+            return False
+        with self._lock:
+            if generation == self._generation:
+                self._verified[key] = time.monotonic()
+                self._verified.move_to_end(key)
+                if len(self._verified) > self.scope_cache_size:
+                    self._verified.popitem(last=False)
+        return True
+
+    def add(self, pks: list[int], rows: list[dict]):
+        """Mirrors rows {"candidate_id", "text", "vector"} written to Milvus under primary keys `pks`."""
+        if not rows:
+            return
+        vectors = np.asarray([row["vector"] for row in rows], dtype=np.float32)
+        self._write(self._append, [int(pk) for pk in pks], [row["candidate_id"] for row in rows], [row["text"] for row in rows], vectors)
+
+    def record_versions(self, versions: dict):
+        """Records the index version {candidate_id: version} of candidates whose writes were mirrored."""
+        if versions:
+            self._write(self._set_versions, versions)
+
+    def delete(self, ids: list[int], field: str = "candidate_id") -> int:
+        """Removes rows by candidate_id, or by primary key for any other `field`."""
+        def operation():
+            if field == "candidate_id":
+                pks = [int(self._pks[slot]) for candidate_id in ids for slot in self._slots_by_candidate.get(int(candidate_id), [])]
+            else:
+                pks = [int(pk) for pk in ids]
+            deleted = self._drop(pks)
+            dead = self._slots - len(self._slot_by_pk)
+            old_file = self._compact() if dead > max(COMPACT_MIN_DEAD, len(self._slot_by_pk)) else None
+            return deleted, old_file
+
+        deleted, old_file = self._write(operation)
+        self._remove_file(old_file)
+        return deleted
+
+    def rebuild(self, rows, primary_key: str = "pk", versions: dict = None, batch_size: int = 10000) -> int:
+        """
+        Replaces the tier with `rows` of {primary_key, "candidate_id", "text",
+        "vector"} at the index `versions` {candidate_id: version} read before
+        them, and marks it ready.
+        """
+        def operation():
+            old_file = self._reset()
+            self._set_versions(versions or {})
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    self._append_rows(batch, primary_key)
+                    batch = []
+            self._append_rows(batch, primary_key)
+            self._set_meta("ready", 1)
+            self._ready = True
+            return old_file
+
+        old_file = self._write(operation)
+        self._remove_file(old_file)
+        return len(self._slot_by_pk)
+
+    def _append_rows(self, rows: list[dict], primary_key: str):
+        if rows:
+            vectors = np.asarray([row["vector"] for row in rows], dtype=np.float32)
+            self._append([row[primary_key] for row in rows], [row["candidate_id"] for row in rows], [row["text"] for row in rows], vectors)
+
+    def invalidate(self):
+        """Stops serving searches until the next rebuild, e.g. after a write could not be mirrored."""
+        def operation():
+            self._set_meta("ready", 0)
+            self._ready = False
+        self._write(operation)
+
+    def _scope(self, candidate_ids: list[int]) -> tuple:
+        """Slots, float32 matrix, norms, primary keys and candidate ids of the rows of `candidate_ids`."""
+        key = tuple(sorted(set(int(i) for i in candidate_ids)))
+        scope = self._scopes.get(key)
+        if scope is not None:
+            self._scopes.move_to_end(key)
+            return scope
+        slots = np.array(sorted(slot for candidate_id in key for slot in self._slots_by_candidate.get(candidate_id, [])), dtype=np.int64)
+        if len(slots):
+            matrix = dequantize(self._vectors[slots], self._scales[slots])
+        else:
+            matrix = np.empty((0, self._dim), dtype=np.float32)
+        scope = (matrix, self._norms[slots], self._pks[slots], self._candidates[slots])
+        self._scopes[key] = scope
+        if len(self._scopes) > self.scope_cache_size:
+            self._scopes.popitem(last=False)
+        return scope
+
+    def _scores(self, queries: np.ndarray, candidate_ids: list[int] = None) -> tuple:
+        with self._lock:
+            self._refresh()
+            if candidate_ids is not None:
+                matrix, norms, pks, candidates = self._scope(candidate_ids)
+                return matrix @ queries.T if len(matrix) else np.empty((0, len(queries)), dtype=np.float32), norms, pks, candidates
+            slots = np.flatnonzero(self._alive[:self._slots])
+            vectors, scales = self._vectors, self._scales[slots]
+            norms, pks, candidates = self._norms[slots], self._pks[slots], self._candidates[slots]
+        # a full scan runs outside the lock, on the mapping taken above, in blocks to bound memory
+        dots = np.empty((len(slots), len(queries)), dtype=np.float32)
+        for start in range(0, len(slots), SEARCH_BLOCK):
+            block = slots[start:start + SEARCH_BLOCK]
+            dots[start:start + len(block)] = dequantize(vectors[block], scales[start:start + len(block)]) @ queries.T
+        return dots, norms, pks, candidates
+
+    @timed("vector_tier_search")
+    def search(self, vectors: list[list[float]], limit: int, candidate_ids: list[int] = None,
+               output_fields: list[str] = ("candidate_id",)) -> list[list[dict]]:
+        """
+        Exact top-`limit` search, optionally restricted to `candidate_ids`, with
+        the collection's metric. Returns hits shaped like search_milvus().
+        """
+        metric_type = get_index_config(self.collection_name).metric_type
+        queries = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        dots, norms, pks, candidates = self._scores(queries, candidate_ids)
+        query_norms = np.linalg.norm(queries, axis=1)
+
+        results, texts = [], {}
+        for column, query_norm in enumerate(query_norms):
+            if metric_type == "L2":
+                distances = np.maximum(norms ** 2 - 2 * dots[:, column] + query_norm ** 2, 0)
+                order = distances
+            else:
+                distances = dots[:, column] if metric_type == "IP" else dots[:, column] / np.maximum(norms * query_norm, 1e-12)
+                order = -distances
+            k = min(limit, len(order))
+            top = np.argpartition(order, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+            top = top[np.argsort(order[top], kind="stable")]
+            results.append([
+                {"id": int(pks[i]), "distance": float(distances[i]), "candidate_id": int(candidates[i])}
+                for i in top
+            ])
+        if "text" in output_fields:
+            wanted = list({hit["id"] for hits in results for hit in hits})
+            with self._lock:
+                for start in range(0, len(wanted), 500):
+                    batch = wanted[start:start + 500]
+                    texts.update(self._conn.execute(f"SELECT pk, text FROM rows WHERE pk IN ({', '.join('?' * len(batch))})", batch).fetchall())
+            for hits in results:
+                for hit in hits:
+                    hit["text"] = texts.get(hit["id"])
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            self._conn.close()
+
+
+def candidate_index_versions(candidate_ids: list[int] = None) -> dict[int, int]:
+    from app.services.postgresDBConnection import sessionLocal
+    from app.services.postgresServices import CandidateIndexService
+    db = sessionLocal()
+    try:
+        return CandidateIndexService(db).versions(candidate_ids)
+    finally:
+        db.close()
+
+
+def load_from_milvus(vector_tier: VectorTier) -> int:
+    """Rebuilds `vector_tier` from its Milvus collection and returns the number of chunks loaded."""
+    from app.services.milvusDBConnection import iterate_milvus, primary_key_field
+    # read before the scan, so a write racing the rebuild leaves its candidate at an older version than Postgres
+    versions = vector_tier.fetch_versions() if vector_tier.fetch_versions is not None else {}
+    primary_key = primary_key_field(vector_tier.collection_name)
+    rows = iterate_milvus(f"{primary_key} >= 0", vector_tier.collection_name, [primary_key, "candidate_id", "text", "vector"])
+    return vector_tier.rebuild(rows, primary_key, versions)
+
+
+_tier_lock = threading.Lock()
+_vector_tier = None
+
+def get_vector_tier():
+    """The VectorTier of the candidates collection, opened on first use; None unless VECTOR_TIER_ENABLED."""
+    global _vector_tier
+    if not VECTOR_TIER_ENABLED:
+        return None
+    if _vector_tier is None:
+        with _tier_lock:
+            if _vector_tier is None:
+                _vector_tier = VectorTier(VECTOR_TIER_PATH, dtype=VECTOR_TIER_DTYPE, scope_cache_size=VECTOR_TIER_SCOPE_CACHE,
+                                          fetch_versions=candidate_index_versions, verify_interval=VECTOR_TIER_VERIFY_INTERVAL)
+    return _vector_tier
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="reload every chunk from the Milvus candidates collection")
+    args = parser.parse_args()
+
+    vector_tier = get_vector_tier()
+    if vector_tier is None:
+        raise SystemExit("The vector tier is disabled (VECTOR_TIER_ENABLED=false)")
+    if args.rebuild:
+        count = load_from_milvus(vector_tier)
+        print(f"Loaded {count} chunks into {vector_tier.path}")
+
+
+if __name__ == "__main__":
+    main()
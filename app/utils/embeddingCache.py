@@ -0,0 +1,91 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache in a local SQLite file, keyed by
+    (model name, SHA-256 of the whitespace-normalised text).
+
+    Vectors are stored as float32 blobs. Once more than `max_entries` vectors
+    are stored, the least recently used tenth is evicted.
+    """
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, text_hashes: list[str]) -> dict[str, list[float]]:
+        if not text_hashes:
+            return {}
+        found = {}
+        unique_hashes = list(dict.fromkeys(text_hashes))
+        with self._lock:
+            # stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[i:i + 500]
+                placeholders = ", ".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (model, *batch),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(time.time(), model, text_hash) for text_hash in found],
+                )
+        return found
+
+    def put_many(self, model: str, items: dict[str, list[float]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, text_hash, array("f", vector).tobytes(), now) for text_hash, vector in items.items()],
+            )
+            self._writes_since_evict += len(items)
+            if self._writes_since_evict >= max(1, self.max_entries // 100):
+                self._writes_since_evict = 0
+                self._evict()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class OllamaEmbedder:
+    """Sends one /api/embed request per batch of texts."""
+    def __init__(self, model: str, host: str = None):
+        import ollama
+        self.model = model
+        self.host = host
+        self.client = ollama.Client(host=host)
+        self._async_client = None
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            import ollama
+            self._async_client = ollama.AsyncClient(host=self.host)
+        return self._async_client
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        response = self.client.embed(model=self.model, input=texts)
+        return [list(vector) for vector in response.get('embeddings', [])]
+
+    async def aembed(self, texts: list[str]) -> list[list[float]]:
+        response = await self.async_client.embed(model=self.model, input=texts)
+        return [list(vector) for vector in response.get('embeddings', [])]
+
+
+class LocalEmbedder:
+    """
+    Deterministic stand-in for Ollama, used for benchmarking without a model server.
+
+    Tokens are hashed into a fixed number of buckets (feature hashing) and the
+    result is L2 normalised. `latency_ms` simulates the per-request round-trip.
+    """
+    def __init__(self, dim: int = 768, latency_ms: float = 0.0, model: str = "local-hash"):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.model = model
+
+    def _embed_one(self, text: str) -> list[float]:
+        vector = [0.0] * self.dim
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._embed_one(text) for text in texts]
+
+    async def aembed(self, texts: list[str]) -> list[list[float]]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return [self._embed_one(text) for text in texts]
+
+
+class EmbeddingEngine:
+    """
+    Splits texts into batches of `batch_size` and embeds the batches on a bounded
+    thread pool (or at most `max_workers` concurrent requests for the async
+    methods), so the number of round-trips grows with batches, not chunks.
+    When an EmbeddingCache is given, only texts missing from it are embedded.
+    """
+    def __init__(self, embedder, batch_size: int = 32, max_workers: int = 4, cache=None):
+        if batch_size < 1 or max_workers < 1:
+            raise ValueError("batch_size and max_workers must be positive")
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embedding")
+        self._semaphore = None
+
+    @property
+    def model(self) -> str:
+        return self.embedder.model
+
+    def _embed_batch(self, batch: list[str]) -> list[list[float]]:
+        vectors = self.embedder.embed(batch)
+        if len(vectors) != len(batch):
+            raise ValueError(f"Embedder returned {len(vectors)} vectors for {len(batch)} inputs")
+        return vectors
+
+    def _batches(self, texts: list[str]) -> list[list[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _embed_uncached(self, texts: list[str]) -> list[list[float]]:
+        batches = self._batches(texts)
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+        return [vector for vectors in self._executor.map(self._embed_batch, batches) for vector in vectors]
+
+    def _missing(self, text_hashes: list[str], texts: list[str], cached: dict) -> dict[str, str]:
+        missing = {}
+        for text_hash, text in zip(text_hashes, texts):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        return missing
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        text_hashes = [self.cache.text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, text_hashes)
+        missing = self._missing(text_hashes, texts, vectors)
+        if missing:
+            embedded = dict(zip(missing, self._embed_uncached(list(missing.values()))))
+            self.cache.put_many(self.model, embedded)
+            vectors.update(embedded)
+        return [vectors[text_hash] for text_hash in text_hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def _aembed_uncached(self, texts: list[str]) -> list[list[float]]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def embed_batch(batch: list[str]) -> list[list[float]]:
+            async with self._semaphore:
+                vectors = await self.embedder.aembed(batch)
+            if len(vectors) != len(batch):
+                raise ValueError(f"Embedder returned {len(vectors)} vectors for {len(batch)} inputs")
+            return vectors
+
+        results = await asyncio.gather(*(embed_batch(batch) for batch in self._batches(texts)))
+        return [vector for vectors in results for vector in vectors]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        if self.cache is None:
+            return await self._aembed_uncached(texts)
+
+        text_hashes = [self.cache.text_hash(text) for text in texts]
+        vectors = await asyncio.to_thread(self.cache.get_many, self.model, text_hashes)
+        missing = self._missing(text_hashes, texts, vectors)
+        if missing:
+            embedded = dict(zip(missing, await self._aembed_uncached(list(missing.values()))))
+            await asyncio.to_thread(self.cache.put_many, self.model, embedded)
+            vectors.update(embedded)
+        return [vectors[text_hash] for text_hash in text_hashes]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        if self.cache is not None:
+            self.cache.close()
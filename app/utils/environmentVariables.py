@@ -5,15 +5,75 @@ from app.utils.exceptions import EnvVarNotFoundError
 
 load_dotenv()
 
-def get_env_variable(key):
-    variable = os.getenv(key)
+def get_env_variable(key, default=None):
+    variable = os.getenv(key, default)
     if variable is None:
         raise EnvVarNotFoundError(message=f"Environment variable '{key}' not found.", name="EnvVarNotFoundError")
     return variable
 
-MILVUS_DB_HOST = get_env_variable('MILVUS_DB_HOST')
-MILVUS_DB_PORT = get_env_variable('MILVUS_DB_PORT')
+# variables only some features need are checked when that feature is first used
+FEATURE_ENV_VARIABLES = {
+    "milvus": ("MILVUS_DB_HOST", "MILVUS_DB_PORT"),
+    "embedding": ("EMBEDDING_MODEL",),
+    "rag": ("DB_NAME", "GOOGLE_API_KEY"),
+}
+
+def missing_env_variables(feature: str) -> list[str]:
+    return [key for key in FEATURE_ENV_VARIABLES[feature] if not os.getenv(key)]
+
+def require_env_variables(feature: str):
+    missing = missing_env_variables(feature)
+    if missing:
+        raise EnvVarNotFoundError(message=f"Environment variable(s) {', '.join(missing)} needed for {feature} not found.", name="EnvVarNotFoundError")
+
 POSTGRES_DB_URL = get_env_variable('POSTGRES_DB_URL')
-EMBEDDING_MODEL = get_env_variable('EMBEDDING_MODEL')
-DB_NAME = get_env_variable('DB_NAME')
-GOOGLE_API_KEY = get_env_variable('GOOGLE_API_KEY')
\ No newline at end of file
+MILVUS_DB_HOST = os.getenv('MILVUS_DB_HOST')
+MILVUS_DB_PORT = os.getenv('MILVUS_DB_PORT')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL')
+DB_NAME = os.getenv('DB_NAME')
+GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
+
+EMBEDDING_BACKEND = get_env_variable('EMBEDDING_BACKEND', 'ollama')
+EMBEDDING_BATCH_SIZE = int(get_env_variable('EMBEDDING_BATCH_SIZE', '32'))
+EMBEDDING_MAX_WORKERS = int(get_env_variable('EMBEDDING_MAX_WORKERS', '4'))
+MILVUS_MAX_INSERT_BYTES = int(get_env_variable('MILVUS_MAX_INSERT_BYTES', str(32 * 1024 * 1024)))
+PDF_PARSE_WORKERS = int(get_env_variable('PDF_PARSE_WORKERS', '2'))
+PDF_PAGE_BATCH_SIZE = int(get_env_variable('PDF_PAGE_BATCH_SIZE', '8'))
+INGESTION_QUEUE_PATH = get_env_variable('INGESTION_QUEUE_PATH', 'app/data/ingestion_queue.sqlite3')
+INGESTION_WORKERS = int(get_env_variable('INGESTION_WORKERS', '2'))
+INGESTION_MAX_ATTEMPTS = int(get_env_variable('INGESTION_MAX_ATTEMPTS', '3'))
+INGESTION_LEASE_SECONDS = float(get_env_variable('INGESTION_LEASE_SECONDS', '60'))
+EMBEDDING_CACHE_PATH = get_env_variable('EMBEDDING_CACHE_PATH', 'app/data/embedding_cache.sqlite3')
+EMBEDDING_CACHE_MAX_ENTRIES = int(get_env_variable('EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+MAX_UPLOAD_BYTES = int(get_env_variable('MAX_UPLOAD_BYTES', str(64 * 1024 * 1024)))
+# server-side directory imports are disabled unless a root is configured
+BULK_IMPORT_ROOT = get_env_variable('BULK_IMPORT_ROOT', '')
+BULK_IMPORT_MAX_BYTES = int(get_env_variable('BULK_IMPORT_MAX_BYTES', str(1024 * 1024 * 1024)))
+BULK_IMPORT_MAX_EXTRACTED_BYTES = int(get_env_variable('BULK_IMPORT_MAX_EXTRACTED_BYTES', str(4 * 1024 * 1024 * 1024)))
+RAG_CACHE_MAX_ENTRIES = int(get_env_variable('RAG_CACHE_MAX_ENTRIES', '512'))
+RAG_CACHE_TTL_SECONDS = float(get_env_variable('RAG_CACHE_TTL_SECONDS', '3600'))
+RAG_CACHE_MAX_DISTANCE = float(get_env_variable('RAG_CACHE_MAX_DISTANCE', '0.05'))
+RAG_CACHE_SYNC_INTERVAL = float(get_env_variable('RAG_CACHE_SYNC_INTERVAL', '1.0'))
+KEYWORD_INDEX_PATH = get_env_variable('KEYWORD_INDEX_PATH', 'app/data/keyword_index.sqlite3')
+MILVUS_INDEX_CONFIG = get_env_variable('MILVUS_INDEX_CONFIG', '{}')
+RAG_CONTEXT_MAX_TOKENS = int(get_env_variable('RAG_CONTEXT_MAX_TOKENS', '1500'))
+POSTGRES_POOL_SIZE = int(get_env_variable('POSTGRES_POOL_SIZE', '10'))
+POSTGRES_MAX_OVERFLOW = int(get_env_variable('POSTGRES_MAX_OVERFLOW', '20'))
+POSTGRES_POOL_TIMEOUT = float(get_env_variable('POSTGRES_POOL_TIMEOUT', '30'))
+POSTGRES_POOL_RECYCLE = int(get_env_variable('POSTGRES_POOL_RECYCLE', '1800'))
+POSTGRES_POOL_PRE_PING = get_env_variable('POSTGRES_POOL_PRE_PING', 'true').lower() == 'true'
+VECTOR_TIER_ENABLED = get_env_variable('VECTOR_TIER_ENABLED', 'false').lower() == 'true'
+VECTOR_TIER_PATH = get_env_variable('VECTOR_TIER_PATH', 'app/data/vector_tier')
+VECTOR_TIER_DTYPE = get_env_variable('VECTOR_TIER_DTYPE', 'float32')
+VECTOR_TIER_SCOPE_CACHE = int(get_env_variable('VECTOR_TIER_SCOPE_CACHE', '32'))
+VECTOR_TIER_VERIFY_INTERVAL = float(get_env_variable('VECTOR_TIER_VERIFY_INTERVAL', '1.0'))
+OUTBOX_BATCH_SIZE = int(get_env_variable('OUTBOX_BATCH_SIZE', '200'))
+OUTBOX_RETRY_BACKOFF = float(get_env_variable('OUTBOX_RETRY_BACKOFF', '2.0'))
+OUTBOX_MAX_RETRY_DELAY = float(get_env_variable('OUTBOX_MAX_RETRY_DELAY', '900'))
+OUTBOX_POLL_INTERVAL = float(get_env_variable('OUTBOX_POLL_INTERVAL', '1.0'))
+RERANK_CANDIDATES = int(get_env_variable('RERANK_CANDIDATES', '20'))
+RERANK_TOP_N = int(get_env_variable('RERANK_TOP_N', '5'))
+RERANK_BATCH_SIZE = int(get_env_variable('RERANK_BATCH_SIZE', '5'))
+RERANK_MAX_CONCURRENCY = int(get_env_variable('RERANK_MAX_CONCURRENCY', '4'))
+RERANK_TOKEN_BUDGET = int(get_env_variable('RERANK_TOKEN_BUDGET', '8000'))
+RERANK_TIMEOUT_SECONDS = float(get_env_variable('RERANK_TIMEOUT_SECONDS', '20'))
@@ -25,3 +25,15 @@ class PostgresTransactionFailure(BaseError):
 
 class FileUploadError(BaseError):
     pass
+
+class FileTooLargeError(BaseError):
+    pass
+
+class InvalidCursorError(BaseError):
+    pass
+
+class MilvusIndexConfigError(BaseError):
+    pass
+
+class VectorTierConfigError(BaseError):
+    pass
@@ -0,0 +1,34 @@
+import asyncio
+import os
+from fastapi import UploadFile
+from app.utils.exceptions import FileUploadError, FileTooLargeError
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def save_upload(file: UploadFile, file_path: str, max_bytes: int = None, chunk_size: int = UPLOAD_CHUNK_SIZE) -> int:
+    """
+    Streams an upload to `file_path` in fixed-size chunks, enforcing `max_bytes`
+    as the data arrives. The file is written to a temporary path and moved into
+    place only once complete, so a rejected upload never replaces an existing file.
+    """
+    tmp_path = f"{file_path}.part"
+    size = 0
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        while chunk := await file.read(chunk_size):
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise FileTooLargeError(name="FileTooLargeError", message=f"File exceeds the {max_bytes} byte upload limit")
+            await asyncio.to_thread(f.write, chunk)
+    except Exception:
+        f.close()
+        os.remove(tmp_path)
+        raise
+    f.close()
+
+    if size == 0:
+        os.remove(tmp_path)
+        raise FileUploadError(name="FileUploadError", message="File is empty or not provided")
+
+    os.replace(tmp_path, file_path)
+    return size
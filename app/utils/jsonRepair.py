@@ -0,0 +1,85 @@
+import ast
+import json
+import re
+
+FENCE = re.compile(r"```[a-zA-Z]*")
+TRAILING_COMMA = re.compile(r",\s*([\]}])")
+
+
+def _unwrap(value) -> list[dict]:
+    if isinstance(value, dict) and isinstance(value.get("data"), list):
+        value = value["data"]
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [item for item in value if isinstance(item, dict)]
+
+
+def _loads(text: str):
+    """Parses JSON or a Python literal; raises ValueError for anything else."""
+    text = TRAILING_COMMA.sub(r"\1", text)
+    try:
+        return json.loads(text)
+    except (ValueError, RecursionError):
+        pass
+    try:
+        # single quotes, True/None: a Python literal rather than JSON
+        return ast.literal_eval(text)
+    except (SyntaxError, TypeError, MemoryError, RecursionError) as e:
+        raise ValueError(f"Not a JSON or Python literal: {e}") from e
+
+
+def _salvage(text: str, key: str) -> list[dict]:
+    """Every complete object containing `key`, outermost first; the rest of the text may be cut off."""
+    objects, starts, in_string, escaped = [], [], False, False
+    for position, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            starts.append(position)
+        elif char == "}" and starts:
+            start = starts.pop()
+            try:
+                value = _loads(text[start:position + 1])
+            except ValueError:
+                continue
+            if isinstance(value, dict) and key in value:
+                # an object nested in one already kept is part of it
+                objects = [obj for obj in objects if obj[0] < start]
+                objects.append((start, value))
+    return [value for _, value in objects]
+
+
+def repair_json_items(text: str, key: str = "candidate_id") -> tuple[list[dict], bool]:
+    """
+    Extracts the list of objects from LLM output that should have been JSON.
+    Markdown fences and surrounding prose are dropped, trailing commas removed,
+    a {"data": [...]} wrapper or a lone object unwrapped, and truncated output
+    is cut back to its complete objects. Returns the objects and whether any
+    repair was needed.
+    """
+    try:
+        return _unwrap(json.loads(text)), False
+    except (ValueError, TypeError, RecursionError):
+        pass
+
+    cleaned = FENCE.sub("", text)
+    starts = [index for index in (cleaned.find("["), cleaned.find("{")) if index >= 0]
+    if not starts:
+        return [], True
+    start = min(starts)
+    end = max(cleaned.rfind("]"), cleaned.rfind("}"))
+    if end > start:
+        try:
+            return _unwrap(_loads(cleaned[start:end + 1])), True
+        except ValueError:
+            pass
+    return _salvage(cleaned[start:], key), True
@@ -0,0 +1,54 @@
+import json
+
+
+class JSONArrayStreamParser:
+    """
+    Incrementally parses a JSON array of objects as text arrives and returns
+    each top-level object as soon as its closing brace is seen. Anything before
+    the opening bracket (such as a markdown fence) is ignored.
+    """
+    def __init__(self):
+        self._buffer = []
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, text: str) -> list:
+        objects = []
+        for char in text:
+            if self._finished:
+                break
+            if not self._started:
+                self._started = char == "["
+                continue
+
+            if self._depth > 0:
+                self._buffer.append(char)
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        objects.append(json.loads("".join(self._buffer)))
+                        self._buffer = []
+            elif char == "{":
+                self._depth = 1
+                self._buffer = [char]
+            elif char == "]":
+                self._finished = True
+        return objects
@@ -0,0 +1,95 @@
+import contextvars
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a Postgres connection from the pool",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts",
+    "Checkouts that gave up after pool_timeout because the pool was exhausted",
+)
+DB_POOL_CHECKED_OUT = Gauge("db_pool_connections_checked_out", "Postgres connections currently checked out")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Postgres connections open beyond pool_size")
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds",
+    "Latency of one hot-path stage (PDF parse, embedding, Milvus, Postgres, RAG nodes)",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+STAGE_ERRORS = Counter("stage_errors", "Stage calls that raised", ["stage"])
+CHUNKS = Counter("chunks", "Resume chunks handled per stage", ["stage"])
+TOKENS = Counter("rag_tokens", "RAG prompt tokens by kind", ["kind"])
+RERANK_BATCHES = Counter("rag_rerank_batches", "LLM re-ranking batches by outcome", ["result"])
+OUTBOX_OPERATIONS = Counter("outbox_operations", "Vector outbox entries by collection, operation and result", ["collection", "operation", "result"])
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the response headers are sent",
+    ["method", "route", "status"],
+)
+
+# per-request stage breakdown, only collected when the request opted in
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def start_request_timing() -> dict:
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def _record(stage: str, seconds: float):
+    STAGE_LATENCY.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        total, count = timings.get(stage, (0.0, 0))
+        timings[stage] = (total + seconds, count + 1)
+
+
+@contextmanager
+def track(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        _record(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """Decorator recording the latency and errors of a sync or async function under `stage`."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with track(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(timings: dict) -> str:
+    return ", ".join(
+        f'{stage};dur={total * 1000:.1f};desc="{count} call{"s" if count != 1 else ""}"'
+        for stage, (total, count) in timings.items()
+    )
@@ -1,23 +1,89 @@
-import ollama
-from app.utils.environmentVariables import EMBEDDING_MODEL
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from fastapi import File
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from app.utils.environmentVariables import require_env_variables, EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WORKERS, PDF_PARSE_WORKERS, PDF_PAGE_BATCH_SIZE, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+from app.utils.embeddingCache import EmbeddingCache
+from app.utils.embeddingEngine import EmbeddingEngine, OllamaEmbedder, LocalEmbedder
+from app.utils.metrics import timed, track, CHUNKS
 
+_engine = None
+_pdf_executor = None
+
+def get_embedding_engine() -> EmbeddingEngine:
+    global _engine
+    if _engine is None:
+        if EMBEDDING_BACKEND == "local":
+            embedder = LocalEmbedder()
+        else:
+            require_env_variables("embedding")
+            embedder = OllamaEmbedder(model=EMBEDDING_MODEL)
+        cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES) if EMBEDDING_CACHE_MAX_ENTRIES > 0 else None
+        _engine = EmbeddingEngine(embedder, batch_size=EMBEDDING_BATCH_SIZE, max_workers=EMBEDDING_MAX_WORKERS, cache=cache)
+    return _engine
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS)
+    return _pdf_executor
+
+def shutdown_embedding():
+    global _engine, _pdf_executor
+    if _engine is not None:
+        _engine.shutdown()
+        _engine = None
+    if _pdf_executor is not None:
+        _pdf_executor.shutdown(wait=True)
+        _pdf_executor = None
+
+@timed("embed_query")
 def get_embedding(prompt: str) -> list:
-    embedding_model=EMBEDDING_MODEL
-    response = ollama.embeddings(model=embedding_model,prompt=prompt)
-    return response.get('embedding', [])
-
-def get_pdf_embedding(file_path: str) -> list:
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
-    if not documents:
-        return []
-    
+    return get_embedding_engine().embed_query(prompt)
+
+@timed("embed_documents")
+def get_embeddings(texts: list[str]) -> list:
+    CHUNKS.labels("embedded").inc(len(texts))
+    return get_embedding_engine().embed_documents(texts)
+
+@timed("embed_query")
+async def aget_embedding(prompt: str) -> list:
+    return await get_embedding_engine().aembed_query(prompt)
+
+@timed("embed_documents")
+async def aget_embeddings(texts: list[str]) -> list:
+    CHUNKS.labels("embedded").inc(len(texts))
+    return await get_embedding_engine().aembed_documents(texts)
+
+def load_pdf_page_chunks(file_path: str, start: int = 0, stop: int = None) -> tuple[list, int]:
+    """
+    Chunks of pages [start, stop) and the document's page count. Pages are
+    extracted and split one at a time, exactly like PyPDFLoader's page mode.
+    """
+    from pypdf import PdfReader
+    from langchain_core.documents import Document
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    reader = PdfReader(file_path)
     textSpliter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = textSpliter.split_documents(documents)
+    page_count = len(reader.pages)
+    chunks = []
+    for page_number in range(start, page_count if stop is None else min(stop, page_count)):
+        text = reader.pages[page_number].extract_text(extraction_mode="plain").strip()
+        chunks.extend(textSpliter.split_documents([Document(page_content=text, metadata={"source": file_path, "page": page_number})]))
+    return chunks, page_count
 
-    embeddings = [get_embedding(chunk.page_content) for chunk in chunks]
+def load_pdf_chunks(file_path: str) -> list:
+    return load_pdf_page_chunks(file_path)[0]
 
-    return embeddings, chunks
\ No newline at end of file
+async def aiter_pdf_page_chunks(file_path: str, pages_per_batch: int = PDF_PAGE_BATCH_SIZE):
+    """
+    Yields the chunks of `pages_per_batch` pages at a time. Each batch is parsed
+    in a worker process, so the event loop stays free and only one batch of a
+    large PDF is held in memory.
+    """
+    loop = asyncio.get_running_loop()
+    start, page_count = 0, None
+    while page_count is None or start < page_count:
+        with track("pdf_parse"):
+            chunks, page_count = await loop.run_in_executor(get_pdf_executor(), load_pdf_page_chunks, file_path, start, start + pages_per_batch)
+        CHUNKS.labels("parsed").inc(len(chunks))
+        yield chunks
+        start += pages_per_batch